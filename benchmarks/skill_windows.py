@@ -0,0 +1,94 @@
+"""Benchmark reversed against checkpointed skill windows.
+
+Rates a synthetic league once with finite windows that reverse the matches
+leaving them, and once per checkpoint interval with windows rebuilt at every
+interval. Each run is timed and compared against the exact windowed rating,
+which is a checkpointed window rebuilt before every match.
+
+    python benchmarks/skill_windows.py --rows 5000 --window-days 90
+"""
+
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from sportsfeatures.entity_type import EntityType
+from sportsfeatures.identifier import Identifier
+from sportsfeatures.skill_process import skill_block
+
+_DT_COLUMN = "dt"
+
+
+def _league(rows: int, teams: int, seed: int) -> tuple[pd.DataFrame, list[Identifier]]:
+    rng = np.random.default_rng(seed)
+    home = rng.integers(0, teams, rows)
+    away = (home + rng.integers(1, teams, rows)) % teams
+    strength = rng.normal(0.0, 5.0, teams)
+    df = pd.DataFrame(
+        {
+            _DT_COLUMN: pd.Timestamp("2010-01-01")
+            + pd.to_timedelta(np.sort(rng.integers(0, rows * 4, rows)), unit="h"),
+            "teams/0/id": home.astype(str),
+            "teams/0/points": rng.poisson(np.exp(strength[home] / 10.0) * 20.0),
+            "teams/1/id": away.astype(str),
+            "teams/1/points": rng.poisson(np.exp(strength[away] / 10.0) * 20.0),
+        }
+    )
+    identifiers = [
+        Identifier(
+            EntityType.TEAM,
+            f"teams/{x}/id",
+            [],
+            f"teams/{x}",
+            points_column=f"teams/{x}/points",
+        )
+        for x in range(2)
+    ]
+    return df, identifiers
+
+
+def _run(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    window: datetime.timedelta,
+    checkpoint_interval: datetime.timedelta | None,
+) -> tuple[float, pd.Series]:
+    start = time.perf_counter()
+    block = skill_block(
+        df,
+        _DT_COLUMN,
+        identifiers,
+        [window],
+        checkpoint_interval=checkpoint_interval,
+    )
+    return time.perf_counter() - start, block[f"teams/0_skill_window{window.days}_mu"]
+
+
+def main() -> None:
+    """Print the time and error of each way of moving the windows along."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--window-days", type=int, default=90)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[1, 7, 30])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df, identifiers = _league(args.rows, args.teams, args.seed)
+    window = datetime.timedelta(days=args.window_days)
+    _, exact = _run(df, identifiers, window, datetime.timedelta(microseconds=1))
+    runs = [("reverse", None)] + [
+        (f"checkpoint {x}d", datetime.timedelta(days=x)) for x in args.intervals
+    ]
+    print(f"{'mode':<16}{'seconds':>10}{'rows/s':>12}{'mean |mu error|':>18}")
+    for name, interval in runs:
+        seconds, mu = _run(df, identifiers, window, interval)
+        error = float((mu - exact).abs().mean())
+        print(f"{name:<16}{seconds:>10.2f}{len(df) / seconds:>12.0f}{error:>18.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,10 @@ import datetime
 import functools
 
 import pandas as pd
-from sklearn.metrics import mean_squared_error  # type: ignore
 from tqdm import tqdm
 
 from .columns import DELIMITER
+from .feature_state import FeatureState
 from .identifier import Identifier
 from .null_check import is_null
 
@@ -25,27 +25,28 @@ def bet_process(
     identifiers: list[Identifier],
     dt_column: str,
     use_bets_features: bool,
+    state: FeatureState | None = None,
 ) -> pd.DataFrame:
     """Process bets."""
     # pylint: disable=too-many-locals,too-many-branches,too-many-statements
     tqdm.pandas(desc="Bets Features")
-    bookie_odds: list[float] = []
-    wins: list[float] = []
+    # The price efficiency is the mean squared error of the implied odds against
+    # the wins, kept as a running sum and count over the earlier rows.
+    squared_error = 0.0 if state is None else state.bookie_squared_error
+    bookie_count = 0 if state is None else state.bookie_count
 
     def apply_bets(
         row: pd.Series, identifiers: list[Identifier], dt_column: str
     ) -> pd.Series:
-        nonlocal bookie_odds
-        nonlocal wins
+        nonlocal squared_error
+        nonlocal bookie_count
 
         try:
             game_dt = pd.Timestamp(row[dt_column]).tz_localize("UTC")
         except TypeError:
             game_dt = pd.Timestamp(row[dt_column]).tz_convert("UTC")
 
-        price_efficiency = (
-            None if not bookie_odds else mean_squared_error(bookie_odds, wins)
-        )
+        price_efficiency = None if not bookie_count else squared_error / bookie_count
         local_bookie_odds = []
         local_points = []
         for identifier in identifiers:
@@ -214,12 +215,13 @@ def bet_process(
             local_points.append(points)
 
         if local_points:
-            bookie_odds.extend(local_bookie_odds)
-            wins.extend([float(x == max(local_points)) for x in local_points])
+            for odds, point in zip(local_bookie_odds, local_points):
+                squared_error += (odds - float(point == max(local_points))) ** 2
+                bookie_count += 1
 
         return row
 
-    return df.progress_apply(
+    df = df.progress_apply(
         functools.partial(
             apply_bets,
             identifiers=identifiers,
@@ -227,3 +229,7 @@ def bet_process(
         ),
         axis=1,
     )  # type: ignore
+    if state is not None:
+        state.bookie_squared_error = squared_error
+        state.bookie_count = bookie_count
+    return df
@@ -0,0 +1,13 @@
+"""Helpers for working with blocks of new columns."""
+
+import pandas as pd
+
+
+def append_block(df: pd.DataFrame, block: pd.DataFrame) -> pd.DataFrame:
+    """Append a block of columns to the dataframe, replacing any it overlaps."""
+    block_columns = set(block.columns.values.tolist())
+    df = pd.concat(
+        [df.drop(columns=[x for x in df.columns if x in block_columns]), block],
+        axis=1,
+    )
+    return df[sorted(df.columns.values.tolist())]
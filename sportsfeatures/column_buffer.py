@@ -0,0 +1,62 @@
+"""Preallocated typed columns that the row loops write their features into."""
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+
+class ColumnBuffer:
+    """A set of typed NumPy columns filled in one cell at a time.
+
+    Float columns start out as NaN. Integer columns keep a mask of the cells
+    written to, and become float64 with NaN gaps if any cell is left unset.
+    """
+
+    def __init__(self, index: pd.Index):
+        self._index = index
+        self._columns: dict[str, npt.NDArray] = {}
+        self._masks: dict[str, npt.NDArray[np.bool_]] = {}
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._columns
+
+    def set(
+        self,
+        column: str,
+        row: int,
+        value: float,
+        dtype: npt.DTypeLike = np.float64,
+    ) -> None:
+        """Write a value, allocating the column with the dtype on first use."""
+        array = self._columns.get(column)
+        if array is None:
+            dtype = np.dtype(dtype)
+            if dtype.kind in {"i", "u"}:
+                array = np.zeros(len(self._index), dtype=dtype)
+                self._masks[column] = np.zeros(len(self._index), dtype=np.bool_)
+            else:
+                array = np.full(len(self._index), np.nan, dtype=dtype)
+            self._columns[column] = array
+        mask = self._masks.get(column)
+        if mask is not None:
+            if value != value:  # pylint: disable=comparison-with-itself
+                # A missing value is left out of the mask of an integer column.
+                return
+            mask[row] = True
+        array[row] = value
+
+    def column(self, column: str) -> npt.NDArray:
+        """The finished values of a column."""
+        array = self._columns[column]
+        mask = self._masks.get(column)
+        if mask is None or mask.all():
+            return array
+        values = array.astype(np.float64)
+        values[~mask] = np.nan
+        return values
+
+    def to_frame(self) -> pd.DataFrame:
+        """Build the block of columns in sorted order."""
+        return pd.DataFrame(
+            {x: self.column(x) for x in sorted(self._columns)}, index=self._index
+        )
@@ -7,26 +7,43 @@ import geopy.distance  # type: ignore
 import pandas as pd
 from tqdm import tqdm
 
+from .block import append_block
+from .column_buffer import ColumnBuffer
 from .columns import DELIMITER
 from .entity_type import EntityType
+from .feature_state import FeatureState
 from .identifier import Identifier
+from .identifier_plan import compile_plans, iterate_rows
 
 
-def distance_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Process a dataframe for offensive efficiency."""
-    last_identifier_locations: dict[str, tuple[float, float]] = {}
+def distance_block(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Compute the block of distance columns."""
+    if state is None:
+        state = FeatureState()
     team_identifiers = [x for x in identifiers if x.entity_type == EntityType.TEAM]
     player_identifiers = [x for x in identifiers if x.entity_type == EntityType.PLAYER]
     venue_identifiers = [x for x in identifiers if x.entity_type == EntityType.VENUE]
-    df_dict: dict[str, list[float | None]] = {}
-    df_cols = df.columns.values.tolist()
+    columns = ColumnBuffer(df.index)
+    identifier_plans = compile_plans(team_identifiers + player_identifiers)
+    identifier_codes = state.entities.identifier_codes(
+        df, team_identifiers + player_identifiers
+    )
+    last_identifier_locations = state.entities.grow(
+        state.last_identifier_locations, None
+    )
+    row_columns: list[str | None] = []
+    for identifier in identifiers:
+        row_columns.extend(
+            [identifier.column, identifier.latitude_column, identifier.longitude_column]
+        )
 
-    written_columns = set()
-    for row in tqdm(
-        df.itertuples(name=None), desc="Distance Processing", total=len(df)
+    for position, (index, row_dict) in enumerate(
+        tqdm(iterate_rows(df, row_columns), desc="Distance Processing", total=len(df))
     ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
-
         current_location = None
         for venue_identifier in venue_identifiers:
             if venue_identifier.latitude_column is None:
@@ -47,42 +64,29 @@ def distance_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.Data
         if current_location is None:
             continue
 
-        for identifier in team_identifiers + player_identifiers:
-            if identifier.column not in row_dict:
-                continue
-            identifier_id = row_dict[identifier.column]
-            if identifier_id is None:
+        for plan, codes in zip(identifier_plans, identifier_codes):
+            if codes is None or codes[position] < 0:
                 continue
-            if not isinstance(identifier_id, str):
+            if not isinstance(row_dict[plan.column], str):
                 continue
-            key = "_".join([str(identifier.entity_type), identifier_id])
-            last_location = last_identifier_locations.get(key)
+            key = codes[position]
+            last_location = last_identifier_locations[key]
             if last_location is not None:
-                latitude_diff_column = DELIMITER.join(
-                    [identifier.column_prefix, "latitudediff"]
+                columns.set(
+                    plan.output_column("latitudediff"),
+                    index,
+                    abs(last_location[0] - current_location[0]),
                 )
-                if latitude_diff_column not in df_dict:
-                    df_dict[latitude_diff_column] = [None for _ in range(len(df))]
-                written_columns.add(latitude_diff_column)
-                df_dict[latitude_diff_column][row[0]] = abs(
-                    last_location[0] - current_location[0]
+                columns.set(
+                    plan.output_column("longitudediff"),
+                    index,
+                    abs(last_location[1] - current_location[1]),
                 )
-                longitude_diff_column = DELIMITER.join(
-                    [identifier.column_prefix, "longitudediff"]
+                columns.set(
+                    plan.output_column("distance"),
+                    index,
+                    geopy.distance.geodesic(last_location, current_location).km,
                 )
-                if longitude_diff_column not in df_dict:
-                    df_dict[longitude_diff_column] = [None for _ in range(len(df))]
-                written_columns.add(longitude_diff_column)
-                df_dict[longitude_diff_column][row[0]] = abs(
-                    last_location[1] - current_location[1]
-                )
-                distance_column = DELIMITER.join([identifier.column_prefix, "distance"])
-                if distance_column not in df_dict:
-                    df_dict[distance_column] = [None for _ in range(len(df))]
-                df_dict[distance_column][row[0]] = geopy.distance.geodesic(
-                    last_location, current_location
-                ).km
-                written_columns.add(distance_column)
             last_identifier_locations[key] = current_location
 
         players_latitudes: dict[str, list[float]] = {}
@@ -112,28 +116,34 @@ def distance_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.Data
             for team_identifier in team_identifiers:
                 if not k.startswith(team_identifier.column_prefix):
                     continue
-                latitude_col = DELIMITER.join(
-                    [team_identifier.column_prefix, "centerofgravity", "latitude"]
+                columns.set(
+                    DELIMITER.join(
+                        [team_identifier.column_prefix, "centerofgravity", "latitude"]
+                    ),
+                    index,
+                    statistics.mean(v),
                 )
-                if latitude_col not in df_dict:
-                    df_dict[latitude_col] = [None for _ in range(len(df))]
-                df_dict[latitude_col][row[0]] = statistics.mean(v)
-                written_columns.add(latitude_col)
                 break
         for k, v in players_longitudes.items():
             for team_identifier in team_identifiers:
                 if not k.startswith(team_identifier.column_prefix):
                     continue
-                longitude_col = DELIMITER.join(
-                    [team_identifier.column_prefix, "centerofgravity", "longitude"]
+                columns.set(
+                    DELIMITER.join(
+                        [team_identifier.column_prefix, "centerofgravity", "longitude"]
+                    ),
+                    index,
+                    statistics.mean(v),
                 )
-                if longitude_col not in df_dict:
-                    df_dict[longitude_col] = [None for _ in range(len(df))]
-                df_dict[longitude_col][row[0]] = statistics.mean(v)
-                written_columns.add(longitude_col)
                 break
 
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
+    return columns.to_frame()
+
 
-    return df[sorted(df.columns.values.tolist())]
+def distance_process(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Process a dataframe for offensive efficiency."""
+    return append_block(df, distance_block(df, identifiers, state=state))
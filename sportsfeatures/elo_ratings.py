@@ -0,0 +1,77 @@
+"""An array backed store of elo ratings."""
+
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from .rating_model import RatingModel, pairwise_results
+
+
+class EloRatings(RatingModel):
+    """Rates the entities with elo, a team being rated as the mean of its members.
+
+    Each team plays every other team of a match, and every member of a team
+    moves by the change in the rating of the team. Elo keeps no uncertainty, so
+    the sigma of every entity stays at zero.
+    """
+
+    def __init__(self, mu: float = 1500.0, k: float = 32.0, scale: float = 400.0):
+        super().__init__(mu, 0.0)
+        self.k = k
+        self.scale = scale
+
+    def parameters(self) -> dict[str, Any]:
+        """The keyword arguments that build the same model again."""
+        return {"mu": self.mu, "k": self.k, "scale": self.scale}
+
+    def _expected(
+        self, teams: list[list[int]]
+    ) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.intp], npt.NDArray[np.float64]]:
+        # The codes and teams of the members, and the expected result of each
+        # team against each other team.
+        codes = np.concatenate([np.asarray(x, dtype=np.intp) for x in teams])
+        sizes = np.asarray([len(x) for x in teams])
+        sides = np.repeat(np.arange(len(teams)), sizes)
+        team_mus = np.bincount(sides, weights=self.mus[codes]) / sizes
+        expected = 1.0 / (
+            1.0 + 10.0 ** ((team_mus[None, :] - team_mus[:, None]) / self.scale)
+        )
+        return codes, sides, expected
+
+    def predict_win(self, teams: list[list[int]]) -> list[float]:
+        """Predict the probability of each team of a match winning it."""
+        _, _, expected = self._expected(teams)
+        # Leave out the half that each team scores against itself.
+        wins = expected.sum(axis=1) - 0.5
+        return (wins / wins.sum()).tolist()
+
+    def _team_ratings(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        count: int,
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """The mean rating of each team, which has no spread."""
+        sizes = np.bincount(groups, minlength=count)
+        team_mus = np.bincount(groups, weights=mus, minlength=count) / sizes
+        return team_mus, np.zeros(count)
+
+    def _pairwise_wins(
+        self,
+        first_mus: npt.NDArray[np.float64],
+        first_spreads: npt.NDArray[np.float64],
+        second_mus: npt.NDArray[np.float64],
+        second_spreads: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        """The expected result of each first team against its second team."""
+        return 1.0 / (1.0 + 10.0 ** ((second_mus - first_mus) / self.scale))
+
+    def rate(self, teams: list[list[int]], scores: list[float] | None) -> None:
+        """Update the ratings of the teams of a match with its result."""
+        codes, sides, expected = self._expected(teams)
+        results = pairwise_results(scores, len(teams))
+        np.fill_diagonal(results, 0.5)
+        changes = self.k * (results - expected).sum(axis=1) / (len(teams) - 1)
+        np.add.at(self.mus, codes, changes[sides])
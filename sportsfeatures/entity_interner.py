@@ -0,0 +1,72 @@
+"""Interning of entity identifiers into dense integer codes."""
+
+from typing import Any, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .columns import DELIMITER
+from .identifier import Identifier
+
+_T = TypeVar("_T")
+
+
+class EntityInterner:
+    """Maps each entity type and identifier pair to a dense int32 code.
+
+    The codes index the per entity state of the stages, and stay stable for as
+    long as the interner is kept, so they can be carried across incremental runs.
+    """
+
+    def __init__(self) -> None:
+        self._codes: dict[str, dict[Any, int]] = {}
+        self.keys: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def codes(self, entity_type: str, values: pd.Series) -> npt.NDArray[np.int32]:
+        """Intern the values of an identifier column, with -1 for a missing id."""
+        codes = self._codes.setdefault(entity_type, {})
+        for value in pd.unique(values.dropna()):
+            if value not in codes:
+                codes[value] = len(self.keys)
+                self.keys.append(DELIMITER.join([entity_type, str(value)]))
+        return values.map(codes).fillna(-1).to_numpy(dtype=np.int32)
+
+    def code(self, entity_type: str, value: Any) -> int:
+        """Intern a single identifier value."""
+        codes = self._codes.setdefault(entity_type, {})
+        code = codes.get(value)
+        if code is None:
+            code = len(self.keys)
+            codes[value] = code
+            self.keys.append(DELIMITER.join([entity_type, str(value)]))
+        return code
+
+    def identifier_codes(
+        self, df: pd.DataFrame, identifiers: list[Identifier]
+    ) -> list[npt.NDArray[np.int32] | None]:
+        """Intern the identifier columns, with None where a column is absent."""
+        return [
+            self.codes(x.entity_type, df[x.column]) if x.column in df.columns else None
+            for x in identifiers
+        ]
+
+    def snapshot(self) -> dict[str, Any]:
+        """The codes of every interned identifier."""
+        return {
+            "codes": {x: dict(y) for x, y in self._codes.items()},
+            "keys": list(self.keys),
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        """Take over the codes of a snapshot."""
+        self._codes = {x: dict(y) for x, y in snapshot["codes"].items()}
+        self.keys = list(snapshot["keys"])
+
+    def grow(self, values: list[_T], fill: _T) -> list[_T]:
+        """Extend a list of per entity state to cover every interned entity."""
+        values.extend(fill for _ in range(len(self.keys) - len(values)))
+        return values
@@ -0,0 +1,16 @@
+"""The rows of entities added to the exponentially weighted state."""
+
+import dataclasses
+
+import numpy as np
+import numpy.typing as npt
+
+
+@dataclasses.dataclass
+class EwmRows:
+    """The entity code, time in seconds and column values of each row."""
+
+    codes: npt.NDArray[np.int64]
+    dts: npt.NDArray[np.float64]
+    values: npt.NDArray[np.float64]
+    columns: list[str]
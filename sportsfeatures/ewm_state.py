@@ -0,0 +1,126 @@
+"""Running exponentially weighted statistics of each entity."""
+
+# pylint: disable=too-few-public-methods
+import datetime
+
+import numpy as np
+import numpy.typing as npt
+
+from .ewm_rows import EwmRows
+
+_WEIGHTS = 0
+_VALUES = 1
+_SQUARES = 2
+_SQUARED_WEIGHTS = 3
+
+
+class EwmState:
+    """The decayed sums behind the exponentially weighted mean and variance.
+
+    Every entity keeps a weight sum, a weighted value sum, a weighted square sum
+    and a squared weight sum per column and half-life, along with the time of
+    its last row. A new row only decays and adds to these, so the state is a
+    constant size per entity and column however long its history grows.
+    """
+
+    def __init__(self) -> None:
+        self.columns: list[str] = []
+        self.halflives: list[datetime.timedelta] = []
+        self.last_dts = np.zeros(0, dtype=np.float64)
+        self.sums = np.zeros((4, 0, 0, 0), dtype=np.float64)
+
+    def _resize(
+        self,
+        entities: int,
+        columns: list[str],
+        halflives: list[datetime.timedelta],
+    ) -> npt.NDArray[np.intp]:
+        if halflives != self.halflives:
+            self.halflives = list(halflives)
+            self.columns = []
+            self.last_dts = np.zeros(0, dtype=np.float64)
+            self.sums = np.zeros((4, 0, 0, len(halflives)), dtype=np.float64)
+        self.columns.extend(x for x in columns if x not in set(self.columns))
+        entities = max(entities, len(self.last_dts))
+        if self.sums.shape[1:3] != (entities, len(self.columns)):
+            sums = np.zeros(
+                (4, entities, len(self.columns), len(halflives)), dtype=np.float64
+            )
+            sums[:, : self.sums.shape[1], : self.sums.shape[2]] = self.sums
+            self.sums = sums
+            last_dts = np.full(entities, np.nan, dtype=np.float64)
+            last_dts[: len(self.last_dts)] = self.last_dts
+            self.last_dts = last_dts
+        positions = {x: count for count, x in enumerate(self.columns)}
+        return np.array([positions[x] for x in columns], dtype=np.intp)
+
+    def update(
+        self, rows: EwmRows, halflives: list[datetime.timedelta]
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """Add rows to the state, returning the mean and variance before each.
+
+        The rows of an entity must be in time order. The returned arrays are
+        shaped rows by columns by half-lives.
+        """
+        column_positions = self._resize(
+            int(rows.codes.max(initial=-1)) + 1, rows.columns, halflives
+        )
+        halflife_seconds = np.array([x.total_seconds() for x in halflives])
+        shape = (len(rows.codes), len(rows.columns), len(halflives))
+        means = np.full(shape, np.nan)
+        variances = np.full(shape, np.nan)
+        observed = ~np.isnan(rows.values)
+        values = np.where(observed, rows.values, 0.0)
+        for step in _steps(rows.codes):
+            entities = rows.codes[step]
+            sums = self.sums[:, entities][:, :, column_positions]
+            means[step], variances[step] = _moments(sums)
+            elapsed = np.nan_to_num(rows.dts[step] - self.last_dts[entities])
+            decay = np.power(0.5, elapsed[:, None] / halflife_seconds[None, :])
+            _add(sums, decay[:, None, :], observed[step], values[step])
+            self.sums[:, entities[:, None], column_positions[None, :]] = sums
+            self.last_dts[entities] = rows.dts[step]
+        return means, variances
+
+
+def _steps(codes: npt.NDArray[np.int64]) -> list[npt.NDArray[np.intp]]:
+    # The nth row of every entity for each n, so stepping through them still
+    # visits each entity in time order.
+    order = np.argsort(codes, kind="stable")
+    starts = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1]
+    steps = np.arange(len(codes)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(codes)])
+    )
+    step_rows = order[np.argsort(steps, kind="stable")]
+    return np.split(step_rows, np.cumsum(np.bincount(steps))[:-1])
+
+
+def _moments(
+    sums: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    # The weighted mean and unbiased weighted variance of the sums.
+    weights = sums[_WEIGHTS]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums[_VALUES] / weights
+        variance = np.maximum(sums[_SQUARES] / weights - mean * mean, 0.0)
+        debias = weights * weights - sums[_SQUARED_WEIGHTS]
+        variance = variance * weights * weights / debias
+    return (
+        np.where(weights > 0.0, mean, np.nan),
+        np.where(debias > 0.0, variance, np.nan),
+    )
+
+
+def _add(
+    sums: npt.NDArray[np.float64],
+    decay: npt.NDArray[np.float64],
+    observed: npt.NDArray[np.bool_],
+    values: npt.NDArray[np.float64],
+) -> None:
+    # Decay the sums and add a row to them in place.
+    row_observed = observed[:, :, None]
+    row_values = values[:, :, None]
+    sums[_WEIGHTS] = sums[_WEIGHTS] * decay + row_observed
+    sums[_VALUES] = sums[_VALUES] * decay + row_values
+    sums[_SQUARES] = sums[_SQUARES] * decay + row_values * row_values
+    sums[_SQUARED_WEIGHTS] = sums[_SQUARED_WEIGHTS] * decay * decay + row_observed
@@ -0,0 +1,258 @@
+"""Running all-time statistics of each entity."""
+
+# pylint: disable=too-few-public-methods
+import bisect
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+_POWERS = 5
+_FLAT_SPREAD = 1e-14
+
+
+def _median(order: list[float]) -> float:
+    if not order:
+        return np.nan
+    middle = len(order) // 2
+    if len(order) % 2:
+        return order[middle]
+    return (order[middle - 1] + order[middle]) / 2.0
+
+
+class ExpandingState:
+    """The running aggregates behind the all-time window features.
+
+    Every entity keeps the count and the sums of the first four powers of its
+    values less its first value, its minimum and maximum, its values in sorted
+    order and the rank of its latest value per column, along with the number of
+    its rows. A new row only adds to these, so an incremental run never rescans
+    the history of an entity, while matching the expanding window aggregations
+    of pandas.
+    """
+
+    def __init__(self) -> None:
+        self.columns: list[str] = []
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.shifts = np.zeros((0, 0), dtype=np.float64)
+        self.sums = np.zeros((_POWERS, 0, 0), dtype=np.float64)
+        self.extremes = np.zeros((2, 0, 0), dtype=np.float64)
+        self.orders: dict[tuple[int, str], list[float]] = {}
+        self.ranks: dict[tuple[int, str], float] = {}
+
+    def _resize(self, entities: int, columns: list[str]) -> npt.NDArray[np.intp]:
+        self.columns.extend(x for x in columns if x not in set(self.columns))
+        entities = max(entities, len(self.rows))
+        shape = (entities, len(self.columns))
+        if self.shifts.shape != shape:
+            rows = np.zeros(entities, dtype=np.int64)
+            rows[: len(self.rows)] = self.rows
+            self.rows = rows
+            shifts = np.zeros(shape, dtype=np.float64)
+            shifts[: self.shifts.shape[0], : self.shifts.shape[1]] = self.shifts
+            self.shifts = shifts
+            sums = np.zeros((_POWERS, *shape), dtype=np.float64)
+            sums[:, : self.sums.shape[1], : self.sums.shape[2]] = self.sums
+            self.sums = sums
+            extremes = np.full((2, *shape), np.inf, dtype=np.float64)
+            extremes[1] = -np.inf
+            extremes[:, : self.extremes.shape[1], : self.extremes.shape[2]] = (
+                self.extremes
+            )
+            self.extremes = extremes
+        positions = {x: count for count, x in enumerate(self.columns)}
+        return np.array([positions[x] for x in columns], dtype=np.intp)
+
+    def counts(
+        self, codes: npt.NDArray[np.int64], columns: list[str]
+    ) -> npt.NDArray[np.float64]:
+        """The number of values of each entity seen so far, rows by columns."""
+        positions = self._resize(int(codes.max(initial=-1)) + 1, columns)
+        return self.sums[0][codes][:, positions]
+
+    def update(
+        self,
+        codes: npt.NDArray[np.int64],
+        values: npt.NDArray[np.float64],
+        columns: list[str],
+    ) -> dict[str, npt.NDArray[np.float64]]:
+        """Add rows to the state, returning the aggregations before each.
+
+        The codes are the entity of each row and the values its columns. The
+        rows of an entity must be in time order. The returned arrays are shaped
+        rows by columns, keyed by the name of the window aggregation.
+        """
+        positions = self._resize(int(codes.max(initial=-1)) + 1, columns)
+        observed = ~np.isnan(values)
+        shifts = self._shift(codes, values, positions)
+        deltas = np.where(observed, values - shifts, 0.0)
+        sums, earlier_rows = self._add_sums(
+            codes, np.stack([observed * deltas**x for x in range(_POWERS)]), positions
+        )
+        aggregations = _aggregations(
+            sums, shifts, self._add_extremes(codes, values, positions)
+        )
+        aggregations["median"], aggregations["rank"] = self._add_orders(
+            codes, values, columns
+        )
+        for aggregation in aggregations.values():
+            aggregation[earlier_rows == 0] = np.nan
+        return aggregations
+
+    def _shift(
+        self,
+        codes: npt.NDArray[np.int64],
+        values: npt.NDArray[np.float64],
+        positions: npt.NDArray[np.intp],
+    ) -> npt.NDArray[np.float64]:
+        # The values of an entity are shifted by its first value, so that the
+        # power sums keep their precision.
+        first_df = pd.DataFrame(values).groupby(codes, sort=False).first()
+        entities = first_df.index.to_numpy(dtype=np.intp)[:, None]
+        shifts = self.shifts[entities, positions[None, :]]
+        unseen = self.sums[0][entities, positions[None, :]] == 0.0
+        shifts[unseen] = np.nan_to_num(first_df.to_numpy(dtype=np.float64))[unseen]
+        self.shifts[entities, positions[None, :]] = shifts
+        return self.shifts[codes][:, positions]
+
+    def _add_sums(
+        self,
+        codes: npt.NDArray[np.int64],
+        powers: npt.NDArray[np.float64],
+        positions: npt.NDArray[np.intp],
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.int64]]:
+        # The power sums and the number of rows before each row, taking in the
+        # rows after.
+        groups = pd.DataFrame(np.concatenate(powers, axis=1)).groupby(codes, sort=False)
+        cumulative = groups.cumsum().to_numpy().reshape(len(codes), _POWERS, -1)
+        sums = np.moveaxis(cumulative, 1, 0) - powers
+        sums += self.sums[:, codes][:, :, positions]
+        earlier_rows = self.rows[codes] + groups.cumcount().to_numpy()
+        totals = groups.sum()
+        entities = totals.index.to_numpy(dtype=np.intp)[:, None]
+        self.sums[:, entities, positions[None, :]] += np.moveaxis(
+            totals.to_numpy().reshape(len(entities), _POWERS, -1), 1, 0
+        )
+        np.add.at(self.rows, codes, 1)
+        return sums, earlier_rows
+
+    def _add_extremes(
+        self,
+        codes: npt.NDArray[np.int64],
+        values: npt.NDArray[np.float64],
+        positions: npt.NDArray[np.intp],
+    ) -> npt.NDArray[np.float64]:
+        # The minimum and maximum before each row, taking in the rows after.
+        extremes = []
+        for count, sign in enumerate([1.0, -1.0]):
+            # The maximum is the negated minimum of the negated values.
+            groups = pd.DataFrame(
+                np.where(np.isnan(values), np.inf, sign * values)
+            ).groupby(codes, sort=False)
+            inclusive = groups.cummin()
+            earlier = (
+                inclusive.groupby(codes, sort=False).shift(1).fillna(np.inf).to_numpy()
+            )
+            state = sign * self.extremes[count]
+            extremes.append(sign * np.minimum(state[codes][:, positions], earlier))
+            totals = inclusive.groupby(codes, sort=False).last()
+            entities = totals.index.to_numpy(dtype=np.intp)[:, None]
+            self.extremes[count][entities, positions[None, :]] = sign * np.minimum(
+                state[entities, positions[None, :]], totals.to_numpy()
+            )
+        return np.stack(extremes)
+
+    def _add_orders(
+        self,
+        codes: npt.NDArray[np.int64],
+        values: npt.NDArray[np.float64],
+        columns: list[str],
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        # The median of the earlier values and the rank of the latest value among
+        # them, looked up in the sorted values of the entity.
+        medians = np.full(values.shape, np.nan)
+        ranks = np.full(values.shape, np.nan)
+        for count, column in enumerate(columns):
+            for row, (code, value) in enumerate(
+                zip(codes.tolist(), values[:, count].tolist())
+            ):
+                key = (code, column)
+                order = self.orders.setdefault(key, [])
+                medians[row, count] = _median(order)
+                ranks[row, count] = self.ranks.get(key, np.nan)
+                if np.isnan(value):
+                    self.ranks[key] = np.nan
+                    continue
+                left = bisect.bisect_left(order, value)
+                right = bisect.bisect_right(order, value)
+                order.insert(right, value)
+                self.ranks[key] = (left + right + 2) / 2.0
+        return medians, ranks
+
+
+def _central_sums(
+    sums: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], ...]:
+    # The mean and the second to fourth central sums from the power sums.
+    count = sums[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums[1] / count
+    second = np.maximum(sums[2] - count * mean**2, 0.0)
+    third = sums[3] - 3.0 * mean * sums[2] + 2.0 * count * mean**3
+    fourth = (
+        sums[4] - 4.0 * mean * sums[3] + 6.0 * mean**2 * sums[2] - 3.0 * count * mean**4
+    )
+    return mean, second, third, fourth
+
+
+def _shapes(
+    sums: npt.NDArray[np.float64], constant: npt.NDArray[np.bool_]
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    # The bias corrected skew and kurtosis, which pandas takes as 0 and -3 for
+    # windows of a single value and leaves out for nearly flat ones.
+    count = sums[0]
+    _, second, third, fourth = _central_sums(sums)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        spread = second / count
+        skew = np.sqrt(count * (count - 1)) * third / count / spread**1.5 / (count - 2)
+        kurt = (
+            (count * count - 1) * (fourth / count) / spread**2 - 3.0 * (count - 1) ** 2
+        ) / ((count - 2) * (count - 3))
+    flat = spread <= _FLAT_SPREAD
+    return (
+        np.where(
+            count > 2, np.where(constant, 0.0, np.where(flat, np.nan, skew)), np.nan
+        ),
+        np.where(
+            count > 3, np.where(constant, -3.0, np.where(flat, np.nan, kurt)), np.nan
+        ),
+    )
+
+
+def _aggregations(
+    sums: npt.NDArray[np.float64],
+    shifts: npt.NDArray[np.float64],
+    extremes: npt.NDArray[np.float64],
+) -> dict[str, npt.NDArray[np.float64]]:
+    # The window aggregations of pandas from the shifted power sums.
+    count = sums[0]
+    mean, second, _, _ = _central_sums(sums)
+    constant = extremes[0] == extremes[1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = np.where(
+            count > 1, np.where(constant, 0.0, second / (count - 1)), np.nan
+        )
+        sem = np.sqrt(variance / (count - 1))
+    skew, kurt = _shapes(sums, constant)
+    return {
+        "count": count.copy(),
+        "sum": np.where(count > 0, count * shifts + sums[1], np.nan),
+        "mean": shifts + mean,
+        "var": variance,
+        "std": np.sqrt(variance),
+        "min": np.where(count > 0, extremes[0], np.nan),
+        "max": np.where(count > 0, extremes[1], np.nan),
+        "skew": skew,
+        "kurt": kurt,
+        "sem": sem,
+    }
@@ -0,0 +1,48 @@
+"""The state carried between incremental runs of the process function."""
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+
+import datetime
+
+import pandas as pd
+
+from .entity_interner import EntityInterner
+from .ewm_state import EwmState
+from .expanding_state import ExpandingState
+from .multi_window_rating import MultiWindowRating
+
+
+class FeatureState:
+    """The end-of-history state of the stateful processes.
+
+    The per entity state is held in lists indexed by the entity codes.
+    """
+
+    ratings: MultiWindowRating
+    entities: EntityInterner
+    wins: list[float | None]
+    margins: list[dict[str, float] | None]
+    last_identifier_dts: list[datetime.datetime | None]
+    first_identifier_dts: list[datetime.datetime | None]
+    birth_identifier_dts: list[datetime.datetime | None]
+    last_identifier_locations: list[tuple[float, float] | None]
+    identifier_ts: list[pd.DataFrame | None]
+    ewm: EwmState
+    expanding: ExpandingState
+    bookie_squared_error: float
+    bookie_count: int
+
+    def __init__(self) -> None:
+        self.entities = EntityInterner()
+        self.ratings = MultiWindowRating(self.entities)
+        self.wins = []
+        self.margins = []
+        self.last_identifier_dts = []
+        self.first_identifier_dts = []
+        self.birth_identifier_dts = []
+        self.last_identifier_locations = []
+        self.identifier_ts = []
+        self.ewm = EwmState()
+        self.expanding = ExpandingState()
+        self.bookie_squared_error = 0.0
+        self.bookie_count = 0
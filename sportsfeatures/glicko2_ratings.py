@@ -0,0 +1,187 @@
+"""An array backed store of glicko-2 ratings."""
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+
+import math
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+from .rating_model import RatingModel, pairwise_results
+
+_TOLERANCE = 1e-6
+_MAX_ITERATIONS = 100
+
+
+def _g(phis: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+    return 1.0 / np.sqrt(1.0 + 3.0 * phis**2 / math.pi**2)
+
+
+class Glicko2Ratings(RatingModel):
+    """Rates the entities with glicko-2, each match being a rating period.
+
+    The sigma of an entity is its rating deviation, and its volatility is kept
+    alongside. A team plays as a single opponent with the mean rating and the
+    root mean square deviation of its members, while each member is updated
+    from its own rating against the other teams.
+    """
+
+    def __init__(
+        self,
+        mu: float = 1500.0,
+        sigma: float = 350.0,
+        volatility: float = 0.06,
+        tau: float = 0.5,
+        scale: float = 173.7178,
+    ):
+        super().__init__(mu, sigma)
+        self.volatility = volatility
+        self.tau = tau
+        self.scale = scale
+        self.volatilities: npt.NDArray[np.float64] = np.zeros(0, dtype=np.float64)
+
+    def _columns(self) -> dict[str, float]:
+        return {**super()._columns(), "volatilities": self.volatility}
+
+    def parameters(self) -> dict[str, Any]:
+        """The keyword arguments that build the same model again."""
+        return {
+            "mu": self.mu,
+            "sigma": self.sigma,
+            "volatility": self.volatility,
+            "tau": self.tau,
+            "scale": self.scale,
+        }
+
+    def _scaled(
+        self, teams: list[list[int]]
+    ) -> tuple[
+        npt.NDArray[np.intp],
+        npt.NDArray[np.intp],
+        npt.NDArray[np.float64],
+        npt.NDArray[np.float64],
+    ]:
+        # The codes and teams of the members, and the mean rating and root mean
+        # square deviation of each team on the glicko-2 scale.
+        codes = np.concatenate([np.asarray(x, dtype=np.intp) for x in teams])
+        sizes = np.asarray([len(x) for x in teams])
+        sides = np.repeat(np.arange(len(teams)), sizes)
+        mus = (self.mus[codes] - self.mu) / self.scale
+        phis = self.sigmas[codes] / self.scale
+        team_mus = np.bincount(sides, weights=mus) / sizes
+        team_phis = np.sqrt(np.bincount(sides, weights=phis**2) / sizes)
+        return codes, sides, team_mus, team_phis
+
+    def predict_win(self, teams: list[list[int]]) -> list[float]:
+        """Predict the probability of each team of a match winning it."""
+        _, _, team_mus, team_phis = self._scaled(teams)
+        phis = np.sqrt(team_phis[:, None] ** 2 + team_phis[None, :] ** 2)
+        expected = 1.0 / (
+            1.0 + np.exp(-_g(phis) * (team_mus[:, None] - team_mus[None, :]))
+        )
+        # Leave out the half that each team scores against itself.
+        wins = expected.sum(axis=1) - 0.5
+        return (wins / wins.sum()).tolist()
+
+    def _team_ratings(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        count: int,
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """The mean rating and root mean square deviation of each team."""
+        sizes = np.bincount(groups, minlength=count)
+        team_mus = (
+            np.bincount(groups, weights=(mus - self.mu) / self.scale, minlength=count)
+            / sizes
+        )
+        team_phis = (
+            np.bincount(groups, weights=(sigmas / self.scale) ** 2, minlength=count)
+            / sizes
+        )
+        return team_mus, np.sqrt(team_phis)
+
+    def _pairwise_wins(
+        self,
+        first_mus: npt.NDArray[np.float64],
+        first_spreads: npt.NDArray[np.float64],
+        second_mus: npt.NDArray[np.float64],
+        second_spreads: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        """The expected result of each first team against its second team."""
+        phis = np.sqrt(first_spreads**2 + second_spreads**2)
+        return 1.0 / (1.0 + np.exp(-_g(phis) * (first_mus - second_mus)))
+
+    def _volatilities(
+        self,
+        deltas: npt.NDArray[np.float64],
+        phis: npt.NDArray[np.float64],
+        variances: npt.NDArray[np.float64],
+        volatilities: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        # Solve for the new volatilities with the illinois algorithm, as in step
+        # five of the glicko-2 paper, for every member at once.
+        a = np.log(volatilities**2)
+
+        def f(x: npt.NDArray[np.float64]) -> npt.NDArray[np.float64]:
+            ex = np.exp(x)
+            return (
+                ex
+                * (deltas**2 - phis**2 - variances - ex)
+                / (2.0 * (phis**2 + variances + ex) ** 2)
+                - (x - a) / self.tau**2
+            )
+
+        big = deltas**2 > phis**2 + variances
+        lower = np.where(
+            big,
+            np.log(np.maximum(deltas**2 - phis**2 - variances, 1e-300)),
+            a - self.tau,
+        )
+        for _ in range(_MAX_ITERATIONS):
+            short = ~big & (f(lower) < 0.0)
+            if not short.any():
+                break
+            lower = np.where(short, lower - self.tau, lower)
+        upper = a
+        f_upper = f(upper)
+        f_lower = f(lower)
+        for _ in range(_MAX_ITERATIONS):
+            active = np.abs(lower - upper) > _TOLERANCE
+            if not active.any():
+                break
+            c = upper + (upper - lower) * f_upper / (f_lower - f_upper)
+            f_c = f(c)
+            crossed = f_c * f_lower <= 0.0
+            upper = np.where(active & crossed, lower, upper)
+            f_upper = np.where(
+                active & crossed, f_lower, np.where(active, f_upper / 2.0, f_upper)
+            )
+            lower = np.where(active, c, lower)
+            f_lower = np.where(active, f_c, f_lower)
+        return np.exp(upper / 2.0)
+
+    def rate(self, teams: list[list[int]], scores: list[float] | None) -> None:
+        """Update the ratings of the teams of a match with its result."""
+        codes, sides, team_mus, team_phis = self._scaled(teams)
+        mus = (self.mus[codes] - self.mu) / self.scale
+        phis = self.sigmas[codes] / self.scale
+        results = pairwise_results(scores, len(teams))[sides]
+        opponents = sides[:, None] != np.arange(len(teams))[None, :]
+        g = _g(team_phis)[None, :]
+        expected = 1.0 / (1.0 + np.exp(-g * (mus[:, None] - team_mus[None, :])))
+        variances = 1.0 / np.sum(
+            np.where(opponents, g**2 * expected * (1.0 - expected), 0.0), axis=1
+        )
+        improvements = np.sum(
+            np.where(opponents, g * (results - expected), 0.0), axis=1
+        )
+        volatilities = self._volatilities(
+            variances * improvements, phis, variances, self.volatilities[codes]
+        )
+        phis = 1.0 / np.sqrt(1.0 / (phis**2 + volatilities**2) + 1.0 / variances)
+        self.mus[codes] = self.mu + self.scale * (mus + phis**2 * improvements)
+        self.sigmas[codes] = self.scale * phis
+        self.volatilities[codes] = volatilities
@@ -4,6 +4,7 @@
 from .bet import Bet
 from .entity_type import EntityType
 from .news import News
+from .timeseries_spec import TimeseriesSpec
 
 
 class Identifier:
@@ -30,6 +31,8 @@ class Identifier:
         news: list[News] | None = None,
         birth_date_column: str | None = None,
         image_columns: list[str] | None = None,
+        timeseries_spec: TimeseriesSpec | None = None,
+        timeseries_specs: dict[str, TimeseriesSpec] | None = None,
     ):
         self.entity_type = entity_type
         self.column = column
@@ -48,6 +51,8 @@ class Identifier:
         self.news = news if news is not None else []
         self.birth_date_column = birth_date_column
         self.image_columns = image_columns if image_columns is not None else []
+        self.timeseries_spec = timeseries_spec
+        self.timeseries_specs = timeseries_specs if timeseries_specs is not None else {}
 
     @property
     def columns(self) -> list[str]:
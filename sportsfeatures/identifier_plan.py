@@ -0,0 +1,52 @@
+"""A compiled plan of the columns the row loops read for each identifier."""
+
+# pylint: disable=too-few-public-methods,too-many-instance-attributes
+from typing import Any, Iterable, Iterator
+
+import pandas as pd
+
+from .columns import DELIMITER
+from .identifier import Identifier
+
+
+class IdentifierPlan:
+    """An identifier with its columns and output column names resolved once."""
+
+    def __init__(self, identifier: Identifier):
+        self.identifier = identifier
+        self.entity_type = identifier.entity_type
+        self.column = identifier.column
+        self.column_prefix = identifier.column_prefix
+        self.columns = identifier.columns
+        self.numeric_action_columns = identifier.numeric_action_columns
+        self.numeric_action_features = [
+            (x, x[len(identifier.column_prefix) :]) for x in self.numeric_action_columns
+        ]
+        self._output_columns: dict[tuple[str, ...], str] = {}
+
+    def output_column(self, *names: str) -> str:
+        """The name of a feature column written for this identifier."""
+        column = self._output_columns.get(names)
+        if column is None:
+            column = DELIMITER.join([self.column_prefix, *names])
+            self._output_columns[names] = column
+        return column
+
+
+def compile_plans(identifiers: list[Identifier]) -> list[IdentifierPlan]:
+    """Compile the plans for a list of identifiers."""
+    return [IdentifierPlan(x) for x in identifiers]
+
+
+def iterate_rows(
+    df: pd.DataFrame, columns: Iterable[str | None]
+) -> Iterator[tuple[Any, dict[str, Any]]]:
+    """Iterate the index and values of each row over just the given columns.
+
+    Columns that are not in the dataframe are left out of the row values.
+    """
+    positions = {x: count for count, x in enumerate(df.columns.values.tolist())}
+    names = [x for x in dict.fromkeys(columns) if x is not None and x in positions]
+    projected_df = df.iloc[:, [positions[x] for x in names]]
+    for row in projected_df.itertuples(name=None):
+        yield row[0], dict(zip(names, row[1:]))
@@ -1,81 +1,101 @@
 """Process the time delta between the last time played."""
 
-# pylint: disable=duplicate-code,too-many-branches,too-many-locals
-
-import datetime
+# pylint: disable=duplicate-code,too-many-branches,too-many-locals,too-many-statements
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
-from .columns import DELIMITER
+from .block import append_block
+from .column_buffer import ColumnBuffer
+from .feature_state import FeatureState
 from .identifier import Identifier
+from .identifier_plan import compile_plans, iterate_rows
+from .null_check import is_null
 
 
-def lastplayed_process(
-    df: pd.DataFrame, identifiers: list[Identifier], dt_column: str
+def lastplayed_block(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    dt_column: str,
+    state: FeatureState | None = None,
 ) -> pd.DataFrame:
-    """Process a dataframe for last played."""
+    """Compute the block of last played columns."""
     tqdm.pandas(desc="Last Played Features")
-    last_identifier_dts: dict[str, datetime.datetime | None] = {}
-    first_identifier_dts: dict[str, datetime.datetime] = {}
-    birth_identifier_dts: dict[str, datetime.datetime] = {}
-    df_cols = df.columns.values.tolist()
-    df_dict: dict[str, list[float | None]] = {}
+    if state is None:
+        state = FeatureState()
+    identifier_codes = state.entities.identifier_codes(df, identifiers)
+    last_identifier_dts = state.entities.grow(state.last_identifier_dts, None)
+    first_identifier_dts = state.entities.grow(state.first_identifier_dts, None)
+    birth_identifier_dts = state.entities.grow(state.birth_identifier_dts, None)
+    columns = ColumnBuffer(df.index)
+    plans = compile_plans(identifiers)
+    row_columns: list[str | None] = [dt_column]
+    for identifier in identifiers:
+        row_columns.extend([identifier.column, identifier.birth_date_column])
 
-    written_columns = set()
-    for row in tqdm(
-        df.itertuples(name=None), desc="Last Played Processing", total=len(df)
+    for position, (index, row_dict) in enumerate(
+        tqdm(
+            iterate_rows(df, row_columns),
+            desc="Last Played Processing",
+            total=len(df),
+        )
     ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
-
         dt = row_dict[dt_column]
-        for identifier in identifiers:
-            if identifier.column not in row_dict:
-                continue
-            identifier_id = row_dict[identifier.column]
-            if identifier_id is None:
+        for plan, codes in zip(plans, identifier_codes):
+            identifier = plan.identifier
+            if codes is None or codes[position] < 0:
                 continue
-            if not isinstance(identifier_id, str):
+            if not isinstance(row_dict[identifier.column], str):
                 continue
+            key = codes[position]
 
-            key = "_".join([str(identifier.entity_type), identifier_id])
-
-            if key not in birth_identifier_dts:
+            if birth_identifier_dts[key] is None:
                 if identifier.birth_date_column is not None:
-                    if identifier.birth_date_column in row_dict:
-                        birth_date = row_dict[identifier.birth_date_column]
+                    birth_date = row_dict.get(identifier.birth_date_column)
+                    if not is_null(birth_date):
                         birth_identifier_dts[key] = birth_date
 
-            last_dt = last_identifier_dts.get(key)
+            last_dt = last_identifier_dts[key]
             if last_dt is not None and dt is not None:
-                col = DELIMITER.join([identifier.column_prefix, "lastplayeddays"])
-                if col not in df_dict:
-                    df_dict[col] = [None for _ in range(len(df))]
-                written_columns.add(col)
-                df_dict[col][row[0]] = (dt - last_dt).days
+                columns.set(
+                    plan.output_column("lastplayeddays"),
+                    index,
+                    (dt - last_dt).days,
+                    dtype=np.int64,
+                )
             last_identifier_dts[key] = dt
 
-            first_dt = first_identifier_dts.get(key)
+            first_dt = first_identifier_dts[key]
             if first_dt is not None and dt is not None:
-                col = DELIMITER.join([identifier.column_prefix, "firstplayeddays"])
-                if col not in df_dict:
-                    df_dict[col] = [None for _ in range(len(df))]
-                written_columns.add(col)
-                df_dict[col][row[0]] = (dt - first_dt).days
+                columns.set(
+                    plan.output_column("firstplayeddays"),
+                    index,
+                    (dt - first_dt).days,
+                    dtype=np.int64,
+                )
             elif first_dt is None and dt is not None:
                 first_identifier_dts[key] = dt
 
-            birth_dt = birth_identifier_dts.get(key)
+            birth_dt = birth_identifier_dts[key]
             if birth_dt is not None and dt is not None:
                 if birth_dt.tzinfo is None and dt.tzinfo is not None:
                     birth_dt = birth_dt.tz_localize(dt.tzinfo)  # type: ignore
-                col = DELIMITER.join([identifier.column_prefix, "birthdays"])
-                if col not in df_dict:
-                    df_dict[col] = [None for _ in range(len(df))]
-                written_columns.add(col)
-                df_dict[col][row[0]] = (dt - birth_dt).days
+                columns.set(
+                    plan.output_column("birthdays"),
+                    index,
+                    (dt - birth_dt).days,
+                    dtype=np.int64,
+                )
+
+    return columns.to_frame()
 
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
 
-    return df[sorted(df.columns.values.tolist())]
+def lastplayed_process(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    dt_column: str,
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Process a dataframe for last played."""
+    return append_block(df, lastplayed_block(df, identifiers, dt_column, state=state))
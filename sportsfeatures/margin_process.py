@@ -3,82 +3,111 @@
 # pylint: disable=too-many-locals,too-many-branches,duplicate-code
 
 import sys
-from warnings import simplefilter
 
 import pandas as pd
 import tqdm
 
+from .block import append_block
+from .column_buffer import ColumnBuffer
 from .columns import DELIMITER
+from .feature_state import FeatureState
 from .identifier import Identifier
+from .identifier_plan import compile_plans, iterate_rows
 
 
-def margin_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Process margins between teams."""
-    simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
-    df_dict: dict[str, list[float | None]] = {}
-    df_cols = df.columns.values.tolist()
-    identifiers_ts: dict[str, dict[str, float]] = {}
+def margin_block(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Compute the block of margin columns."""
+    if state is None:
+        state = FeatureState()
+    columns = ColumnBuffer(df.index)
+    plans = compile_plans(identifiers)
+    identifier_codes = state.entities.identifier_codes(df, identifiers)
+    identifiers_ts = state.entities.grow(state.margins, None)
+
+    # The margin of a feature is written for every identifier of the entity type
+    # that has a column for it.
+    entity_features: dict[str, set[str]] = {}
+    for plan in plans:
+        entity_features.setdefault(plan.entity_type, set()).update(
+            x[1] for x in plan.numeric_action_features
+        )
+    margin_features = {
+        count: [
+            (
+                x,
+                plan.column_prefix + x,
+                DELIMITER.join([x, "margin", "absolute"]),
+                DELIMITER.join([x, "margin", "relative"]),
+            )
+            for x in sorted(entity_features[plan.entity_type])
+        ]
+        for count, plan in enumerate(plans)
+    }
+    row_columns: list[str] = []
+    for features in margin_features.values():
+        row_columns.extend(x[1] for x in features)
 
-    written_columns = set()
-    for row in tqdm.tqdm(
-        df.itertuples(name=None), desc="Margin Processing", total=len(df)
+    for position, (index, row_dict) in enumerate(
+        tqdm.tqdm(
+            iterate_rows(df, row_columns), desc="Margin Processing", total=len(df)
+        )
     ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
+        row_codes = [
+            -1 if codes is None else int(codes[position]) for codes in identifier_codes
+        ]
 
         # Write lagged data
-        for identifier in identifiers:
-            identifier_id = row_dict.get(identifier.column)
-            if identifier_id is None:
+        for plan, code in zip(plans, row_codes):
+            if code < 0:
                 continue
-            key = DELIMITER.join([identifier.entity_type, identifier_id])
-            lagged_values = identifiers_ts.get(key)
+            lagged_values = identifiers_ts[code]
             if lagged_values is None:
                 continue
             for k, v in lagged_values.items():
-                col = identifier.column_prefix + k
-                if col not in df_dict:
-                    df_dict[col] = [None for _ in range(len(df))]
-                df_dict[col][row[0]] = v
-                written_columns.add(col)
-            del identifiers_ts[key]
+                columns.set(plan.column_prefix + k, index, v)
+            identifiers_ts[code] = None
 
         # Find maximum value
         entity_dicts: dict[str, dict[str, float]] = {}
-        for identifier in identifiers:
-            identifier_id = row_dict.get(identifier.column)
-            if identifier_id is None:
+        for plan, code in zip(plans, row_codes):
+            if code < 0:
                 continue
-            entity_dict = entity_dicts.get(identifier.entity_type, {})
-            for column in identifier.numeric_action_columns:
+            entity_dict = entity_dicts.get(plan.entity_type, {})
+            for column, feature_column in plan.numeric_action_features:
                 value = row_dict.get(column)
                 if value is None:
                     continue
-                feature_column = column[len(identifier.column_prefix) :]
                 entity_dict[feature_column] = max(
                     entity_dict.get(feature_column, sys.float_info.min), value
                 )
-            entity_dicts[identifier.entity_type] = entity_dict
+            entity_dicts[plan.entity_type] = entity_dict
 
         # Cache lagged data
-        for identifier in identifiers:
-            identifier_id = row_dict.get(identifier.column)
-            if identifier_id is None:
+        for count, (plan, code) in enumerate(zip(plans, row_codes)):
+            if code < 0:
                 continue
-            feature_dict = entity_dicts[identifier.entity_type]
-            key = DELIMITER.join([identifier.entity_type, identifier_id])
+            feature_dict = entity_dicts[plan.entity_type]
             identifier_dict = {}
-            for k, max_value in feature_dict.items():
-                full_col = identifier.column_prefix + k
-                if full_col not in row_dict:
+            for k, full_col, abs_col, rel_col in margin_features[count]:
+                max_value = feature_dict.get(k)
+                if max_value is None or full_col not in row_dict:
                     continue
                 value = row_dict[full_col]
-                abs_col = DELIMITER.join([k, "margin", "absolute"])
-                rel_col = DELIMITER.join([k, "margin", "relative"])
                 identifier_dict[abs_col] = value - max_value
                 identifier_dict[rel_col] = value / max_value
-            identifiers_ts[key] = identifier_dict
+            identifiers_ts[code] = identifier_dict
 
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
+    return columns.to_frame()
 
-    return df[sorted(df.columns.values.tolist())]
+
+def margin_process(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Process margins between teams."""
+    return append_block(df, margin_block(df, identifiers, state=state))
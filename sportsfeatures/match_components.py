@@ -0,0 +1,52 @@
+"""Partitioning of matches into groups of entities that never meet."""
+
+import numpy as np
+import numpy.typing as npt
+from scipy.sparse import coo_matrix  # type: ignore
+from scipy.sparse.csgraph import connected_components  # type: ignore
+
+from .match import Match
+
+
+def match_entities(match: Match) -> list[int]:
+    """The codes of every entity taking part in a match."""
+    return [y for x in match.teams for y in [x.identifier, *x.players, *x.coaches]]
+
+
+def match_components(matches: list[Match], entity_count: int) -> npt.NDArray[np.intp]:
+    """Label each match with the connected component of its entities.
+
+    The graph links every match to the entities in it, so two matches share a
+    component when a chain of shared teams, players or coaches joins them.
+    """
+    entities = [match_entities(x) for x in matches]
+    rows = np.repeat(np.arange(len(matches)), [len(x) for x in entities])
+    columns = len(matches) + np.fromiter(
+        (y for x in entities for y in x), dtype=np.intp, count=len(rows)
+    )
+    size = len(matches) + entity_count
+    graph = coo_matrix(
+        (np.ones(len(rows), dtype=np.int8), (rows, columns)), shape=(size, size)
+    )
+    _, labels = connected_components(graph, directed=False)
+    return labels[: len(matches)]
+
+
+def partition_matches(
+    matches: list[Match], entity_count: int, partitions: int
+) -> list[npt.NDArray[np.intp]]:
+    """Split the match positions into at most partitions groups of components.
+
+    Components are handed out largest first to the group with the fewest
+    matches, and each group keeps its matches in their original order.
+    """
+    labels = match_components(matches, entity_count)
+    sizes = np.bincount(labels)
+    loads = [0 for _ in range(min(partitions, len(sizes)))]
+    groups = np.zeros(len(sizes), dtype=np.intp)
+    for label in np.argsort(-sizes, kind="stable"):
+        group = loads.index(min(loads))
+        groups[label] = group
+        loads[group] += int(sizes[label])
+    match_groups = groups[labels]
+    return [np.flatnonzero(match_groups == x) for x in range(len(loads))]
@@ -0,0 +1,257 @@
+"""A columnar log of the matches that the rating windows may still reverse."""
+
+# pylint: disable=protected-access,too-many-instance-attributes
+
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .match import Match
+from .team import Team
+
+_MIN_CAPACITY = 16
+
+
+class _Buffer:
+    """A typed array appended to at the back and dropped from the front.
+
+    Positions are absolute, counting every value ever appended. The kept values
+    are only moved back to the front of the array when it runs out of room, and
+    the array only grows once they fill more than half of it.
+    """
+
+    def __init__(self, dtype: npt.DTypeLike):
+        self._values: npt.NDArray = np.zeros(_MIN_CAPACITY, dtype=dtype)
+        self._start = 0
+        self._end = 0
+        self.first = 0
+
+    @property
+    def end(self) -> int:
+        """The position after the last value."""
+        return self.first + self._end - self._start
+
+    def _make_room(self, count: int) -> None:
+        size = self._end - self._start
+        values = self._values
+        if 2 * (size + count) > len(values):
+            values = np.zeros(
+                max(2 * (size + count), _MIN_CAPACITY), dtype=self._values.dtype
+            )
+        values[:size] = self._values[self._start : self._end]
+        self._values = values
+        self._start = 0
+        self._end = size
+
+    def append(self, value: float) -> None:
+        """Add a value at the back."""
+        if self._end == len(self._values):
+            self._make_room(1)
+        self._values[self._end] = value
+        self._end += 1
+
+    def extend(self, values: list[int]) -> None:
+        """Add several values at the back."""
+        if self._end + len(values) > len(self._values):
+            self._make_room(len(values))
+        self._values[self._end : self._end + len(values)] = values
+        self._end += len(values)
+
+    def get(self, position: int) -> float:
+        """The value at a position."""
+        return self._values[self._start + position - self.first]
+
+    def slice(self, start: int, end: int) -> npt.NDArray:
+        """A view of the values between two positions."""
+        return self._values[
+            self._start + start - self.first : self._start + end - self.first
+        ]
+
+    def drop(self, position: int) -> None:
+        """Let go of the values before a position."""
+        self._start += position - self.first
+        self.first = position
+
+    def skip(self) -> None:
+        """Move an empty buffer on by one position without storing anything."""
+        self.first += 1
+
+    def snapshot(self) -> tuple[int, npt.NDArray]:
+        """The position of the first kept value and the kept values."""
+        return self.first, self._values[self._start : self._end].copy()
+
+    def restore(self, snapshot: tuple[int, npt.NDArray]) -> None:
+        """Take over the kept values of a snapshot."""
+        self.first, values = snapshot
+        self._values = values.copy()
+        self._start = 0
+        self._end = len(values)
+
+    def copy(self) -> "_Buffer":
+        """A copy holding only the kept values."""
+        buffer = _Buffer(self._values.dtype)
+        buffer._values = self._values[self._start : self._end].copy()
+        buffer._end = len(buffer._values)
+        buffer.first = self.first
+        return buffer
+
+
+def _bounds(starts: _Buffer, values: _Buffer, row: int, end: int) -> tuple[int, int]:
+    # The values of a row run up to the start of the next row, or the last value.
+    start = int(starts.get(row))
+    return start, int(starts.get(row + 1)) if row + 1 < end else values.end
+
+
+def _starts(starts: _Buffer, values: _Buffer, start: int, end: int) -> list[int]:
+    # The starts of the rows between two positions, and the end of the last one.
+    return starts.slice(start, end).tolist() + [
+        _bounds(starts, values, end - 1, starts.end)[1] if end > start else values.end
+    ]
+
+
+class MatchLog:
+    """The matches logged for the rating windows, held as flat typed columns.
+
+    Each match is a row of its time in nanoseconds, whether it was rated and the
+    position of its first team. Each team is a row of its code, its points and
+    the positions of its first player and coach, whose codes are kept in two
+    flat columns of their own. Matches are dropped from the front as the windows
+    move past them, so the log only ever holds the matches inside a window.
+    """
+
+    def __init__(self) -> None:
+        self._dts = _Buffer(np.int64)
+        self._rated = _Buffer(np.bool_)
+        self._team_starts = _Buffer(np.int64)
+        self._identifiers = _Buffer(np.int32)
+        self._points = _Buffer(np.float64)
+        self._scored = _Buffer(np.bool_)
+        self._player_starts = _Buffer(np.int64)
+        self._coach_starts = _Buffer(np.int64)
+        self._players = _Buffer(np.int32)
+        self._coaches = _Buffer(np.int32)
+
+    def __len__(self) -> int:
+        return self.end - self.first
+
+    @property
+    def first(self) -> int:
+        """The position of the oldest logged match."""
+        return self._dts.first
+
+    @property
+    def end(self) -> int:
+        """The position after the newest logged match."""
+        return self._dts.end
+
+    def append(self, match: Match, rated: bool) -> None:
+        """Log a match at the back."""
+        self._dts.append(pd.Timestamp(match.dt).value)
+        self._rated.append(rated)
+        self._team_starts.append(self._identifiers.end)
+        for team in match.teams:
+            self._identifiers.append(team.identifier)
+            self._scored.append(team.points is not None)
+            self._points.append(np.nan if team.points is None else team.points)
+            self._player_starts.append(self._players.end)
+            self._coach_starts.append(self._coaches.end)
+            self._players.extend(team.players)
+            self._coaches.extend(team.coaches)
+
+    def skip(self) -> None:
+        """Move an empty log on by one match without storing it."""
+        self._dts.skip()
+        self._rated.skip()
+        self._team_starts.skip()
+
+    def dt(self, position: int) -> int:
+        """The time of a match in nanoseconds."""
+        return int(self._dts.get(position))
+
+    def rated(self, position: int) -> bool:
+        """Whether a match was rated when it was logged."""
+        return bool(self._rated.get(position))
+
+    def match(self, position: int) -> Match:
+        """Rebuild the teams of a logged match."""
+        team_start, team_end = _bounds(
+            self._team_starts, self._identifiers, position, self.end
+        )
+        player_starts = _starts(
+            self._player_starts, self._players, team_start, team_end
+        )
+        coach_starts = _starts(self._coach_starts, self._coaches, team_start, team_end)
+        points = self._points.slice(team_start, team_end).tolist()
+        scored = self._scored.slice(team_start, team_end).tolist()
+        teams = []
+        for count, identifier in enumerate(
+            self._identifiers.slice(team_start, team_end).tolist()
+        ):
+            teams.append(
+                Team(
+                    self._players.slice(
+                        player_starts[count], player_starts[count + 1]
+                    ).tolist(),
+                    points[count] if scored[count] else None,
+                    identifier,
+                    self._coaches.slice(
+                        coach_starts[count], coach_starts[count + 1]
+                    ).tolist(),
+                )
+            )
+        return Match(teams, pd.Timestamp(self.dt(position)))
+
+    def matches(self) -> list[Match]:
+        """Rebuild every logged match, oldest first."""
+        return [self.match(x) for x in range(self.first, self.end)]
+
+    def drop(self, position: int) -> None:
+        """Let go of the matches before a position."""
+        if position <= self.first:
+            return
+        team = (
+            int(self._team_starts.get(position))
+            if position < self.end
+            else self._identifiers.end
+        )
+        if team < self._identifiers.end:
+            player = int(self._player_starts.get(team))
+            coach = int(self._coach_starts.get(team))
+        else:
+            player = self._players.end
+            coach = self._coaches.end
+        for buffer in [self._dts, self._rated, self._team_starts]:
+            buffer.drop(position)
+        for buffer in [
+            self._identifiers,
+            self._points,
+            self._scored,
+            self._player_starts,
+            self._coach_starts,
+        ]:
+            buffer.drop(team)
+        self._players.drop(player)
+        self._coaches.drop(coach)
+
+    def snapshot(self) -> dict[str, Any]:
+        """The kept columns of the log."""
+        return {x: y.snapshot() for x, y in self.__dict__.items()}
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        """Take over the columns of a snapshot."""
+        for name, buffer in self.__dict__.items():
+            buffer.restore(snapshot[name])
+
+    def merge_rated(self, others: list["MatchLog"]) -> None:
+        """Mark the matches rated by any of the logs, which must hold the same matches."""
+        rated = self._rated.slice(self.first, self.end)
+        for other in others:
+            rated |= other._rated.slice(self.first, self.end)
+
+    def copy(self) -> "MatchLog":
+        """A copy with its own columns."""
+        log = MatchLog()
+        log.__dict__.update({x: y.copy() for x, y in self.__dict__.items()})
+        return log
@@ -0,0 +1,363 @@
+"""A class for rating matches across several windows from one match log."""
+
+# pylint: disable=too-many-locals,too-many-branches,too-many-arguments,too-many-positional-arguments,protected-access,too-many-instance-attributes
+
+import copy
+import datetime
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .entity_interner import EntityInterner
+from .entity_type import EntityType
+from .identifier import Identifier
+from .match import Match
+from .match_log import MatchLog
+from .null_check import is_null
+from .rating_model_type import RatingModelType
+from .rating_window_mode import RatingWindowMode
+from .team import Team
+from .windowed_rating import RatingResult, WindowedRating
+
+
+def _resolve_match(
+    row: dict[str, Any],
+    dt_column: str,
+    team_identifiers: list[Identifier],
+    player_identifiers: list[Identifier],
+    coach_identifiers: list[Identifier],
+    entities: EntityInterner,
+) -> Match:
+    teams = []
+    for team_identifier in team_identifiers:
+        if team_identifier.column not in row:
+            continue
+        team_id = row[team_identifier.column]
+        if is_null(team_id):
+            continue
+
+        members: dict[str, list[int]] = {EntityType.PLAYER: [], EntityType.COACH: []}
+        for identifier in player_identifiers + coach_identifiers:
+            if identifier.team_identifier_column is None:
+                continue
+            if identifier.team_identifier_column not in row:
+                continue
+            member_team_id = row[identifier.team_identifier_column]
+            if is_null(member_team_id):
+                continue
+            if member_team_id != team_id:
+                continue
+            if identifier.column not in row:
+                continue
+            member_id = row[identifier.column]
+            if is_null(member_id):
+                continue
+            members[identifier.entity_type].append(
+                entities.code(identifier.entity_type, member_id)
+            )
+
+        points = None
+        if (
+            team_identifier.points_column is not None
+            and team_identifier.points_column in row
+        ):
+            points = row[team_identifier.points_column]
+        teams.append(
+            Team(
+                members[EntityType.PLAYER],
+                points,
+                entities.code(EntityType.TEAM, team_id),
+                members[EntityType.COACH],
+            )
+        )
+    return Match(teams, row[dt_column])
+
+
+class MultiWindowRating:
+    """Rates each match in every window from a single time ordered match log.
+
+    The roster of a row is resolved once and shared by the windows. Each finite
+    window keeps the log position of the oldest match it still holds, so moving
+    the window on only touches the matches that leave it. The log is trimmed
+    once every window has moved past its start.
+
+    A window with a checkpoint interval is rebuilt instead of reversing the
+    matches that leave it. Whenever a match crosses into a new interval, the
+    window restarts from the initial ratings and replays the logged matches
+    since the start of the interval less the window. Between checkpoints it
+    covers between one window and one window plus an interval of matches.
+
+    A decaying window never lets go of a match, and so holds no log at all. The
+    log is kept as flat columns of codes, and is not kept at all unless a window
+    may still need to reverse or replay its matches.
+
+    A match can be logged without being rated, for when the matches of other
+    entities are rated elsewhere. It still moves the windows along, but is not
+    reversed when it leaves them.
+    """
+
+    def __init__(self, entities: EntityInterner | None = None):
+        self._entities = entities if entities is not None else EntityInterner()
+        self.rating_windows: dict[datetime.timedelta | None, WindowedRating] = {}
+        self._log = MatchLog()
+        self._starts: dict[datetime.timedelta, int] = {}
+        self._intervals: dict[datetime.timedelta, datetime.timedelta] = {}
+        self._checkpoints: dict[datetime.timedelta, pd.Timestamp] = {}
+
+    def rating_window(
+        self,
+        window: datetime.timedelta | None,
+        mode: RatingWindowMode = RatingWindowMode.REVERSE,
+        checkpoint_interval: datetime.timedelta | None = None,
+        models: dict[EntityType, RatingModelType] | None = None,
+    ) -> WindowedRating:
+        """Find the ratings of a window, starting it from the next match.
+
+        The mode of a finite window picks how it lets go of old matches, where
+        a checkpointed window needs a checkpoint interval. The models pick the
+        rating model of each entity type.
+        """
+        rating = self.rating_windows.get(window)
+        if rating is not None:
+            return rating
+        if mode == RatingWindowMode.CHECKPOINT and checkpoint_interval is None:
+            raise ValueError("A checkpointed window needs a checkpoint interval")
+        rating = WindowedRating(
+            window,
+            decay=window is not None and mode == RatingWindowMode.DECAY,
+            models=models,
+        )
+        self.rating_windows[window] = rating
+        if window is not None and not rating.decay:
+            self._starts[window] = self._log.end
+            if mode == RatingWindowMode.CHECKPOINT and checkpoint_interval is not None:
+                self._intervals[window] = checkpoint_interval
+        return rating
+
+    @property
+    def entities(self) -> EntityInterner:
+        """The interner of the entity codes that the ratings are indexed by."""
+        return self._entities
+
+    @property
+    def matches(self) -> list[Match]:
+        """The logged matches that a window may still reverse."""
+        return self._log.matches()
+
+    def _trim(self) -> None:
+        self._log.drop(min(self._starts.values(), default=self._log.end))
+
+    def _evict(
+        self, window: datetime.timedelta, rating: WindowedRating, oldest_dt: int
+    ) -> None:
+        # Reverse the results of the matches that have left the window.
+        start = self._starts[window]
+        while start < self._log.end and self._log.dt(start) < oldest_dt:
+            if self._log.rated(start):
+                rating.remove(self._log.match(start))
+            start += 1
+        self._starts[window] = start
+
+    def _checkpoint(
+        self, window: datetime.timedelta, rating: WindowedRating, match: Match
+    ) -> None:
+        dt = pd.Timestamp(match.dt)
+        checkpoint = dt - pd.Timedelta(
+            dt.value % pd.Timedelta(self._intervals[window]).value
+        )
+        if self._checkpoints.get(window) == checkpoint:
+            return
+        self._checkpoints[window] = checkpoint
+        # Move past the matches before the window of the checkpoint, then replay
+        # the rest from the initial ratings.
+        oldest_dt = (checkpoint - window).value
+        start = self._starts[window]
+        while start < self._log.end and self._log.dt(start) < oldest_dt:
+            start += 1
+        self._starts[window] = start
+        rating.reset()
+        for position in range(start, self._log.end):
+            if self._log.rated(position):
+                rating.rate(self._log.match(position))
+
+    def resolve(
+        self,
+        row: dict[str, Any],
+        dt_column: str,
+        team_identifiers: list[Identifier],
+        player_identifiers: list[Identifier],
+        coach_identifiers: list[Identifier],
+    ) -> Match:
+        """Resolve the teams and their entity codes of a row."""
+        return _resolve_match(
+            row,
+            dt_column,
+            team_identifiers,
+            player_identifiers,
+            coach_identifiers,
+            self._entities,
+        )
+
+    def add_match(
+        self, match: Match, rate: bool = True
+    ) -> dict[
+        datetime.timedelta | None, tuple[RatingResult, RatingResult, RatingResult]
+    ]:
+        """Add a new match to every window, rating it unless told not to.
+
+        Returns the team, player and coach results of each window, keyed by the
+        window, or nothing for a match that is not rated.
+        """
+        results = {}
+        for window, rating in self.rating_windows.items():
+            rating.reserve(len(self._entities))
+            if window in self._intervals:
+                self._checkpoint(window, rating, match)
+            elif window in self._starts:
+                self._evict(window, rating, pd.Timestamp(match.dt - window).value)
+            if rate:
+                results[window] = rating.add(match)
+        if self._starts or len(self._log):
+            self._log.append(match, rate)
+            self._trim()
+        else:
+            self._log.skip()
+        return results
+
+    def predict_matches(
+        self, matches: list[Match]
+    ) -> list[
+        dict[datetime.timedelta | None, tuple[RatingResult, RatingResult, RatingResult]]
+    ]:
+        """Predict many matches in every window at once, with the ratings frozen.
+
+        Nothing is rated or logged, and the windows stay where they are.
+        """
+        results: list[
+            dict[
+                datetime.timedelta | None,
+                tuple[RatingResult, RatingResult, RatingResult],
+            ]
+        ] = [{} for _ in matches]
+        for window, rating in self.rating_windows.items():
+            rating.reserve(len(self._entities))
+            for match_results, window_results in zip(results, rating.predict(matches)):
+                match_results[window] = window_results
+        return results
+
+    def add(
+        self,
+        row: dict[str, Any],
+        dt_column: str,
+        team_identifiers: list[Identifier],
+        player_identifiers: list[Identifier],
+        coach_identifiers: list[Identifier],
+    ) -> dict[
+        datetime.timedelta | None, tuple[RatingResult, RatingResult, RatingResult]
+    ]:
+        """Add a new row to every window, returning the results of each window."""
+        return self.add_match(
+            self.resolve(
+                row, dt_column, team_identifiers, player_identifiers, coach_identifiers
+            )
+        )
+
+    def copy(self) -> "MultiWindowRating":
+        """A copy with its own ratings and log, sharing the entity interner."""
+        rating = MultiWindowRating(self._entities)
+        rating.rating_windows = copy.deepcopy(self.rating_windows)
+        rating._log = self._log.copy()
+        rating._starts = dict(self._starts)
+        rating._intervals = dict(self._intervals)
+        rating._checkpoints = dict(self._checkpoints)
+        return rating
+
+    def split(self) -> list["MultiWindowRating"]:
+        """Split into one rating per window, to be run apart and merged back."""
+        parts = []
+        for window, rating in self.rating_windows.items():
+            part = MultiWindowRating(self._entities)
+            part.rating_windows = {window: rating}
+            part._log = self._log.copy()
+            if window in self._starts:
+                part._starts = {window: self._starts[window]}
+            if window in self._intervals:
+                part._intervals = {window: self._intervals[window]}
+            if window in self._checkpoints:
+                part._checkpoints = {window: self._checkpoints[window]}
+            parts.append(part)
+        return parts
+
+    def merge(self, parts: list["MultiWindowRating"]) -> None:
+        """Take back the windows of the parts of a split once they have run.
+
+        The parts must have been given the same rows, so the log of the part
+        that has trimmed the least covers every window.
+        """
+        for part in parts:
+            self.rating_windows.update(part.rating_windows)
+            self._starts.update(part._starts)
+            self._checkpoints.update(part._checkpoints)
+        self._log = min(parts, key=lambda x: x._log.first)._log
+        self._trim()
+
+    def merge_components(
+        self,
+        parts: list["MultiWindowRating"],
+        entities: list[npt.NDArray[np.intp]],
+    ) -> None:
+        """Take back the ratings of parts that each rated separate entities.
+
+        Each part must have been given every match, rating only the matches of
+        its own entities, so the parts agree on the log and differ only in which
+        of its matches they rated.
+        """
+        for window, rating in self.rating_windows.items():
+            rating.reserve(len(self._entities))
+            for part, codes in zip(parts, entities):
+                rating.update(part.rating_windows[window], codes)
+        self._starts = dict(parts[0]._starts)
+        self._checkpoints = dict(parts[0]._checkpoints)
+        self._log = parts[0]._log
+        self._log.merge_rated([x._log for x in parts[1:]])
+
+    def snapshot(self) -> dict[str, Any]:
+        """The entity codes, the ratings of every window and the logged matches."""
+        return {
+            "entities": self._entities.snapshot(),
+            "windows": [
+                x.snapshot(len(self._entities)) for x in self.rating_windows.values()
+            ],
+            "log": self._log.snapshot(),
+            "starts": dict(self._starts),
+            "intervals": dict(self._intervals),
+            "checkpoints": dict(self._checkpoints),
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        """Take over the state of a snapshot, in place of the current state."""
+        self._entities.restore(snapshot["entities"])
+        self.rating_windows = {}
+        for window_snapshot in snapshot["windows"]:
+            rating = WindowedRating(
+                window_snapshot["window"],
+                decay=window_snapshot["decay"],
+                models=window_snapshot["models"],
+            )
+            rating.restore(window_snapshot)
+            self.rating_windows[rating.window] = rating
+        self._log = MatchLog()
+        self._log.restore(snapshot["log"])
+        self._starts = dict(snapshot["starts"])
+        self._intervals = dict(snapshot["intervals"])
+        self._checkpoints = dict(snapshot["checkpoints"])
+
+    def reset(self) -> None:
+        """Resets the state."""
+        for rating in self.rating_windows.values():
+            rating.reset()
+        self._log.drop(self._log.end)
+        self._starts = {x: self._log.end for x in self._starts}
+        self._checkpoints = {}
@@ -3,14 +3,14 @@
 import pandas as pd
 from textfeats.process import process  # type: ignore
 
+from .block import append_block
 from .columns import DELIMITER, NEWS_COLUMN
 from .identifier import Identifier
 
 
-def news_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Process news features."""
-    pd.options.mode.chained_assignment = None
-
+def news_block(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
+    """Compute the block of news feature columns."""
+    block: dict[str, pd.Series] = {}
     for identifier in identifiers:
         summary_cols = [
             x.summary_column
@@ -22,8 +22,13 @@ def news_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFram
         news_df = process(df[summary_cols], True, {"injury"})
         news_df = news_df.drop(columns=summary_cols, errors="ignore")
         for col in news_df.columns.values.tolist():
-            df[DELIMITER.join([identifier.column_prefix, NEWS_COLUMN, col])] = news_df[
-                col
-            ]
+            block[DELIMITER.join([identifier.column_prefix, NEWS_COLUMN, col])] = (
+                news_df[col]
+            )
+
+    return pd.DataFrame({x: block[x] for x in sorted(block)}, index=df.index)
 
-    return df[sorted(df.columns.values.tolist())]
+
+def news_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
+    """Process news features."""
+    return append_block(df, news_block(df, identifiers))
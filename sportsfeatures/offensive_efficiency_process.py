@@ -4,26 +4,40 @@
 import pandas as pd
 from tqdm import tqdm
 
-from .columns import DELIMITER
+from .block import append_block
+from .column_buffer import ColumnBuffer
 from .identifier import Identifier
+from .identifier_plan import compile_plans, iterate_rows
 from .null_check import is_null
 
 OFFENSIVE_EFFICIENCY_COLUMN = "offensiveefficiency"
 
 
-def offensive_efficiency_process(
+def offensive_efficiency_block(
     df: pd.DataFrame, identifiers: list[Identifier]
 ) -> pd.DataFrame:
-    """Process a dataframe for offensive efficiency."""
-    df_dict: dict[str, list[float | None]] = {}
-    df_cols = df.columns.values.tolist()
+    """Compute the block of offensive efficiency columns."""
+    columns = ColumnBuffer(df.index)
+    plans = compile_plans(identifiers)
+    row_columns: list[str | None] = []
+    for identifier in identifiers:
+        row_columns.extend(
+            [
+                identifier.field_goals_column,
+                identifier.assists_column,
+                identifier.field_goals_attempted_column,
+                identifier.offensive_rebounds_column,
+                identifier.turnovers_column,
+            ]
+        )
 
-    written_columns = set()
-    for row in tqdm(
-        df.itertuples(name=None), desc="Offensive Efficiency Processing", total=len(df)
+    for index, row_dict in tqdm(
+        iterate_rows(df, row_columns),
+        desc="Offensive Efficiency Processing",
+        total=len(df),
     ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
-        for identifier in identifiers:
+        for plan in plans:
+            identifier = plan.identifier
             if identifier.field_goals_column is None:
                 continue
             if identifier.field_goals_column not in row_dict:
@@ -66,20 +80,20 @@ def offensive_efficiency_process(
             if is_null(turnovers_value):
                 continue
             turnovers = float(turnovers_value)
-            offensive_efficiency_column = DELIMITER.join(
-                [identifier.column_prefix, OFFENSIVE_EFFICIENCY_COLUMN]
-            )
-            if offensive_efficiency_column not in df_dict:
-                df_dict[offensive_efficiency_column] = [None for _ in range(len(df))]
             denominator = (
                 field_goals_attempted - offensive_rebounds + assists + turnovers
             )
-            df_dict[offensive_efficiency_column][row[0]] = (
-                (field_goals + assists) / denominator if denominator != 0.0 else 0.0
+            columns.set(
+                plan.output_column(OFFENSIVE_EFFICIENCY_COLUMN),
+                index,
+                (field_goals + assists) / denominator if denominator != 0.0 else 0.0,
             )
-            written_columns.add(offensive_efficiency_column)
 
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
+    return columns.to_frame()
+
 
-    return df[sorted(df.columns.values.tolist())]
+def offensive_efficiency_process(
+    df: pd.DataFrame, identifiers: list[Identifier]
+) -> pd.DataFrame:
+    """Process a dataframe for offensive efficiency."""
+    return append_block(df, offensive_efficiency_block(df, identifiers))
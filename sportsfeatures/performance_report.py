@@ -0,0 +1,89 @@
+"""A report of the performance of each process stage."""
+
+# pylint: disable=too-few-public-methods,too-many-arguments,too-many-positional-arguments,too-many-instance-attributes
+import json
+from typing import Any
+
+
+class StageReport:
+    """The measurements taken while running a single stage.
+
+    The CPU time is that of the thread running the stage, and the peak memory
+    is the peak traced memory in bytes of the main process above what was
+    already allocated when the stage started. Stages that hand their work to
+    worker processes report the CPU time of those workers separately. The live
+    workers are only counted where there is a /proc to read them from, otherwise
+    only those that exited during the stage are.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        wall_time: float,
+        cpu_time: float,
+        peak_memory: int,
+        input_rows: int,
+        input_columns: int,
+        output_rows: int,
+        output_columns: int,
+        columns_added: int,
+        worker_cpu_time: float = 0.0,
+    ):
+        self.name = name
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.peak_memory = peak_memory
+        self.input_rows = input_rows
+        self.input_columns = input_columns
+        self.output_rows = output_rows
+        self.output_columns = output_columns
+        self.columns_added = columns_added
+        self.worker_cpu_time = worker_cpu_time
+
+    @property
+    def rows_per_second(self) -> float:
+        """The number of input rows processed per second."""
+        if self.wall_time <= 0.0:
+            return 0.0
+        return self.input_rows / self.wall_time
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the stage report to a JSON serializable dictionary."""
+        return {
+            "name": self.name,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_memory": self.peak_memory,
+            "input_rows": self.input_rows,
+            "input_columns": self.input_columns,
+            "output_rows": self.output_rows,
+            "output_columns": self.output_columns,
+            "columns_added": self.columns_added,
+            "worker_cpu_time": self.worker_cpu_time,
+            "rows_per_second": self.rows_per_second,
+        }
+
+
+class PerformanceReport:
+    """The per stage performance of a call to process.
+
+    The worker processes are shared between the stages and calls, so their
+    memory is reported once, as the largest peak resident memory in bytes of any
+    child process, such as the workers, over the life of the process rather
+    than per stage.
+    """
+
+    def __init__(self) -> None:
+        self.stages: list[StageReport] = []
+        self.worker_peak_memory = 0
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the report to a JSON serializable dictionary."""
+        return {
+            "stages": [x.to_dict() for x in self.stages],
+            "worker_peak_memory": self.worker_peak_memory,
+        }
+
+    def to_json(self) -> str:
+        """Serialize the report to JSON."""
+        return json.dumps(self.to_dict())
@@ -1,21 +1,20 @@
 """Calculate players features."""
 
 # pylint: disable=too-many-locals,too-many-branches,too-many-statements
-from warnings import simplefilter
-
 import pandas as pd
 import tqdm
 from pandas.api.types import is_float_dtype
 
+from .block import append_block
 from .columns import DELIMITER
 from .identifier import Identifier
 
 PLAYERS_COLUMN = "players"
 
 
-def players_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Process players stats on a team."""
-    simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
+def players_block(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
+    """Compute the block of players stats columns."""
+    block: dict[str, pd.Series] = {}
     df_cols = df.columns.values.tolist()
 
     team_identifiers: dict[str, list[Identifier]] = {}
@@ -47,38 +46,27 @@ def players_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataF
         for column_key, cols in columns.items():
             if len(cols) < 2:
                 continue
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "mean"])] = (
-                df[cols].mean(axis=1)
-            )
-            df[
-                DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "median"])
-            ] = df[cols].median(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "min"])] = df[
-                cols
-            ].min(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "max"])] = df[
-                cols
-            ].max(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "count"])] = (
-                df[cols].notnull().sum(axis=1)
-            )
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "sum"])] = df[
-                cols
-            ].sum(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "var"])] = df[
-                cols
-            ].var(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "std"])] = df[
-                cols
-            ].std(axis=1)
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "skew"])] = (
-                df[cols].skew(axis=1)
-            )
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "kurt"])] = (
-                df[cols].kurt(axis=1)
-            )
-            df[DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, "sem"])] = df[
-                cols
-            ].sem(axis=1)
+            cols_df = df[cols]
+            for name, series in {
+                "mean": cols_df.mean(axis=1),
+                "median": cols_df.median(axis=1),
+                "min": cols_df.min(axis=1),
+                "max": cols_df.max(axis=1),
+                "count": cols_df.notnull().sum(axis=1),
+                "sum": cols_df.sum(axis=1),
+                "var": cols_df.var(axis=1),
+                "std": cols_df.std(axis=1),
+                "skew": cols_df.skew(axis=1),
+                "kurt": cols_df.kurt(axis=1),
+                "sem": cols_df.sem(axis=1),
+            }.items():
+                block[
+                    DELIMITER.join([column_prefix, PLAYERS_COLUMN, column_key, name])
+                ] = series
+
+    return pd.DataFrame({x: block[x] for x in sorted(block)}, index=df.index)
 
-    return df[sorted(df.columns.values.tolist())]
+
+def players_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
+    """Process players stats on a team."""
+    return append_block(df, players_block(df, identifiers))
@@ -1,31 +1,40 @@
 """The main process function."""
 
-# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-statements
+# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-statements,too-many-locals
 import datetime
-import logging
-import time
+import functools
 
 import pandas as pd
 import requests_cache
 import tqdm
 
 from .bets_process import bet_process
+from .columns import DELIMITER
 from .correlation_reducer import correlation_reducer
 from .datetime_process import datetime_process
 from .datetimesub_process import datetimesub_process
-from .distance_process import distance_process
+from .distance_process import distance_block
+from .entity_type import EntityType
+from .feature_state import FeatureState
 from .identifier import Identifier
 from .image_process import image_process
-from .lastplayed_process import lastplayed_process
-from .margin_process import margin_process
-from .news_process import news_process
-from .offensive_efficiency_process import offensive_efficiency_process
+from .lastplayed_process import lastplayed_block
+from .margin_process import margin_block
+from .news_process import news_block
+from .offensive_efficiency_process import offensive_efficiency_block
 from .ordinal_process import ordinal_process
-from .players_process import players_process
-from .remove_process import remove_process
-from .skill_process import skill_process
-from .timeseries_process import timeseries_process
-from .win_process import win_process
+from .performance_report import PerformanceReport
+from .players_process import players_block
+from .rating_model_type import RatingModelType
+from .rating_window_mode import RatingWindowMode
+from .remove_process import remove_process, removed_columns
+from .skill_process import skill_block
+from .stage import Stage, run_stages
+from .timeseries_backend import TimeseriesBackend
+from .timeseries_cache import TimeseriesCache
+from .timeseries_process import BATCH_ROWS, check_cache, timeseries_block
+from .timeseries_spec import check_halflives
+from .win_process import WINS_COLUMN, win_block, win_identifiers
 
 
 def _reduce_memory_usage(df: pd.DataFrame) -> pd.DataFrame:
@@ -50,8 +59,38 @@ def process(
     session: requests_cache.CachedSession | None = None,
     use_multiprocessing: bool = True,
     reduce_input: bool = True,
+    state: FeatureState | None = None,
+    report: PerformanceReport | None = None,
+    timeseries_backend: TimeseriesBackend = TimeseriesBackend.TIMESERIESFEATURES,
+    timeseries_cache: TimeseriesCache | None = None,
+    timeseries_halflives: list[datetime.timedelta] | None = None,
+    timeseries_batch_rows: int = BATCH_ROWS,
+    timeseries_n_jobs: int = -1,
+    skill_checkpoint_interval: datetime.timedelta | None = None,
+    skill_window_modes: dict[datetime.timedelta, RatingWindowMode] | None = None,
+    skill_rating_models: dict[EntityType, RatingModelType] | None = None,
 ) -> pd.DataFrame:
-    """Process the dataframe for sports features."""
+    """Process the dataframe for sports features.
+
+    Passing a FeatureState carries the end-of-history state of the stateful
+    processes across calls, so a later call only needs the newly appended rows.
+    Stages that do not read each others columns run concurrently when
+    use_multiprocessing is set. Passing a PerformanceReport fills it with the
+    measurements of every stage. The timeseries backend picks between computing
+    the timeseries features with timeseriesfeatures or all at once in memory,
+    and a timeseries cache reuses the features of entities with no new rows
+    with the timeseriesfeatures backend.
+    Each of the timeseries half-lives adds exponentially weighted features.
+    With multiprocessing the timeseriesfeatures backend computes the entities in
+    batches of about timeseries_batch_rows rows over timeseries_n_jobs workers.
+    A skill checkpoint interval rebuilds the finite skill windows at every
+    interval instead of reversing the matches that leave them, and the skill
+    window modes choose between reversing, checkpointing and decaying per window.
+    The skill rating models choose the rating model of each entity type.
+    """
+    # Fail before any stage runs rather than once the timeseries stage is reached.
+    check_halflives(timeseries_halflives or [])
+    check_cache(timeseries_backend, timeseries_cache)
     if session is None:
         session = requests_cache.CachedSession(
             "imagefeatures",
@@ -60,84 +99,205 @@ def process(
             stale_if_error=True,
         )
 
-    if reduce_input:
-        df = correlation_reducer(df, identifiers)
-
-    start_time = time.perf_counter()
-    df = skill_process(df, dt_column, identifiers, windows)
-    end_time = time.perf_counter()
-    logging.info("Skill process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = offensive_efficiency_process(df, identifiers)
-    end_time = time.perf_counter()
-    logging.info("Offensive efficiency process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = margin_process(df, identifiers)
-    end_time = time.perf_counter()
-    logging.info("Margin process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = bet_process(df, identifiers, dt_column, use_bets_features)
-    end_time = time.perf_counter()
-    logging.info("Bet process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = datetimesub_process(df, dt_column, identifiers, datetime_columns)
-    end_time = time.perf_counter()
-    logging.info("Datetimesub process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = win_process(df, identifiers)
-    end_time = time.perf_counter()
-    logging.info("Win process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = timeseries_process(df, identifiers, windows, dt_column, use_multiprocessing)
-    end_time = time.perf_counter()
-    logging.info("Timeseries process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = datetime_process(df, dt_column, datetime_columns)
-    end_time = time.perf_counter()
-    logging.info("Datetime process time: %.6f", end_time - start_time)
+    if state is None:
+        state = FeatureState()
+    # Intern every entity up front, so the concurrent stages only read the codes.
+    state.entities.identifier_codes(df, identifiers)
 
-    start_time = time.perf_counter()
-    df = distance_process(df, identifiers)
-    end_time = time.perf_counter()
-    logging.info("Distance process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = lastplayed_process(df, identifiers, dt_column)
-    end_time = time.perf_counter()
-    logging.info("Lastplayed process time: %.6f", end_time - start_time)
+    identifier_columns: set[str] = {dt_column}
+    for identifier in identifiers:
+        identifier_columns |= set(identifier.columns)
+        if identifier.birth_date_column is not None:
+            identifier_columns.add(identifier.birth_date_column)
+    win_columns = {DELIMITER.join([x.column_prefix, WINS_COLUMN]) for x in identifiers}
+    # The stages after the win stage take its columns as feature columns through
+    # copies of the identifiers, so no stage changes the shared identifiers.
+    feature_identifiers = win_identifiers(identifiers)
+    bet_columns = set(identifier_columns)
+    for identifier in identifiers:
+        for bet in identifier.bets:
+            bet_columns |= {
+                bet.odds_column,
+                bet.bookie_id_column,
+                bet.canonical_column,
+                bet.bookie_name_column,
+                bet.bet_type_column,
+            }
+            if bet.dt_column is not None:
+                bet_columns.add(bet.dt_column)
+    datetime_feature_columns = {dt_column} | (
+        set(datetime_columns) if datetime_columns is not None else set()
+    )
+    news_columns = {y.summary_column for x in identifiers for y in x.news}
+    image_columns = {y for x in identifiers for y in x.image_columns}
+    player_prefixes = tuple(
+        x.column_prefix for x in identifiers if x.team_identifier_column is not None
+    )
 
+    stages = []
+    if reduce_input:
+        stages.append(
+            Stage(
+                "Correlation reducer",
+                functools.partial(correlation_reducer, identifiers=identifiers),
+            )
+        )
+    stages.extend(
+        [
+            Stage(
+                "Skill",
+                functools.partial(
+                    skill_block,
+                    dt_column=dt_column,
+                    identifiers=identifiers,
+                    windows=windows,
+                    state=state,
+                    use_multiprocessing=use_multiprocessing,
+                    checkpoint_interval=skill_checkpoint_interval,
+                    window_modes=skill_window_modes,
+                    rating_models=skill_rating_models,
+                ),
+                reads=identifier_columns,
+                block=True,
+            ),
+            Stage(
+                "Offensive efficiency",
+                functools.partial(offensive_efficiency_block, identifiers=identifiers),
+                reads=identifier_columns,
+                block=True,
+            ),
+            Stage(
+                "Margin",
+                functools.partial(margin_block, identifiers=identifiers, state=state),
+                reads=identifier_columns,
+                block=True,
+            ),
+            Stage(
+                "Bet",
+                functools.partial(
+                    bet_process,
+                    identifiers=identifiers,
+                    dt_column=dt_column,
+                    use_bets_features=use_bets_features,
+                    state=state,
+                ),
+                reads=bet_columns,
+            ),
+            Stage(
+                "Datetimesub",
+                functools.partial(
+                    datetimesub_process,
+                    dt_column=dt_column,
+                    identifiers=identifiers,
+                    datetime_columns=datetime_columns,
+                ),
+                reads=identifier_columns | datetime_feature_columns,
+            ),
+            Stage(
+                "Win",
+                functools.partial(win_block, identifiers=identifiers, state=state),
+                reads=identifier_columns,
+                writes=win_columns,
+                block=True,
+            ),
+            Stage(
+                "Timeseries",
+                functools.partial(
+                    timeseries_block,
+                    identifiers=feature_identifiers,
+                    windows=windows,
+                    dt_column=dt_column,
+                    use_multiprocessing=use_multiprocessing,
+                    state=state,
+                    backend=timeseries_backend,
+                    cache=timeseries_cache,
+                    halflives=timeseries_halflives,
+                    batch_rows=timeseries_batch_rows,
+                    n_jobs=timeseries_n_jobs,
+                ),
+                reads=identifier_columns | win_columns,
+                block=True,
+            ),
+            Stage(
+                "Distance",
+                functools.partial(distance_block, identifiers=identifiers, state=state),
+                reads=identifier_columns,
+                block=True,
+            ),
+            Stage(
+                "Lastplayed",
+                functools.partial(
+                    lastplayed_block,
+                    identifiers=identifiers,
+                    dt_column=dt_column,
+                    state=state,
+                ),
+                reads=identifier_columns,
+                block=True,
+            ),
+        ]
+    )
     if use_news_features:
-        start_time = time.perf_counter()
-        df = news_process(df, identifiers)
-        end_time = time.perf_counter()
-        logging.info("News process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = image_process(df, identifiers, session)
-    end_time = time.perf_counter()
-    logging.info("Image process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = ordinal_process(df, categorical_features)
-    end_time = time.perf_counter()
-    logging.info("Ordinal process time: %.6f", end_time - start_time)
-
-    start_time = time.perf_counter()
-    df = remove_process(df, identifiers)
-    end_time = time.perf_counter()
-    logging.info("Remove process time: %.6f", end_time - start_time)
-
+        stages.append(
+            Stage(
+                "News",
+                functools.partial(news_block, identifiers=identifiers),
+                reads=news_columns,
+                block=True,
+            )
+        )
+    stages.extend(
+        [
+            Stage(
+                "Image",
+                functools.partial(
+                    image_process, identifiers=identifiers, session=session
+                ),
+                reads=image_columns,
+            ),
+            # The datetime conversion runs after every other reader of the
+            # datetime columns so they all see the same input.
+            Stage(
+                "Datetime",
+                functools.partial(
+                    datetime_process,
+                    dt_column=dt_column,
+                    datetime_columns=datetime_columns,
+                ),
+                reads=datetime_feature_columns,
+                writes=datetime_feature_columns,
+            ),
+            Stage(
+                "Ordinal",
+                functools.partial(
+                    ordinal_process, categorical_features=categorical_features
+                ),
+                reads=categorical_features,
+                writes=categorical_features,
+            ),
+            # The remove stage picks its reads when it runs, so it runs after every
+            # stage that reads the columns it drops.
+            Stage(
+                "Remove",
+                functools.partial(remove_process, identifiers=feature_identifiers),
+                reads=lambda _: removed_columns(feature_identifiers),
+            ),
+        ]
+    )
     if use_players_feature:
-        start_time = time.perf_counter()
-        df = players_process(df, identifiers)
-        end_time = time.perf_counter()
-        logging.info("Players process time: %.6f", end_time - start_time)
+        stages.append(
+            Stage(
+                "Players",
+                functools.partial(players_block, identifiers=identifiers),
+                reads=lambda columns: {
+                    x for x in columns if x.startswith(player_prefixes)
+                },
+                block=True,
+            )
+        )
+
+    stages.append(Stage("Reduce memory usage", _reduce_memory_usage))
 
-    return _reduce_memory_usage(df)
+    return run_stages(
+        df, stages, n_jobs=-1 if use_multiprocessing else 1, report=report
+    )
@@ -0,0 +1,199 @@
+"""The interface of the array backed rating models."""
+
+# pylint: disable=too-many-locals
+
+from abc import ABC, abstractmethod
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+
+
+def pairwise_results(scores: list[float] | None, size: int) -> npt.NDArray[np.float64]:
+    """The result of each team against each other team of a match.
+
+    A win counts 1, a draw 0.5 and a loss 0. Without scores the teams finish in
+    the order they are given, as they do in openskill.
+    """
+    values = (
+        -np.arange(size, dtype=np.float64) if scores is None else np.asarray(scores)
+    )
+    return (values[:, None] > values[None, :]) + 0.5 * (
+        values[:, None] == values[None, :]
+    )
+
+
+class RatingModel(ABC):
+    """Holds the rating of every entity in contiguous float64 arrays.
+
+    The arrays are indexed by interned entity codes, with entities that have not
+    played yet at the initial rating. Every model keeps a mu and a sigma for each
+    entity, where the sigma is the uncertainty of the mu for the models that have
+    one. The teams of a match are given as lists of entity codes.
+    """
+
+    def __init__(self, mu: float, sigma: float):
+        self.mu = mu
+        self.sigma = sigma
+        self.mus: npt.NDArray[np.float64] = np.zeros(0, dtype=np.float64)
+        self.sigmas: npt.NDArray[np.float64] = np.zeros(0, dtype=np.float64)
+        self.last_dts: npt.NDArray[np.float64] = np.zeros(0, dtype=np.float64)
+
+    def _columns(self) -> dict[str, float]:
+        # The per entity arrays of the model and the value each starts out at.
+        return {"mus": self.mu, "sigmas": self.sigma, "last_dts": np.nan}
+
+    @abstractmethod
+    def parameters(self) -> dict[str, Any]:
+        """The keyword arguments that build the same model again."""
+
+    @abstractmethod
+    def predict_win(self, teams: list[list[int]]) -> list[float]:
+        """Predict the probability of each team of a match winning it."""
+
+    @abstractmethod
+    def rate(self, teams: list[list[int]], scores: list[float] | None) -> None:
+        """Update the ratings of the teams of a match with its result."""
+
+    @abstractmethod
+    def _team_ratings(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        count: int,
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """The rating and spread of each of the count teams of the groups."""
+
+    @abstractmethod
+    def _pairwise_wins(
+        self,
+        first_mus: npt.NDArray[np.float64],
+        first_spreads: npt.NDArray[np.float64],
+        second_mus: npt.NDArray[np.float64],
+        second_spreads: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        """The probability of each first team beating its second team."""
+
+    def predict_ranks(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        group_matches: npt.NDArray[np.intp],
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """Predict the rank and probability of every team of many matches at once.
+
+        Each member has a mu, a sigma and the group of its team, and each group
+        the match it plays in, with the groups of a match next to each other.
+        The predictions only use the given ratings, as predict_rank would for
+        each match, and nothing is rated.
+        """
+        team_mus, team_spreads = self._team_ratings(
+            mus, sigmas, groups, len(group_matches)
+        )
+        sizes = np.bincount(group_matches)
+        starts = np.cumsum(sizes) - sizes
+        # Every ordered pair of teams within each match.
+        pair_counts = sizes * (sizes - 1)
+        pair_matches = np.repeat(np.arange(len(sizes)), pair_counts)
+        offsets = np.arange(len(pair_matches)) - np.repeat(
+            np.cumsum(pair_counts) - pair_counts, pair_counts
+        )
+        others = sizes[pair_matches] - 1
+        first = offsets // others
+        second = offsets % others
+        second += second >= first
+        first += starts[pair_matches]
+        second += starts[pair_matches]
+        wins = self._pairwise_wins(
+            team_mus[first], team_spreads[first], team_mus[second], team_spreads[second]
+        )
+        win_probabilities = np.bincount(
+            first, weights=wins, minlength=len(group_matches)
+        ) / (sizes[group_matches] - 1)
+        probabilities = (
+            win_probabilities
+            / np.bincount(group_matches, weights=win_probabilities)[group_matches]
+        )
+        ranks = 1 + np.bincount(
+            first,
+            weights=probabilities[second] > probabilities[first],
+            minlength=len(group_matches),
+        ).astype(np.int64)
+        return ranks, probabilities
+
+    def predict_rank(self, teams: list[list[int]]) -> list[tuple[int, float]]:
+        """Predict the rank and probability of each team of a match."""
+        probabilities = self.predict_win(teams)
+        return [
+            (1 + sum(x > probability for x in probabilities), probability)
+            for probability in probabilities
+        ]
+
+    def initial_rating(self) -> tuple[float, float]:
+        """The mu and sigma of an entity that has not played yet."""
+        return self.mu, self.sigma
+
+    def reserve(self, size: int) -> None:
+        """Make room for the ratings of the codes below size."""
+        if size <= len(self.mus):
+            return
+        capacity = max(size, 2 * len(self.mus))
+        for name, fill in self._columns().items():
+            values = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=np.float64)
+            grown[: len(values)] = values
+            setattr(self, name, grown)
+
+    def reset(self) -> None:
+        """Return every entity to the initial rating."""
+        for name, fill in self._columns().items():
+            getattr(self, name)[:] = fill
+
+    def update(self, other: "RatingModel", codes: npt.NDArray[np.intp]) -> None:
+        """Copy the ratings of some entities over from another model."""
+        codes = codes[codes < len(other.mus)]
+        for name in self._columns():
+            getattr(self, name)[codes] = getattr(other, name)[codes]
+
+    def snapshot(self, size: int) -> dict[str, Any]:
+        """The model parameters and the ratings of the codes below size."""
+        return {
+            "parameters": self.parameters(),
+            **{x: getattr(self, x)[:size].copy() for x in self._columns()},
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        """Take over the ratings of a snapshot."""
+        for name in self._columns():
+            setattr(self, name, snapshot[name].copy())
+
+    def decayed_sigmas(
+        self,
+        codes: npt.NDArray[np.intp],
+        dts: float | npt.NDArray[np.float64],
+        horizon: float,
+    ) -> npt.NDArray[np.float64]:
+        """The sigmas of entities inflated by the time since they last played.
+
+        The variance grows linearly with the seconds since the last match, so
+        that an entity idle for the whole horizon is back to the initial sigma.
+        A sigma is never deflated.
+        """
+        elapsed = np.nan_to_num(dts - self.last_dts[codes])
+        variances = np.minimum(
+            self.sigmas[codes] ** 2 + self.sigma**2 * elapsed / horizon,
+            self.sigma**2,
+        )
+        return np.maximum(self.sigmas[codes], np.sqrt(variances))
+
+    def decay(self, codes: list[int], dt: float, horizon: float) -> None:
+        """Decay the sigmas of entities to dt, marking them as playing then."""
+        indexes = np.asarray(codes)
+        self.sigmas[indexes] = self.decayed_sigmas(indexes, dt, horizon)
+        self.last_dts[indexes] = dt
+
+    def rating(self, code: int) -> tuple[float, float]:
+        """The mu and sigma of an entity."""
+        return float(self.mus[code]), float(self.sigmas[code])
@@ -0,0 +1,15 @@
+"""An enum containing the models that the skill windows can rate with."""
+
+from enum import StrEnum, auto
+
+
+class RatingModelType(StrEnum):
+    """The rating model of an entity type."""
+
+    PLACKETT_LUCE = auto()
+    BRADLEY_TERRY_FULL = auto()
+    BRADLEY_TERRY_PART = auto()
+    THURSTONE_MOSTELLER_FULL = auto()
+    THURSTONE_MOSTELLER_PART = auto()
+    ELO = auto()
+    GLICKO2 = auto()
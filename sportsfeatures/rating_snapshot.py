@@ -0,0 +1,109 @@
+"""Saving and loading the skill ratings, to warm start a later run."""
+
+import datetime
+import enum
+import json
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from .entity_type import EntityType
+from .multi_window_rating import MultiWindowRating
+from .rating_model_type import RatingModelType
+
+_SNAPSHOT_VERSION = 1
+_HEADER = "header"
+_ENUMS: dict[str, type[enum.Enum]] = {
+    x.__name__: x for x in [EntityType, RatingModelType]
+}
+
+
+def _encode_value(value: Any) -> Any:
+    # The values JSON has no type for, tagged by their kind. Timestamps come
+    # before datetimes as they are datetimes too.
+    if isinstance(value, enum.Enum):
+        return {"enum": [type(value).__name__, value.value]}
+    if isinstance(value, pd.Timestamp):
+        return {"timestamp": value.isoformat()}
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"timedelta": [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _encode(value: Any, arrays: dict[str, np.ndarray]) -> Any:
+    # The value as JSON, with its arrays moved out by name.
+    if isinstance(value, np.ndarray):
+        name = f"array{len(arrays)}"
+        arrays[name] = value
+        return {"array": name}
+    if isinstance(value, tuple):
+        return {"tuple": [_encode(x, arrays) for x in value]}
+    if isinstance(value, list):
+        return [_encode(x, arrays) for x in value]
+    if isinstance(value, dict):
+        return {
+            "dict": [[_encode(x, arrays), _encode(y, arrays)] for x, y in value.items()]
+        }
+    return _encode_value(value)
+
+
+def _decode_value(tag: str, content: Any) -> Any:
+    if tag == "enum":
+        return _ENUMS[content[0]](content[1])
+    if tag == "timestamp":
+        return pd.Timestamp(content)
+    if tag == "datetime":
+        return datetime.datetime.fromisoformat(content)
+    if tag == "timedelta":
+        return datetime.timedelta(
+            days=content[0], seconds=content[1], microseconds=content[2]
+        )
+    raise ValueError(f"Unrecognised rating snapshot value: {tag}")
+
+
+def _decode(value: Any, arrays: dict[str, np.ndarray]) -> Any:
+    # The value encoded by _encode, with its arrays taken from the file.
+    if isinstance(value, list):
+        return [_decode(x, arrays) for x in value]
+    if not isinstance(value, dict):
+        return value
+    ((tag, content),) = value.items()
+    if tag == "array":
+        return arrays[content]
+    if tag == "tuple":
+        return tuple(_decode(x, arrays) for x in content)
+    if tag == "dict":
+        return {_decode(x, arrays): _decode(y, arrays) for x, y in content}
+    return _decode_value(tag, content)
+
+
+def save_ratings(ratings: MultiWindowRating, path: str) -> None:
+    """Write the ratings of every window, and the matches they still hold, to a file.
+
+    The ratings and the logged matches are stored as flat arrays in an npz file,
+    alongside a JSON header describing them, so that loading them back takes no
+    longer than reading the file and never unpickles anything.
+    """
+    arrays: dict[str, np.ndarray] = {}
+    header = _encode(
+        {"version": _SNAPSHOT_VERSION, "snapshot": ratings.snapshot()}, arrays
+    )
+    with open(path, "wb") as handle:
+        np.savez(handle, **{_HEADER: np.array(json.dumps(header))}, **arrays)
+
+
+def load_ratings(path: str) -> MultiWindowRating:
+    """Read back ratings written by save_ratings."""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {x: data[x] for x in data.files if x != _HEADER}
+        header = _decode(json.loads(str(data[_HEADER])), arrays)
+    if header.get("version") != _SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported rating snapshot version in {path}")
+    ratings = MultiWindowRating()
+    ratings.restore(header["snapshot"])
+    return ratings
@@ -0,0 +1,230 @@
+"""An array backed store of openskill ratings."""
+
+# pylint: disable=too-many-locals
+
+import math
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from openskill.models import (BradleyTerryFull, BradleyTerryPart, PlackettLuce,
+                              ThurstoneMostellerFull, ThurstoneMostellerPart)
+from scipy import special  # type: ignore
+
+from .rating_model import RatingModel
+
+OpenSkillModel = (
+    PlackettLuce
+    | BradleyTerryFull
+    | BradleyTerryPart
+    | ThurstoneMostellerFull
+    | ThurstoneMostellerPart
+)
+
+_DEFAULT_GAMMA = PlackettLuce().gamma
+_MODEL_PARAMETERS = [
+    "mu",
+    "sigma",
+    "beta",
+    "kappa",
+    "tau",
+    "margin",
+    "limit_sigma",
+    "balance",
+]
+
+
+def _phi_major(x: float) -> float:
+    return 0.5 * (1.0 + math.erf(x / math.sqrt(2.0)))
+
+
+class RatingStore(RatingModel):
+    """Rates the entities with one of the openskill models.
+
+    Matches between two teams are rated, ranked and predicted in closed form on
+    the arrays, as long as the model is a plackett luce model with the default
+    options. Anything else materializes openskill ratings for the duration of a
+    model call.
+    """
+
+    def __init__(self, model: OpenSkillModel):
+        super().__init__(model.mu, model.sigma)
+        self.model = model
+        self._closed_form = (
+            isinstance(model, PlackettLuce)
+            and model.gamma is _DEFAULT_GAMMA
+            and model.margin == 0.0
+            and not model.balance
+            and not model.limit_sigma
+        )
+
+    def parameters(self) -> dict[str, Any]:
+        """The keyword arguments that build the same openskill model again."""
+        return {x: getattr(self.model, x) for x in _MODEL_PARAMETERS}
+
+    def _team_ratings(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        count: int,
+    ) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+        """The summed mu and variance of each team."""
+        team_mus = np.bincount(groups, weights=mus, minlength=count)
+        team_variances = np.bincount(groups, weights=sigmas**2, minlength=count)
+        return team_mus.astype(np.float64), team_variances.astype(np.float64)
+
+    def _pairwise_wins(
+        self,
+        first_mus: npt.NDArray[np.float64],
+        first_spreads: npt.NDArray[np.float64],
+        second_mus: npt.NDArray[np.float64],
+        second_spreads: npt.NDArray[np.float64],
+    ) -> npt.NDArray[np.float64]:
+        """The probability of each first team beating its second team."""
+        return special.ndtr(  # pylint: disable=no-member
+            (first_mus - second_mus)
+            / np.sqrt(2.0 * self.model.beta**2 + first_spreads + second_spreads)
+        )
+
+    def predict_ranks(
+        self,
+        mus: npt.NDArray[np.float64],
+        sigmas: npt.NDArray[np.float64],
+        groups: npt.NDArray[np.intp],
+        group_matches: npt.NDArray[np.intp],
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """Predict the rank and probability of every team of many matches at once.
+
+        A balanced model weighs the members of a team, so its matches are left
+        to openskill one at a time.
+        """
+        if not self.model.balance:
+            return super().predict_ranks(mus, sigmas, groups, group_matches)
+        teams: list[list[Any]] = [[] for _ in group_matches]
+        for mu, sigma, group in zip(mus.tolist(), sigmas.tolist(), groups.tolist()):
+            teams[group].append(self.model.rating(mu=mu, sigma=sigma))
+        ranks = np.zeros(len(group_matches), dtype=np.int64)
+        probabilities = np.zeros(len(group_matches), dtype=np.float64)
+        boundaries = np.flatnonzero(np.diff(group_matches, prepend=-1, append=-1))
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            for group, (rank, probability) in enumerate(
+                self.model.predict_rank(teams[start:end]), start
+            ):
+                ranks[group] = rank
+                probabilities[group] = probability
+        return ranks, probabilities
+
+    def materialize(self, teams: list[list[int]]) -> list[list[Any]]:
+        """Build the openskill ratings of the teams of a match.
+
+        An entity that appears more than once in a match shares a single rating
+        object, as it did when the ratings were kept by name.
+        """
+        ratings: dict[int, Any] = {}
+        for code in {x for team in teams for x in team}:
+            ratings[code] = self.model.rating(
+                mu=float(self.mus[code]), sigma=float(self.sigmas[code])
+            )
+        return [[ratings[x] for x in team] for team in teams]
+
+    def _is_pair(self, teams: list[list[int]]) -> bool:
+        return (
+            self._closed_form and len(teams) == 2 and bool(teams[0]) and bool(teams[1])
+        )
+
+    def _is_distinct_pair(
+        self, teams: list[list[int]], scores: list[float] | None
+    ) -> bool:
+        # An entity playing more than once in a match is left to openskill, which
+        # updates its single rating object once per appearance.
+        if not self._is_pair(teams):
+            return False
+        if len(set(teams[0]).union(teams[1])) != len(teams[0]) + len(teams[1]):
+            return False
+        return scores is None or (
+            len(scores) == 2
+            and all(isinstance(x, (int, float)) and not math.isnan(x) for x in scores)
+        )
+
+    def _pair_spread(self, teams: list[list[int]]) -> tuple[float, float]:
+        # The lead of the summed mu of the first team over the second, and the
+        # spread of the difference in their performances.
+        first = np.asarray(teams[0])
+        second = np.asarray(teams[1])
+        first_sigma = self.sigmas[first]
+        second_sigma = self.sigmas[second]
+        c = math.sqrt(
+            2.0 * self.model.beta**2
+            + float(np.dot(first_sigma, first_sigma))
+            + float(np.dot(second_sigma, second_sigma))
+        )
+        return float(self.mus[first].sum()) - float(self.mus[second].sum()), c
+
+    def _predict_pair(self, teams: list[list[int]]) -> list[tuple[int, float]]:
+        lead, c = self._pair_spread(teams)
+        first_probability = _phi_major(lead / c)
+        second_probability = _phi_major(-lead / c)
+        total = first_probability + second_probability
+        first_probability /= total
+        second_probability /= total
+        if first_probability > second_probability:
+            return [(1, first_probability), (2, second_probability)]
+        if first_probability < second_probability:
+            return [(2, first_probability), (1, second_probability)]
+        return [(1, first_probability), (1, second_probability)]
+
+    def _rate_pair(self, teams: list[list[int]], scores: list[float] | None) -> None:
+        codes = np.asarray(teams[0] + teams[1])
+        sides = np.repeat([0, 1], [len(teams[0]), len(teams[1])])
+        mus = self.mus[codes]
+        sigmas_squared = self.sigmas[codes] ** 2 + self.model.tau**2
+        team_mus = np.bincount(sides, weights=mus, minlength=2)
+        team_sigmas_squared = np.bincount(sides, weights=sigmas_squared, minlength=2)
+        c = math.sqrt(float(team_sigmas_squared.sum()) + 2.0 * self.model.beta**2)
+        exponents = np.exp(team_mus / c)
+        probabilities = exponents / exponents.sum()
+        if scores is None or scores[0] != scores[1]:
+            # The first team wins unless the scores say otherwise.
+            winner = 1 if scores is not None and scores[1] > scores[0] else 0
+            loser = 1 - winner
+            omegas = np.empty(2)
+            omegas[winner] = 1.0 - probabilities[winner]
+            omegas[loser] = -probabilities[loser]
+        else:
+            omegas = 0.5 - probabilities
+        deltas = probabilities[0] * probabilities[1]
+        omegas = omegas * team_sigmas_squared / c
+        deltas = deltas * team_sigmas_squared / c**2 * np.sqrt(team_sigmas_squared) / c
+        shares = sigmas_squared / team_sigmas_squared[sides]
+        self.mus[codes] = mus + shares * omegas[sides]
+        self.sigmas[codes] = np.sqrt(sigmas_squared) * np.sqrt(
+            np.maximum(1.0 - shares * deltas[sides], self.model.kappa)
+        )
+
+    def predict_rank(self, teams: list[list[int]]) -> list[tuple[int, float]]:
+        """Predict the rank and probability of each team of a match."""
+        if self._is_pair(teams):
+            return self._predict_pair(teams)
+        return self.model.predict_rank(self.materialize(teams))
+
+    def predict_win(self, teams: list[list[int]]) -> list[float]:
+        """Predict the probability of each team of a match winning it."""
+        if self._is_pair(teams):
+            lead, c = self._pair_spread(teams)
+            probability = _phi_major(lead / c)
+            return [probability, 1.0 - probability]
+        return self.model.predict_win(self.materialize(teams))
+
+    def rate(self, teams: list[list[int]], scores: list[float] | None) -> None:
+        """Update the ratings of the teams of a match with its result."""
+        if self._is_distinct_pair(teams, scores):
+            self._rate_pair(teams, scores)
+            return
+        team_ratings: list[list[Any]] = self.model.rate(
+            self.materialize(teams), scores=scores
+        )
+        for team, ratings in zip(teams, team_ratings):
+            for code, rating in zip(team, ratings):
+                self.mus[code] = rating.mu
+                self.sigmas[code] = rating.sigma
@@ -0,0 +1,11 @@
+"""An enum containing the ways a skill window forgets old matches."""
+
+from enum import StrEnum, auto
+
+
+class RatingWindowMode(StrEnum):
+    """How a finite skill window lets go of the matches before it."""
+
+    REVERSE = auto()
+    CHECKPOINT = auto()
+    DECAY = auto()
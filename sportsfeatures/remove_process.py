@@ -6,8 +6,8 @@ import tqdm
 from .identifier import Identifier
 
 
-def remove_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Remove the features from the dataframe."""
+def removed_columns(identifiers: list[Identifier]) -> set[str]:
+    """Find the columns the remove process drops."""
     drop_columns: set[str] = set()
     for identifier in tqdm.tqdm(identifiers, desc="Removing features"):
         for feature_col in identifier.feature_columns:
@@ -25,4 +25,9 @@ def remove_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFr
             drop_columns.add(news.published_column)
             drop_columns.add(news.summary_column)
             drop_columns.add(news.source_column)
-    return df.drop(columns=list(drop_columns), errors="ignore")
+    return drop_columns
+
+
+def remove_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
+    """Remove the features from the dataframe."""
+    return df.drop(columns=list(removed_columns(identifiers)), errors="ignore")
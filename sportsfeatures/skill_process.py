@@ -1,18 +1,29 @@
 """Process the current dataframe by adding skill features."""
 
-# pylint: disable=duplicate-code,too-many-locals,too-many-statements,too-many-branches,too-many-nested-blocks
+# pylint: disable=duplicate-code,too-many-locals,too-many-statements,too-many-branches,too-many-nested-blocks,too-many-arguments,too-many-positional-arguments
 
 import datetime
 import logging
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+from joblib import Parallel, cpu_count, delayed  # type: ignore
 from tqdm import tqdm
 
-from .columns import DELIMITER
+from .block import append_block
+from .column_buffer import ColumnBuffer
+from .entity_interner import EntityInterner
 from .entity_type import EntityType
+from .feature_state import FeatureState
 from .identifier import Identifier
-from .null_check import is_null
-from .windowed_rating import WindowedRating
+from .identifier_plan import IdentifierPlan, compile_plans, iterate_rows
+from .match import Match
+from .match_components import match_entities, partition_matches
+from .multi_window_rating import MultiWindowRating
+from .rating_model_type import RatingModelType
+from .rating_window_mode import RatingWindowMode
+from .windowed_rating import RatingResult
 
 SKILL_COLUMN_PREFIX = "skill"
 SKILL_MU_COLUMN = "mu"
@@ -22,160 +33,290 @@ SKILL_PROBABILITY_COLUMN = "probability"
 TIME_SLICE_ALL = "all"
 
 
-def skill_process(
+def _write_result(
+    columns: ColumnBuffer,
+    row: int,
+    plan: IdentifierPlan,
+    window_id: str,
+    result: tuple[float, float, int, float],
+) -> None:
+    mu, sigma, ranking, prob = result
+    columns.set(
+        plan.output_column(SKILL_COLUMN_PREFIX, window_id, SKILL_MU_COLUMN),
+        row,
+        mu,
+    )
+    columns.set(
+        plan.output_column(SKILL_COLUMN_PREFIX, window_id, SKILL_SIGMA_COLUMN),
+        row,
+        sigma,
+    )
+    columns.set(
+        plan.output_column(SKILL_COLUMN_PREFIX, window_id, SKILL_RANKING_COLUMN),
+        row,
+        ranking,
+        dtype=np.int64,
+    )
+    columns.set(
+        plan.output_column(SKILL_COLUMN_PREFIX, window_id, SKILL_PROBABILITY_COLUMN),
+        row,
+        prob,
+    )
+
+
+WindowResults = dict[
+    datetime.timedelta | None, tuple[RatingResult, RatingResult, RatingResult]
+]
+
+
+def _write_match(
+    columns: ColumnBuffer,
+    index: int,
+    position: int,
+    window_results: WindowResults,
+    windows: list[datetime.timedelta | None],
+    window_ids: list[str],
+    plans: list[IdentifierPlan],
+    plan_codes: list[npt.NDArray[np.int32] | None],
+) -> None:
+    for window, window_id in zip(windows, window_ids):
+        if window not in window_results:
+            continue
+        team_result, player_result, coach_result = window_results[window]
+        results = {
+            EntityType.TEAM: team_result,
+            EntityType.PLAYER: player_result,
+            EntityType.COACH: coach_result,
+        }
+        for plan, codes in zip(plans, plan_codes):
+            if codes is None or codes[position] < 0:
+                continue
+            result = results[plan.entity_type].get(int(codes[position]))
+            if result is not None:
+                _write_result(columns, index, plan, window_id, result)
+
+
+def _rate_matches(
+    matches: list[Match],
+    ratings: MultiWindowRating,
+    positions: npt.NDArray[np.intp] | None = None,
+) -> tuple[dict[int, WindowResults], MultiWindowRating]:
+    # Only the matches at the positions are rated, the rest are just logged.
+    rated = np.ones(len(matches), dtype=np.bool_)
+    if positions is not None:
+        rated[:] = False
+        rated[positions] = True
+    results = {}
+    for position, match in enumerate(
+        tqdm(matches, desc="Skill Processing", total=len(matches))
+    ):
+        match_results = ratings.add_match(match, rate=bool(rated[position]))
+        if match_results:
+            results[position] = match_results
+    return results, ratings
+
+
+def _parallel_rate_matches(
+    matches: list[Match],
+    ratings: MultiWindowRating,
+    entities: EntityInterner,
+) -> dict[int, WindowResults]:
+    # Windows are rated apart from each other, and within a window the groups of
+    # entities that never meet, taking the logged history into account, are too.
+    history = ratings.matches
+    logged = history + matches
+    groups: list[npt.NDArray[np.intp]] = []
+    group_entities: list[npt.NDArray[np.intp]] = []
+    for partition in partition_matches(logged, len(entities), cpu_count()):
+        codes = np.fromiter(
+            (y for x in partition for y in match_entities(logged[x])), dtype=np.intp
+        )
+        positions = partition[partition >= len(history)] - len(history)
+        if len(positions) or not groups:
+            groups.append(positions)
+            group_entities.append(codes)
+        else:
+            # Only the logged history touches these entities, which every worker
+            # reverses alike, so any of them can hand the ratings back.
+            group_entities[0] = np.concatenate([group_entities[0], codes])
+    window_parts = ratings.split()
+    if len(window_parts) * len(groups) < 2:
+        return _rate_matches(matches, ratings)[0]
+    outputs = Parallel(n_jobs=-1)(
+        delayed(_rate_matches)(matches, x.copy(), y)
+        for x in window_parts
+        for y in groups
+    )
+    results: dict[int, WindowResults] = {}
+    for count, window_part in enumerate(window_parts):
+        group_outputs = outputs[count * len(groups) : (count + 1) * len(groups)]
+        window_part.merge_components([x[1] for x in group_outputs], group_entities)
+        for group_results, _ in group_outputs:
+            for position, match_results in group_results.items():
+                results.setdefault(position, {}).update(match_results)
+    ratings.merge(window_parts)
+    return results
+
+
+def skill_block(
     df: pd.DataFrame,
     dt_column: str,
     identifiers: list[Identifier],
     windows: list[datetime.timedelta | None],
+    state: FeatureState | None = None,
+    use_multiprocessing: bool = False,
+    checkpoint_interval: datetime.timedelta | None = None,
+    window_modes: dict[datetime.timedelta, RatingWindowMode] | None = None,
+    ratings: MultiWindowRating | None = None,
+    start_dt: datetime.datetime | None = None,
+    rating_models: dict[EntityType, RatingModelType] | None = None,
+    score_only: bool = False,
 ) -> pd.DataFrame:
-    """Add skill features to the dataframe."""
+    """Compute the block of skill feature columns.
+
+    With use_multiprocessing the rows are split into groups whose teams, players
+    and coaches never meet, and each group is rated for each window in its own
+    worker. Ratings never flow between the groups, so the results are the same
+    as rating every row in order.
+
+    Finite windows reverse the matches that leave them, unless a checkpoint
+    interval is given, in which case they are rebuilt from the matches inside
+    the window at the start of every interval. The window modes pick either of
+    these or a decaying rating per window.
+
+    Ratings warmed up beforehand, such as those loaded from a snapshot, are used
+    in place of the ratings of the state. Rows before the start time are left
+    without features, as their matches are taken to be in the ratings already.
+
+    The rating models pick the model of each entity type in new windows, such as
+    elo or glicko-2 for entity types where throughput matters more than fidelity.
+
+    With score_only the ratings are frozen, and every row is predicted from them
+    at once without being rated, such as for upcoming fixtures.
+    """
     logging.info("Starting skill processing")
     tqdm.pandas(desc="Skill Features")
-    df_dict: dict[str, list[float | None]] = {}
-    df_cols = df.columns.values.tolist()
+    columns = ColumnBuffer(df.index)
+    plans = [
+        x
+        for x in compile_plans(identifiers)
+        if x.entity_type in {EntityType.TEAM, EntityType.PLAYER, EntityType.COACH}
+    ]
+    row_columns: list[str | None] = [dt_column]
+    for identifier in identifiers:
+        row_columns.extend(
+            [
+                identifier.column,
+                identifier.points_column,
+                identifier.team_identifier_column,
+            ]
+        )
 
     team_identifiers = [x for x in identifiers if x.entity_type == EntityType.TEAM]
     player_identifiers = [x for x in identifiers if x.entity_type == EntityType.PLAYER]
     coach_identifiers = [x for x in identifiers if x.entity_type == EntityType.COACH]
-    rating_windows = [WindowedRating(x, dt_column) for x in windows]
-
-    written_columns = set()
-    for row in tqdm(df.itertuples(name=None), desc="Skill Processing", total=len(df)):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
+    if ratings is None:
+        ratings = state.ratings if state is not None else MultiWindowRating()
+    entities = ratings.entities
+    default_mode = (
+        RatingWindowMode.REVERSE
+        if checkpoint_interval is None
+        else RatingWindowMode.CHECKPOINT
+    )
+    for window in windows:
+        mode = default_mode
+        if window is not None and window_modes is not None:
+            mode = window_modes.get(window, default_mode)
+        ratings.rating_window(window, mode, checkpoint_interval, rating_models)
+    rows_df = df if start_dt is None else df[df[dt_column] >= start_dt]
+    plan_codes = entities.identifier_codes(rows_df, [x.identifier for x in plans])
+    window_ids = [TIME_SLICE_ALL if x is None else f"window{x.days}" for x in windows]
 
-        for rating_window in rating_windows:
-            window_id = (
-                TIME_SLICE_ALL
-                if rating_window.window is None
-                else f"window{rating_window.window.days}"
+    rows = iterate_rows(rows_df, row_columns)
+    if use_multiprocessing or score_only:
+        indexes = []
+        matches = []
+        for index, row_dict in rows:
+            indexes.append(index)
+            matches.append(
+                ratings.resolve(
+                    row_dict,
+                    dt_column,
+                    team_identifiers,
+                    player_identifiers,
+                    coach_identifiers,
+                )
             )
-            team_result, player_result, coach_result = rating_window.add(
-                row_dict, team_identifiers, player_identifiers, coach_identifiers
+        if score_only:
+            match_results = dict(enumerate(ratings.predict_matches(matches)))
+        else:
+            match_results = _parallel_rate_matches(matches, ratings, entities)
+        for position, index in enumerate(indexes):
+            _write_match(
+                columns,
+                index,
+                position,
+                match_results.get(position, {}),
+                windows,
+                window_ids,
+                plans,
+                plan_codes,
             )
-            for team_identifier in team_identifiers:
-                if team_identifier.column not in row_dict:
-                    continue
-                team_id = row_dict[team_identifier.column]
-                if is_null(team_id):
-                    continue
-                if team_id in team_result:
-                    rating, ranking, prob = team_result[team_id]
-                    window_prefix = DELIMITER.join(
-                        [team_identifier.column_prefix, SKILL_COLUMN_PREFIX, window_id]
-                    )
-
-                    mu_col = DELIMITER.join([window_prefix, SKILL_MU_COLUMN])
-                    if mu_col not in df_dict:
-                        df_dict[mu_col] = [None for _ in range(len(df))]
-                    df_dict[mu_col][row[0]] = rating.mu
-                    written_columns.add(mu_col)
-
-                    sigma_col = DELIMITER.join([window_prefix, SKILL_SIGMA_COLUMN])
-                    if sigma_col not in df_dict:
-                        df_dict[sigma_col] = [None for _ in range(len(df))]
-                    df_dict[sigma_col][row[0]] = rating.sigma
-                    written_columns.add(sigma_col)
-
-                    ranking_col = DELIMITER.join([window_prefix, SKILL_RANKING_COLUMN])
-                    if ranking_col not in df_dict:
-                        df_dict[ranking_col] = [None for _ in range(len(df))]
-                    df_dict[ranking_col][row[0]] = ranking
-                    written_columns.add(ranking_col)
-
-                    prob_col = DELIMITER.join([window_prefix, SKILL_PROBABILITY_COLUMN])
-                    if prob_col not in df_dict:
-                        df_dict[prob_col] = [None for _ in range(len(df))]
-                    df_dict[prob_col][row[0]] = prob
-                    written_columns.add(prob_col)
-                for player_identifier in player_identifiers:
-                    if player_identifier.column not in row_dict:
-                        continue
-                    player_id = row_dict[player_identifier.column]
-                    if is_null(player_id):
-                        continue
-                    if player_id in player_result:
-                        rating, ranking, prob = team_result[player_id]
-                        window_prefix = DELIMITER.join(
-                            [
-                                player_identifier.column_prefix,
-                                SKILL_COLUMN_PREFIX,
-                                window_id,
-                            ]
-                        )
-
-                        mu_col = DELIMITER.join([window_prefix, SKILL_MU_COLUMN])
-                        if mu_col not in df_dict:
-                            df_dict[mu_col] = [None for _ in range(len(df))]
-                        df_dict[mu_col][row[0]] = rating.mu
-                        written_columns.add(mu_col)
-
-                        sigma_col = DELIMITER.join([window_prefix, SKILL_SIGMA_COLUMN])
-                        if sigma_col not in df_dict:
-                            df_dict[sigma_col] = [None for _ in range(len(df))]
-                        df_dict[sigma_col][row[0]] = rating.sigma
-                        written_columns.add(sigma_col)
-
-                        ranking_col = DELIMITER.join(
-                            [window_prefix, SKILL_RANKING_COLUMN]
-                        )
-                        if ranking_col not in df_dict:
-                            df_dict[ranking_col] = [None for _ in range(len(df))]
-                        df_dict[ranking_col][row[0]] = ranking
-                        written_columns.add(ranking_col)
-
-                        prob_col = DELIMITER.join(
-                            [window_prefix, SKILL_PROBABILITY_COLUMN]
-                        )
-                        if prob_col not in df_dict:
-                            df_dict[prob_col] = [None for _ in range(len(df))]
-                        df_dict[prob_col][row[0]] = prob
-                        written_columns.add(prob_col)
-
-                for coach_identifier in coach_identifiers:
-                    if coach_identifier.column not in row_dict:
-                        continue
-                    coach_id = row_dict[coach_identifier.column]
-                    if is_null(coach_id):
-                        continue
-                    if coach_id in coach_result:
-                        rating, ranking, prob = team_result[coach_id]
-                        window_prefix = DELIMITER.join(
-                            [
-                                coach_identifier.column_prefix,
-                                SKILL_COLUMN_PREFIX,
-                                window_id,
-                            ]
-                        )
-
-                        mu_col = DELIMITER.join([window_prefix, SKILL_MU_COLUMN])
-                        if mu_col not in df_dict:
-                            df_dict[mu_col] = [None for _ in range(len(df))]
-                        df_dict[mu_col][row[0]] = rating.mu
-                        written_columns.add(mu_col)
-
-                        sigma_col = DELIMITER.join([window_prefix, SKILL_SIGMA_COLUMN])
-                        if sigma_col not in df_dict:
-                            df_dict[sigma_col] = [None for _ in range(len(df))]
-                        df_dict[sigma_col][row[0]] = rating.sigma
-                        written_columns.add(sigma_col)
-
-                        ranking_col = DELIMITER.join(
-                            [window_prefix, SKILL_RANKING_COLUMN]
-                        )
-                        if ranking_col not in df_dict:
-                            df_dict[ranking_col] = [None for _ in range(len(df))]
-                        df_dict[ranking_col][row[0]] = ranking
-                        written_columns.add(ranking_col)
-
-                        prob_col = DELIMITER.join(
-                            [window_prefix, SKILL_PROBABILITY_COLUMN]
-                        )
-                        if prob_col not in df_dict:
-                            df_dict[prob_col] = [None for _ in range(len(df))]
-                        df_dict[prob_col][row[0]] = prob
-                        written_columns.add(prob_col)
-
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
-
-    return df[sorted(df.columns.values.tolist())]
+    else:
+        # Each row is written as soon as it is rated, so that only the windows
+        # are held on to between rows.
+        for position, (index, row_dict) in enumerate(
+            tqdm(rows, desc="Skill Processing", total=len(rows_df))
+        ):
+            _write_match(
+                columns,
+                index,
+                position,
+                ratings.add(
+                    row_dict,
+                    dt_column,
+                    team_identifiers,
+                    player_identifiers,
+                    coach_identifiers,
+                ),
+                windows,
+                window_ids,
+                plans,
+                plan_codes,
+            )
+
+    return columns.to_frame()
+
+
+def skill_process(
+    df: pd.DataFrame,
+    dt_column: str,
+    identifiers: list[Identifier],
+    windows: list[datetime.timedelta | None],
+    state: FeatureState | None = None,
+    use_multiprocessing: bool = False,
+    checkpoint_interval: datetime.timedelta | None = None,
+    window_modes: dict[datetime.timedelta, RatingWindowMode] | None = None,
+    ratings: MultiWindowRating | None = None,
+    start_dt: datetime.datetime | None = None,
+    rating_models: dict[EntityType, RatingModelType] | None = None,
+    score_only: bool = False,
+) -> pd.DataFrame:
+    """Add skill features to the dataframe."""
+    return append_block(
+        df,
+        skill_block(
+            df,
+            dt_column,
+            identifiers,
+            windows,
+            state=state,
+            use_multiprocessing=use_multiprocessing,
+            checkpoint_interval=checkpoint_interval,
+            window_modes=window_modes,
+            ratings=ratings,
+            start_dt=start_dt,
+            rating_models=rating_models,
+            score_only=score_only,
+        ),
+    )
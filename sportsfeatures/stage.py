@@ -0,0 +1,248 @@
+"""A dependency aware scheduler for the process stages."""
+
+# pylint: disable=too-few-public-methods,too-many-arguments,too-many-positional-arguments,too-many-locals
+import functools
+import glob
+import logging
+import os
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import pandas as pd
+
+from .performance_report import PerformanceReport, StageReport
+
+
+class Stage:
+    """A stage of the process pipeline along with the columns it touches.
+
+    The reads can be a set of columns, None for the whole dataframe, or a
+    function picking the columns to read from the columns present when the
+    stage runs. A block stage returns only the columns it adds or replaces.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[[pd.DataFrame], pd.DataFrame],
+        reads: set[str] | Callable[[list[str]], set[str]] | None = None,
+        writes: set[str] | None = None,
+        block: bool = False,
+    ):
+        self.name = name
+        self.function = function
+        self.reads = reads
+        self.writes = writes if writes is not None else set()
+        self.block = block
+
+    def depends_on(self, other: "Stage") -> bool:
+        """Whether this stage has to run after an earlier stage."""
+        if not isinstance(self.reads, set) or not isinstance(other.reads, set):
+            # A stage without a fixed set of reads is ordered against every other.
+            return True
+        return bool(other.writes & (self.reads | self.writes)) or bool(
+            self.writes & other.reads
+        )
+
+
+def _stage_levels(stages: list[Stage]) -> list[list[Stage]]:
+    levels: list[int] = []
+    for count, stage in enumerate(stages):
+        level = 0
+        for other_count in range(count):
+            if stage.depends_on(stages[other_count]):
+                level = max(level, levels[other_count] + 1)
+        levels.append(level)
+    return [
+        [x for count, x in enumerate(stages) if levels[count] == level]
+        for level in range(max(levels, default=-1) + 1)
+    ]
+
+
+def _workers(n_jobs: int, stages: int) -> int:
+    # The number of threads for a level, counting negative n_jobs back from the
+    # number of CPUs the way joblib does.
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(min(n_jobs, stages), 1)
+
+
+def _children() -> dict[int, list[str]]:
+    # The /proc stat fields after the command of each live child process, which
+    # is empty where there is no /proc.
+    children = {}
+    for path in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        try:
+            with open(path, encoding="utf8") as handle:
+                pids = [int(x) for x in handle.read().split()]
+        except OSError:
+            continue
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/stat", encoding="utf8") as handle:
+                    children[pid] = handle.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+    return children
+
+
+def _worker_cpu_time() -> float:
+    # The CPU time of the child processes, those reaped along with those alive.
+    reaped = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ticks = os.sysconf("SC_CLK_TCK")
+    return (
+        reaped.ru_utime
+        + reaped.ru_stime
+        + sum(int(x[11]) + int(x[12]) for x in _children().values()) / ticks
+    )
+
+
+def _worker_peak_memory() -> int:
+    # The largest peak resident memory in bytes of any child process so far.
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    for pid in _children():
+        try:
+            with open(f"/proc/{pid}/status", encoding="utf8") as handle:
+                for line in handle:
+                    if line.startswith("VmHWM:"):
+                        peak = max(peak, int(line.split()[1]) * 1024)
+        except OSError:
+            continue
+    return peak
+
+
+def _frame(
+    columns: dict[str, pd.Series], index: pd.Index, keep: set[str] | None = None
+) -> pd.DataFrame:
+    return pd.DataFrame(
+        {x: columns[x] for x in sorted(columns) if keep is None or x in keep},
+        index=index,
+    )
+
+
+def _run_stage(
+    stage: Stage,
+    columns: dict[str, pd.Series],
+    index: pd.Index,
+    report: PerformanceReport | None = None,
+) -> tuple[pd.DataFrame, set[str]]:
+    start_time = time.perf_counter()
+    start_cpu_time = time.thread_time()
+    start_memory = 0
+    start_worker_cpu_time = 0.0
+    if report is not None:
+        start_worker_cpu_time = _worker_cpu_time()
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    if stage.reads is None:
+        input_df = _frame(columns, index)
+    elif isinstance(stage.reads, set):
+        input_df = _frame(columns, index, stage.reads)
+    else:
+        input_df = _frame(columns, index, stage.reads(list(columns)))
+    input_columns = set(input_df.columns.values.tolist())
+    output_df = stage.function(input_df)
+    dropped_columns: set[str] = set()
+    if not stage.block:
+        dropped_columns = input_columns - set(output_df.columns.values.tolist())
+        if stage.reads is not None:
+            output_df = output_df[
+                [
+                    x
+                    for x in output_df.columns.values.tolist()
+                    if x not in input_columns or x in stage.writes
+                ]
+            ]
+    added_columns = len(
+        [x for x in output_df.columns.values.tolist() if x not in input_columns]
+    )
+    end_time = time.perf_counter()
+    logging.info("%s process time: %.6f", stage.name, end_time - start_time)
+    if report is not None:
+        report.stages.append(
+            StageReport(
+                stage.name,
+                end_time - start_time,
+                time.thread_time() - start_cpu_time,
+                tracemalloc.get_traced_memory()[1] - start_memory,
+                len(input_df),
+                len(input_columns),
+                len(output_df),
+                len(output_df.columns),
+                added_columns,
+                max(_worker_cpu_time() - start_worker_cpu_time, 0.0),
+            )
+        )
+    return output_df, dropped_columns
+
+
+def _run_level(
+    level: list[Stage],
+    columns: dict[str, pd.Series],
+    index: pd.Index,
+    n_jobs: int,
+    report: PerformanceReport | None,
+) -> list[tuple[pd.DataFrame, set[str]]]:
+    run_stage = functools.partial(
+        _run_stage, columns=columns, index=index, report=report
+    )
+    workers = _workers(n_jobs, len(level))
+    if workers == 1:
+        return [run_stage(x) for x in level]
+    # A plain thread pool rather than a joblib one, as the joblib pools inside
+    # the stages fall back to running in the calling process when nested in
+    # another joblib pool.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_stage, level))
+
+
+def run_stages(
+    df: pd.DataFrame,
+    stages: list[Stage],
+    n_jobs: int = 1,
+    report: PerformanceReport | None = None,
+) -> pd.DataFrame:
+    """Run the stages over the dataframe, concurrently where they are independent.
+
+    The columns are carried between stages individually and only assembled into
+    a dataframe, in sorted order, when a stage needs the whole of it or at the end.
+    The stages of a level run on up to n_jobs threads, and a level of a single
+    stage runs in the calling thread, so the stages can still hand their work to
+    worker processes. When a report is requested the stages run one at a time,
+    so the CPU time and traced memory of each stage can be attributed to it,
+    along with the CPU time of the worker processes the stage hands its work to.
+    """
+    start_tracing = report is not None and not tracemalloc.is_tracing()
+    if report is not None:
+        n_jobs = 1
+    if start_tracing:
+        tracemalloc.start()
+    columns: dict[str, pd.Series] = {x: df[x] for x in df.columns.values.tolist()}
+    index = df.index
+    frame: pd.DataFrame | None = None
+    try:
+        for level in _stage_levels(stages):
+            if len(level) == 1 and level[0].reads is None:
+                frame, _ = _run_stage(level[0], columns, index, report)
+                columns = {x: frame[x] for x in frame.columns.values.tolist()}
+                index = frame.index
+                continue
+            frame = None
+            for output_df, dropped_columns in _run_level(
+                level, columns, index, n_jobs, report
+            ):
+                for column in dropped_columns:
+                    columns.pop(column, None)
+                for column in output_df.columns.values.tolist():
+                    columns[column] = output_df[column]
+    finally:
+        if start_tracing:
+            tracemalloc.stop()
+        if report is not None:
+            report.worker_peak_memory = _worker_peak_memory()
+    if frame is not None and frame.columns.values.tolist() == sorted(columns):
+        return frame
+    return _frame(columns, index)
@@ -4,14 +4,14 @@
 
 
 class Team:
-    """Data about a team in a match."""
+    """Data about a team in a match, with its entities as interned codes."""
 
     def __init__(
         self,
-        players: list[str],
+        players: list[int],
         points: float | None,
-        identifier: str,
-        coaches: list[str],
+        identifier: int,
+        coaches: list[int],
     ):
         self.players = players
         self.points = points
@@ -0,0 +1,10 @@
+"""An enum containing the backends for computing timeseries features."""
+
+from enum import StrEnum, auto
+
+
+class TimeseriesBackend(StrEnum):
+    """The backend computing the lag and rolling features."""
+
+    TIMESERIESFEATURES = auto()
+    MEMORY = auto()
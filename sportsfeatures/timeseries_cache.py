@@ -0,0 +1,77 @@
+"""A persistent cache of the timeseries features of each entity."""
+
+import hashlib
+import os
+import tempfile
+
+import pandas as pd
+
+from .cache import sportsfeatures_cache_folder
+
+_TIMESERIES_CACHE_FOLDER = "timeseries"
+_DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+
+class TimeseriesCache:
+    """Stores the features of an entity keyed by a fingerprint of its series.
+
+    An entity whose series and feature configuration are unchanged since a
+    previous run reuses its features instead of recomputing them. Once the
+    folder grows past max_size bytes the least recently used entries are removed.
+    """
+
+    def __init__(self, folder: str | None = None, max_size: int = _DEFAULT_MAX_SIZE):
+        if folder is None:
+            folder = os.path.join(
+                sportsfeatures_cache_folder(), _TIMESERIES_CACHE_FOLDER
+            )
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_size = max_size
+
+    def fingerprint(self, entity_df: pd.DataFrame, config: str) -> str:
+        """The key of an entity series under a feature configuration."""
+        entity_hash = hashlib.sha256(config.encode())
+        entity_hash.update("\0".join(map(str, entity_df.columns)).encode())
+        entity_hash.update(str(entity_df.dtypes.tolist()).encode())
+        entity_hash.update(
+            pd.util.hash_pandas_object(entity_df, index=True).to_numpy().tobytes()
+        )
+        return entity_hash.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + ".parquet")
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        """Find the features stored under a key."""
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> None:
+        """Store the features of an entity under a key."""
+        handle, tmp_path = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        os.close(handle)
+        df.to_parquet(tmp_path)
+        os.replace(tmp_path, self._path(key))
+
+    def prune(self) -> None:
+        """Remove the least recently used entries until under the size limit."""
+        entries = []
+        for item in os.scandir(self.folder):
+            if item.is_file() and item.name.endswith(".parquet"):
+                stat = item.stat()
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+        size = sum(x[1] for x in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
@@ -1,193 +1,884 @@
 """Processing for time series features."""
 
-# pylint: disable=duplicate-code,too-many-branches,too-many-nested-blocks,too-many-locals,redefined-outer-name,reimported,import-outside-toplevel
+# pylint: disable=duplicate-code,too-many-branches,too-many-nested-blocks,too-many-locals,redefined-outer-name,reimported,import-outside-toplevel,too-many-arguments,too-many-positional-arguments
 
 import datetime
 import os
 import tempfile
-from warnings import simplefilter
+from typing import Iterable, Iterator, TypeVar
 
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+import pyarrow as pa  # type: ignore
 from joblib import Parallel, delayed  # type: ignore
+from timeseriesfeatures import non_categorical_numeric_columns  # type: ignore
+from timeseriesfeatures.columns import ALL_SUFFIX  # type: ignore
+from timeseriesfeatures.columns import (DAYS_COLUMN_SUFFIX, DELIMITER,
+                                        LAG_COLUMN, TRANSFORM_COLUMN,
+                                        WINDOW_FUNCTIONS)
 from timeseriesfeatures.feature import FEATURE_TYPE_LAG  # type: ignore
 from timeseriesfeatures.feature import (FEATURE_TYPE_ROLLING, VALUE_TYPE_DAYS,
                                         VALUE_TYPE_NONE, Feature)
 from timeseriesfeatures.transform import Transform  # type: ignore
 from tqdm import tqdm
 
-from .columns import DELIMITER
+from .block import append_block
+from .entity_interner import EntityInterner
 from .entity_type import EntityType
+from .ewm_rows import EwmRows
+from .ewm_state import EwmState
+from .expanding_state import ExpandingState
+from .feature_state import FeatureState
 from .identifier import Identifier
-from .null_check import is_null
+from .identifier_plan import compile_plans
+from .timeseries_backend import TimeseriesBackend
+from .timeseries_cache import TimeseriesCache
+from .timeseries_spec import TimeseriesSpec, check_halflives
 
 _COLUMN_PREFIX_COLUMN = "_column_prefix"
+_ENTITY_COLUMN = "_entity"
+_ROW_COLUMN = "_row"
+_ORDER_COLUMN = "_order"
+_FEATURE_COLUMN = "_feature"
+_VALUE_COLUMN = "_value"
+_LAGS = [1, 2, 4, 8]
+BATCH_ROWS = 50_000
+_EWM_FUNCTIONS = ["ewmmean", "ewmvar"]
+_T = TypeVar("_T")
 
 
-def _pool_process(
-    parquet_file: str,
+def _process_batch(
+    ts_df: pd.DataFrame,
+    entity_columns: dict[str, list[str]],
     features: list[Feature],
     dt_column: str,
-) -> None:
-    import pandas as pd
+) -> tuple[pd.DataFrame, dict[str, list[str]]]:
     from timeseriesfeatures.process import process  # type: ignore
 
-    df = pd.read_parquet(parquet_file)
-    original_identifier_df = df.copy()
-    drop_columns = df.columns.values.tolist()
-    if "" in drop_columns:
-        drop_columns.remove("")
-    drop_columns.remove("_column_prefix")
-    df = process(df, features=features, on=dt_column).drop(columns=drop_columns)
-    df["_column_prefix"] = original_identifier_df["_column_prefix"]
-    df.to_parquet(parquet_file)
-
-
-def _extract_identifier_timeseries(
-    df: pd.DataFrame, identifiers: list[Identifier], dt_column: str, tmpdir: str
-) -> None:
-    tqdm.pandas(desc="Timeseries Progress")
-    identifier_ts: dict[str, pd.DataFrame] = {}
+    feature_dfs = []
+    feature_columns = {}
+    for entity, entity_df in ts_df.groupby(_ENTITY_COLUMN, sort=False):
+        entity_df = entity_df[entity_columns[str(entity)]]
+        drop_columns = [
+            x for x in entity_df.columns if x not in {"", _COLUMN_PREFIX_COLUMN}
+        ]
+        feature_df = process(entity_df.copy(), features=features, on=dt_column).drop(
+            columns=drop_columns
+        )
+        feature_df[_COLUMN_PREFIX_COLUMN] = entity_df[_COLUMN_PREFIX_COLUMN]
+        feature_columns[str(entity)] = feature_df.columns.values.tolist()
+        feature_df[_ENTITY_COLUMN] = entity
+        feature_dfs.append(feature_df)
+    return pd.concat(feature_dfs), feature_columns
+
+
+def _write_ipc(df: pd.DataFrame, path: str) -> None:
+    table = pa.Table.from_pandas(df)
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_ipc(path: str) -> pd.DataFrame:
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _pool_process(
+    batch_file: str,
+    entity_columns: dict[str, list[str]],
+    features: list[Feature],
+    dt_column: str,
+) -> dict[str, list[str]]:
+    feature_df, feature_columns = _process_batch(
+        _read_ipc(batch_file), entity_columns, features, dt_column
+    )
+    _write_ipc(feature_df, batch_file)
+    return feature_columns
+
+
+def _trim_history(
+    identifier_df: pd.DataFrame,
+    windows: list[datetime.timedelta | None],
+    dt_column: str,
+    lags: list[int],
+) -> pd.DataFrame:
+    # Keep only the rows any lag or window could still reach, the all-time window
+    # being carried by the expanding state instead.
+    keep = identifier_df.index >= len(identifier_df) - max(lags, default=0)
+    day_windows = [x for x in windows if x is not None]
+    if day_windows:
+        dts = pd.to_datetime(identifier_df[dt_column])
+        keep |= (dts > dts.iloc[-1] - max(day_windows)).to_numpy()
+    return identifier_df[keep]
+
+
+def _window_column(window: datetime.timedelta | None) -> str:
+    return ALL_SUFFIX if window is None else str(window.days) + DAYS_COLUMN_SUFFIX
+
+
+def _resolve_spec(
+    spec: TimeseriesSpec | None,
+    windows: list[datetime.timedelta | None],
+    halflives: list[datetime.timedelta],
+) -> TimeseriesSpec:
+    if spec is None:
+        spec = TimeseriesSpec()
+    return TimeseriesSpec(
+        lags=_LAGS if spec.lags is None else spec.lags,
+        windows=windows if spec.windows is None else spec.windows,
+        aggregations=WINDOW_FUNCTIONS
+        if spec.aggregations is None
+        else spec.aggregations,
+        halflives=halflives if spec.halflives is None else spec.halflives,
+    )
+
+
+def _spec_columns(column: str, spec: TimeseriesSpec) -> list[str]:
+    transform = str(Transform.NONE)
+    return (
+        [
+            DELIMITER.join([column, TRANSFORM_COLUMN, transform, LAG_COLUMN, str(x)])
+            for x in spec.lags or []
+        ]
+        + [
+            DELIMITER.join([column, TRANSFORM_COLUMN, transform, y, _window_column(x)])
+            for x in spec.windows or []
+            for y in spec.aggregations or []
+        ]
+        + [
+            DELIMITER.join([column, TRANSFORM_COLUMN, transform, y, _window_column(x)])
+            for x in spec.halflives or []
+            for y in _EWM_FUNCTIONS
+        ]
+    )
+
+
+def _union(first: list[_T] | None, second: list[_T] | None) -> list[_T]:
+    return list(dict.fromkeys((first or []) + (second or [])))
+
+
+def _timeseries_specs(
+    identifiers: list[Identifier],
+    windows: list[datetime.timedelta | None],
+    halflives: list[datetime.timedelta],
+) -> tuple[dict[str, TimeseriesSpec] | None, dict[str, set[str]] | None]:
+    """Merge the specs of every identifier.
+
+    Returns the union of the specs each entity column is computed with, and the
+    feature columns each column prefix keeps, or None for both when no identifier
+    has a spec.
+    """
+    if all(x.timeseries_spec is None and not x.timeseries_specs for x in identifiers):
+        return None, None
+    plans = compile_plans(identifiers)
+    columns = list(
+        dict.fromkeys(y for x in plans for _, y in x.numeric_action_features if y)
+    )
+    feature_specs: dict[str, TimeseriesSpec] = {}
+    prefix_features: dict[str, set[str]] = {}
+    for plan in plans:
+        column_specs = {
+            y: plan.identifier.timeseries_specs[x]
+            for x, y in plan.numeric_action_features
+            if x in plan.identifier.timeseries_specs
+        }
+        allowed_features = prefix_features.setdefault(plan.column_prefix, set())
+        for column in columns:
+            spec = _resolve_spec(
+                column_specs.get(column, plan.identifier.timeseries_spec),
+                windows,
+                halflives,
+            )
+            allowed_features.update(_spec_columns(column, spec))
+            feature_spec = feature_specs.get(column)
+            if feature_spec is not None:
+                spec = TimeseriesSpec(
+                    lags=_union(feature_spec.lags, spec.lags),
+                    windows=_union(feature_spec.windows, spec.windows),
+                    aggregations=_union(feature_spec.aggregations, spec.aggregations),
+                    halflives=_union(feature_spec.halflives, spec.halflives),
+                )
+            feature_specs[column] = spec
+    return feature_specs, prefix_features
+
+
+def _identifier_timeseries(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    dt_column: str,
+    windows: list[datetime.timedelta | None] | None = None,
+    state: FeatureState | None = None,
+    lags: list[int] | None = None,
+) -> dict[str, pd.DataFrame]:
     team_identifiers = [x for x in identifiers if x.entity_type == EntityType.TEAM]
     player_identifiers = [x for x in identifiers if x.entity_type == EntityType.PLAYER]
     relevant_identifiers = team_identifiers + player_identifiers
-    df_cols = df.columns.values.tolist()
+    relevant_plans = compile_plans(relevant_identifiers)
+    entities = EntityInterner() if state is None else state.entities
+    identifier_codes = entities.identifier_codes(df, relevant_identifiers)
+    df_cols = set(df.columns.values.tolist())
+    row_positions = np.arange(len(df))
 
-    for row in tqdm(
-        df.itertuples(name=None), desc="Timeseries Progress", total=len(df)
+    # Melt every identifier into a long table of the values it has in each row.
+    entity_dfs = []
+    value_dfs = []
+    for count, (plan, codes) in enumerate(
+        tqdm(
+            zip(relevant_plans, identifier_codes),
+            desc="Timeseries Progress",
+            total=len(relevant_plans),
+        )
     ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
-        for identifier in relevant_identifiers:
-            if identifier.column not in row_dict:
-                continue
-            identifier_id = row_dict[identifier.column]
-            if is_null(identifier_id):
-                continue
-            key = DELIMITER.join([identifier.entity_type, identifier_id])
-            identifier_df = identifier_ts.get(key, pd.DataFrame())
-            identifier_df.loc[row[0], _COLUMN_PREFIX_COLUMN] = (  # type: ignore
-                identifier.column_prefix
+        if codes is None:
+            continue
+        mask = codes >= 0
+        entity_dfs.append(
+            pd.DataFrame(
+                {
+                    _ENTITY_COLUMN: codes[mask],
+                    _ROW_COLUMN: row_positions[mask],
+                    _ORDER_COLUMN: count,
+                    _COLUMN_PREFIX_COLUMN: plan.column_prefix,
+                }
+            )
+        )
+        value_columns = [
+            x for x, y in plan.numeric_action_features if y and x in df_cols
+        ]
+        if not value_columns:
+            continue
+        value_df = df.loc[mask, value_columns]
+        value_df.insert(0, _ENTITY_COLUMN, codes[mask])
+        value_df.insert(1, _ROW_COLUMN, row_positions[mask])
+        value_df.insert(2, _ORDER_COLUMN, count)
+        value_df = value_df.melt(
+            id_vars=[_ENTITY_COLUMN, _ROW_COLUMN, _ORDER_COLUMN],
+            value_vars=value_columns,
+            var_name=_FEATURE_COLUMN,
+            value_name=_VALUE_COLUMN,
+        )
+        value_df[_FEATURE_COLUMN] = value_df[_FEATURE_COLUMN].str.slice(
+            len(plan.column_prefix)
+        )
+        value_dfs.append(value_df[value_df[_VALUE_COLUMN].notna()])
+    if not entity_dfs:
+        return {}
+
+    # Where an entity appears more than once in a row the last identifier wins.
+    entity_df = (
+        pd.concat(entity_dfs)
+        .sort_values([_ROW_COLUMN, _ORDER_COLUMN], kind="stable")
+        .drop_duplicates([_ENTITY_COLUMN, _ROW_COLUMN], keep="last")
+    )
+    entity_df[dt_column] = df[dt_column].to_numpy()[entity_df[_ROW_COLUMN]]
+    wide_df = entity_df.set_index([_ENTITY_COLUMN, _ROW_COLUMN])[
+        [_COLUMN_PREFIX_COLUMN, dt_column]
+    ]
+    if value_dfs:
+        value_df = (
+            pd.concat(value_dfs)
+            .sort_values([_ROW_COLUMN, _ORDER_COLUMN], kind="stable")
+            .drop_duplicates(
+                [_ENTITY_COLUMN, _ROW_COLUMN, _FEATURE_COLUMN], keep="last"
+            )
+        )
+        wide_df = wide_df.join(
+            value_df.pivot(
+                index=[_ENTITY_COLUMN, _ROW_COLUMN],
+                columns=_FEATURE_COLUMN,
+                values=_VALUE_COLUMN,
             )
-            identifier_df.loc[row[0], dt_column] = row_dict[dt_column]  # type: ignore
-            for feature_column in identifier.numeric_action_columns:
-                if feature_column not in row_dict:
-                    continue
-                value = row_dict[feature_column]
-                if is_null(value):
-                    continue
-                column = feature_column[len(identifier.column_prefix) :]
-                if not column:
-                    continue
-                if column not in identifier_df:
-                    identifier_df[column] = None
-                identifier_df.loc[row[0], column] = value  # type: ignore
-            identifier_ts[key] = identifier_df.infer_objects()
+        )
+        wide_df.columns.name = None
+    wide_df = wide_df.sort_index()
+
+    identifier_ts: dict[int, pd.DataFrame] = {}
+    for code, identifier_df in wide_df.groupby(level=0, sort=False):
+        identifier_df = identifier_df.droplevel(0).dropna(axis=1, how="all")
+        identifier_df.index = df.index[identifier_df.index.to_numpy()]
+        identifier_ts[int(code)] = identifier_df.infer_objects()  # type: ignore
 
+    if state is not None:
+        entities.grow(state.identifier_ts, None)
+    entity_ts = {}
     for k, v in identifier_ts.items():
-        v.to_parquet(os.path.join(tmpdir, f"{k}.parquet"))
+        if state is not None:
+            # History rows get negative indexes so they are never written back.
+            history_df = state.identifier_ts[k]
+            if history_df is not None:
+                v = pd.concat([history_df, v]).infer_objects()
+            history_df = _trim_history(
+                v.reset_index(drop=True),
+                windows or [],
+                dt_column,
+                _LAGS if lags is None else lags,
+            )
+            history_df.index = pd.RangeIndex(-len(history_df), 0)
+            state.identifier_ts[k] = history_df
+        entity_ts[entities.keys[k]] = v
+    return entity_ts
 
 
-def _process_identifier_ts(
+def _entity_batches(
+    identifier_ts: dict[str, pd.DataFrame], batch_rows: int
+) -> Iterator[list[str]]:
+    batch: list[str] = []
+    rows = 0
+    for k, v in identifier_ts.items():
+        batch.append(k)
+        rows += len(v)
+        if rows >= batch_rows:
+            yield batch
+            batch = []
+            rows = 0
+    if batch:
+        yield batch
+
+
+def _timeseries_features(
     windows: list[datetime.timedelta | None],
-    dt_column: str,
-    use_multiprocessing: bool,
-    tmpdir: str,
-) -> None:
-    features = [
-        Feature(
-            feature_type=FEATURE_TYPE_LAG,
-            columns=[],
-            value1=1,
-            transform=str(Transform.NONE),
-        ),
-        Feature(
-            feature_type=FEATURE_TYPE_LAG,
-            columns=[],
-            value1=2,
-            transform=str(Transform.NONE),
-        ),
+    feature_specs: dict[str, TimeseriesSpec] | None,
+) -> list[Feature]:
+    # Without specs every lag and window applies to all the columns.
+    lag_columns: dict[int, list[str]] = {x: [] for x in _LAGS}
+    window_columns: dict[datetime.timedelta | None, list[str]] = {
+        x: [] for x in windows
+    }
+    if feature_specs is not None:
+        lag_columns = {}
+        window_columns = {}
+        for column, spec in feature_specs.items():
+            for lag in spec.lags or []:
+                lag_columns.setdefault(lag, []).append(column)
+            for window in spec.windows or []:
+                window_columns.setdefault(window, []).append(column)
+    return [
         Feature(
             feature_type=FEATURE_TYPE_LAG,
-            columns=[],
-            value1=4,
+            columns=v,
+            value1=k,
             transform=str(Transform.NONE),
-        ),
-        Feature(
-            feature_type=FEATURE_TYPE_LAG,
-            columns=[],
-            value1=8,
-            transform=str(Transform.NONE),
-        ),
+        )
+        for k, v in lag_columns.items()
     ] + [
         Feature(
             feature_type=FEATURE_TYPE_ROLLING,
-            columns=[],
-            value1=VALUE_TYPE_NONE if x is None else VALUE_TYPE_DAYS,
-            value2=None if x is None else x.days,
+            columns=v,
+            value1=VALUE_TYPE_NONE if k is None else VALUE_TYPE_DAYS,
+            value2=None if k is None else k.days,
             transform=str(Transform.NONE),
         )
-        for x in windows
-    ]
-    parquet_files = [
-        os.path.join(tmpdir, x) for x in os.listdir(tmpdir) if x.endswith(".parquet")
+        for k, v in window_columns.items()
     ]
+
+
+def _process_identifier_ts(
+    identifier_ts: dict[str, pd.DataFrame],
+    windows: list[datetime.timedelta | None],
+    dt_column: str,
+    use_multiprocessing: bool,
+    tmpdir: str,
+    batch_rows: int = BATCH_ROWS,
+    n_jobs: int = -1,
+    feature_specs: dict[str, TimeseriesSpec] | None = None,
+) -> dict[str, pd.DataFrame]:
+    features = _timeseries_features(windows, feature_specs)
+    batches = []
+    for batch in _entity_batches(identifier_ts, batch_rows):
+        ts_df = pd.concat(
+            [identifier_ts[x] for x in batch],
+            keys=batch,
+            names=[_ENTITY_COLUMN, None],
+        ).reset_index(level=0)
+        batches.append(
+            (ts_df, {x: identifier_ts[x].columns.values.tolist() for x in batch})
+        )
+
+    feature_batches = []
     if use_multiprocessing:
-        Parallel(n_jobs=-1)(
-            delayed(_pool_process)(x, features, dt_column) for x in parquet_files
+        # Each worker memory maps its batch of entities from an Arrow IPC file and
+        # writes the features of the batch back over it.
+        batch_files = [
+            os.path.join(tmpdir, f"{count}.arrow") for count in range(len(batches))
+        ]
+        for (ts_df, _), batch_file in zip(batches, batch_files):
+            _write_ipc(ts_df, batch_file)
+        batch_columns = Parallel(n_jobs=n_jobs)(
+            delayed(_pool_process)(x, entity_columns, features, dt_column)
+            for x, (_, entity_columns) in zip(batch_files, batches)
         )
+        feature_batches = [
+            (_read_ipc(x), y) for x, y in zip(batch_files, batch_columns)
+        ]
     else:
-        for parquet_file in parquet_files:
-            _pool_process(parquet_file, features, dt_column)
+        feature_batches = [
+            _process_batch(ts_df, entity_columns, features, dt_column)
+            for ts_df, entity_columns in batches
+        ]
+
+    entity_features = {}
+    for feature_df, feature_columns in feature_batches:
+        for entity, entity_df in feature_df.groupby(_ENTITY_COLUMN, sort=False):
+            entity_features[str(entity)] = entity_df[feature_columns[str(entity)]]
+    return entity_features
+
+
+def _memory_ts_features(
+    identifier_ts: dict[str, pd.DataFrame],
+    windows: list[datetime.timedelta | None],
+    dt_column: str,
+    feature_specs: dict[str, TimeseriesSpec] | None = None,
+) -> list[pd.DataFrame]:
+    if not identifier_ts:
+        return []
+    # Every entity in one long frame, each entity in a contiguous run of rows.
+    ts_df = pd.concat(
+        list(identifier_ts.values()),
+        keys=range(len(identifier_ts)),
+        names=[_ENTITY_COLUMN, None],
+    ).reset_index(level=0)
+    entity_codes = ts_df[_ENTITY_COLUMN].to_numpy()
+    first_rows = np.ones(len(ts_df), dtype=np.bool_)
+    first_rows[1:] = entity_codes[1:] != entity_codes[:-1]
+    groups = ts_df.groupby(_ENTITY_COLUMN, sort=False)
+    default_spec = _resolve_spec(None, windows, [])
+    feature_specs = feature_specs or {}
+    window_groups = {
+        x: groups.expanding() if x is None else groups.rolling(x, on=dt_column)
+        for x in dict.fromkeys(
+            [*windows, *(y for x in feature_specs.values() for y in x.windows or [])]
+        )
+    }
+
+    features = {}
+    feature_columns: dict[str, list[str]] = {}
+    present_rows = {}
+    for column in tqdm(
+        non_categorical_numeric_columns.find_non_categorical_numeric_columns(
+            ts_df.drop(columns=[_ENTITY_COLUMN])
+        ),
+        desc="Timeseries Features",
+    ):
+        # An entity without any value for a column gets no features from it.
+        missing = groups[column].transform("count").to_numpy() == 0
+        present_rows[column] = ~missing
+        feature_columns[column] = []
+        spec = feature_specs.get(column, default_spec)
+        for lag in spec.lags or []:
+            values = groups[column].shift(lag).to_numpy(dtype=np.float64)
+            values[missing] = np.nan
+            feature_column = DELIMITER.join(
+                [column, TRANSFORM_COLUMN, str(Transform.NONE), LAG_COLUMN, str(lag)]
+            )
+            features[feature_column] = values
+            feature_columns[column].append(feature_column)
+        for window in spec.windows or []:
+            window_group = window_groups[window]
+            for window_func in spec.aggregations or []:
+                values = np.empty(len(ts_df), dtype=np.float64)
+                values[1:] = getattr(window_group[column], window_func)().to_numpy(
+                    dtype=np.float64
+                )[:-1]
+                values[first_rows | missing] = np.nan
+                feature_column = DELIMITER.join(
+                    [
+                        column,
+                        TRANSFORM_COLUMN,
+                        str(Transform.NONE),
+                        window_func,
+                        _window_column(window),
+                    ]
+                )
+                features[feature_column] = values
+                feature_columns[column].append(feature_column)
+    return _prefix_features(
+        pd.DataFrame(features, index=ts_df.index),
+        ts_df[_COLUMN_PREFIX_COLUMN],
+        present_rows,
+        feature_columns,
+    )
+
+
+def _ewm_ts_features(
+    identifier_ts: dict[str, pd.DataFrame],
+    halflives: list[datetime.timedelta],
+    dt_column: str,
+    feature_specs: dict[str, TimeseriesSpec] | None,
+    ewm_state: EwmState,
+    codes: list[int],
+) -> list[pd.DataFrame]:
+    if not identifier_ts:
+        return []
+    ts_df = pd.concat(
+        list(identifier_ts.values()),
+        keys=codes,
+        names=[_ENTITY_COLUMN, None],
+    ).reset_index(level=0)
+    columns = non_categorical_numeric_columns.find_non_categorical_numeric_columns(
+        ts_df.drop(columns=[_ENTITY_COLUMN])
+    )
+    groups = ts_df.groupby(_ENTITY_COLUMN, sort=False)
+    present_rows = {x: groups[x].transform("count").to_numpy() > 0 for x in columns}
+    # History rows are already part of the state.
+    new_rows = ts_df.index.to_numpy() >= 0
+    ts_df = ts_df[new_rows]
+    means, variances = ewm_state.update(
+        EwmRows(
+            ts_df[_ENTITY_COLUMN].to_numpy(dtype=np.int64),
+            pd.to_datetime(ts_df[dt_column])
+            .to_numpy(dtype="datetime64[ns]")
+            .astype(np.int64)
+            / 1e9,
+            ts_df[columns].to_numpy(dtype=np.float64),
+            columns,
+        ),
+        halflives,
+    )
+
+    features = {}
+    feature_columns: dict[str, list[str]] = {}
+    for count, column in enumerate(columns):
+        present_rows[column] = present_rows[column][new_rows]
+        feature_columns[column] = []
+        spec_halflives = halflives
+        if feature_specs is not None and column in feature_specs:
+            spec_halflives = feature_specs[column].halflives or []
+        for halflife in spec_halflives:
+            halflife_count = halflives.index(halflife)
+            for ewm_func, values in zip(_EWM_FUNCTIONS, [means, variances]):
+                feature_column = DELIMITER.join(
+                    [
+                        column,
+                        TRANSFORM_COLUMN,
+                        str(Transform.NONE),
+                        ewm_func,
+                        _window_column(halflife),
+                    ]
+                )
+                column_values = values[:, count, halflife_count]
+                column_values[~present_rows[column]] = np.nan
+                features[feature_column] = column_values
+                feature_columns[column].append(feature_column)
+    return _prefix_features(
+        pd.DataFrame(features, index=ts_df.index),
+        ts_df[_COLUMN_PREFIX_COLUMN],
+        present_rows,
+        feature_columns,
+    )
+
+
+def _expanding_ts_features(
+    identifier_ts: dict[str, pd.DataFrame],
+    windows: list[datetime.timedelta | None],
+    feature_specs: dict[str, TimeseriesSpec] | None,
+    expanding_state: ExpandingState,
+    codes: list[int],
+) -> list[pd.DataFrame]:
+    if not identifier_ts:
+        return []
+    ts_df = pd.concat(
+        list(identifier_ts.values()),
+        keys=codes,
+        names=[_ENTITY_COLUMN, None],
+    ).reset_index(level=0)
+    columns = non_categorical_numeric_columns.find_non_categorical_numeric_columns(
+        ts_df.drop(columns=[_ENTITY_COLUMN])
+    )
+    # History rows are already part of the state.
+    ts_df = ts_df[ts_df.index.to_numpy() >= 0]
+    entity_codes = ts_df[_ENTITY_COLUMN].to_numpy(dtype=np.int64)
+    aggregations = expanding_state.update(
+        entity_codes, ts_df[columns].to_numpy(dtype=np.float64), columns
+    )
+    counts = expanding_state.counts(entity_codes, columns)
+    default_spec = _resolve_spec(None, windows, [])
+    feature_specs = feature_specs or {}
+
+    features = {}
+    feature_columns: dict[str, list[str]] = {}
+    present_rows = {}
+    for count, column in enumerate(columns):
+        # An entity without any value for a column gets no features from it.
+        present_rows[column] = counts[:, count] > 0
+        feature_columns[column] = []
+        spec = feature_specs.get(column, default_spec)
+        if None not in (spec.windows or []):
+            continue
+        for window_func in spec.aggregations or []:
+            feature_column = DELIMITER.join(
+                [
+                    column,
+                    TRANSFORM_COLUMN,
+                    str(Transform.NONE),
+                    window_func,
+                    _window_column(None),
+                ]
+            )
+            values = aggregations[window_func][:, count]
+            values[~present_rows[column]] = np.nan
+            features[feature_column] = values
+            feature_columns[column].append(feature_column)
+    return _prefix_features(
+        pd.DataFrame(features, index=ts_df.index),
+        ts_df[_COLUMN_PREFIX_COLUMN],
+        present_rows,
+        feature_columns,
+    )
+
+
+def _prefix_features(
+    features_df: pd.DataFrame,
+    column_prefixes: pd.Series,
+    present_rows: dict[str, npt.NDArray[np.bool_]],
+    feature_columns: dict[str, list[str]],
+) -> list[pd.DataFrame]:
+    # Like the timeseriesfeatures backend, a column prefix only gets the features
+    # of the columns one of its entities has values for.
+    features_df[_COLUMN_PREFIX_COLUMN] = column_prefixes
+    prefix_dfs = []
+    prefixes = column_prefixes.to_numpy()
+    for column_prefix in pd.unique(prefixes):
+        prefix_rows = prefixes == column_prefix
+        prefix_columns = [
+            feature_column
+            for column, present in present_rows.items()
+            if present[prefix_rows].any()
+            for feature_column in feature_columns[column]
+        ]
+        prefix_dfs.append(
+            features_df.loc[prefix_rows, [_COLUMN_PREFIX_COLUMN, *prefix_columns]]
+        )
+    return prefix_dfs
 
 
 def _write_ts_features(
     df: pd.DataFrame,
     dt_column: str,
-    tmpdir: str,
+    identifier_dfs: Iterable[pd.DataFrame],
+    prefix_features: dict[str, set[str]] | None = None,
 ) -> pd.DataFrame:
-    df_dict = {}
+    skip_columns = {_COLUMN_PREFIX_COLUMN, dt_column, ""}
+    prefix_columns: dict[str, dict[str, None]] = {}
+    feature_dfs = []
+    for identifier_df in tqdm(identifier_dfs, desc="Writing Timeseries Features"):
+        identifier_df = identifier_df[identifier_df.index >= 0]
+        # A prefix gets every feature of the entities written under it.
+        columns = dict.fromkeys(
+            x for x in identifier_df.columns.values.tolist() if x not in skip_columns
+        )
+        for column_prefix in pd.unique(identifier_df[_COLUMN_PREFIX_COLUMN]):
+            prefix_columns.setdefault(column_prefix, {}).update(columns)
+        feature_dfs.append(identifier_df)
+    if not feature_dfs:
+        return pd.DataFrame(index=df.index)
 
-    written_columns = set()
-    for parquet_file in tqdm(
-        [os.path.join(tmpdir, x) for x in os.listdir(tmpdir) if x.endswith(".parquet")],
-        desc="Writing Timeseries Features",
+    blocks = []
+    for column_prefix, prefix_df in pd.concat(feature_dfs).groupby(
+        _COLUMN_PREFIX_COLUMN, sort=False
     ):
-        identifier_df = pd.read_parquet(parquet_file)
-        for row in identifier_df.itertuples(name=None):
-            row_dict = {
-                x: row[count + 1]
-                for count, x in enumerate(identifier_df.columns.values.tolist())
-            }
-            column_prefix = row_dict[_COLUMN_PREFIX_COLUMN]
-            for column, value in row_dict.items():
-                if column in {_COLUMN_PREFIX_COLUMN, dt_column, ""}:
-                    continue
-                key = column_prefix + column
-                if key not in df_dict:
-                    df_dict[key] = [None for _ in range(len(df))]
-                df_dict[key][row[0]] = value
-                written_columns.add(key)
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
+        prefix_df = prefix_df[~prefix_df.index.duplicated(keep="last")]
+        feature_columns = list(prefix_columns[str(column_prefix)])
+        if prefix_features is not None and column_prefix in prefix_features:
+            allowed_features = prefix_features[str(column_prefix)]
+            feature_columns = [x for x in feature_columns if x in allowed_features]
+        block = prefix_df[feature_columns].astype(np.float64)
+        block.columns = pd.Index([str(column_prefix) + x for x in feature_columns])
+        block.index = df.index[prefix_df.index.to_numpy()]
+        blocks.append(block.reindex(df.index))
+    block = pd.concat(blocks, axis=1)
+    return block[sorted(block.columns.values.tolist())]
 
-    return df
 
-
-def timeseries_process(
+def _timeseriesfeatures_block(
     df: pd.DataFrame,
-    identifiers: list[Identifier],
+    identifier_ts: dict[str, pd.DataFrame],
     windows: list[datetime.timedelta | None],
     dt_column: str,
     use_multiprocessing: bool,
+    batch_rows: int,
+    n_jobs: int,
+    cache: TimeseriesCache | None,
+    feature_specs: dict[str, TimeseriesSpec] | None,
+    prefix_features: dict[str, set[str]] | None,
 ) -> pd.DataFrame:
-    """Process a dataframe for its timeseries features."""
+    cache_keys = {}
+    cached_features = {}
+    if cache is not None:
+        config = repr((_timeseries_features(windows, feature_specs), dt_column))
+        for k, v in identifier_ts.items():
+            cache_keys[k] = cache.fingerprint(v, config)
+            cached_df = cache.get(cache_keys[k])
+            if cached_df is not None:
+                cached_features[k] = cached_df
     with tempfile.TemporaryDirectory() as tmpdir:
         tqdm.pandas(desc="Progress")
-        simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
+        entity_features = _process_identifier_ts(
+            {k: v for k, v in identifier_ts.items() if k not in cached_features},
+            windows,
+            dt_column,
+            use_multiprocessing,
+            tmpdir,
+            batch_rows=batch_rows,
+            n_jobs=n_jobs,
+            feature_specs=feature_specs,
+        )
+    if cache is not None:
+        for k, v in entity_features.items():
+            cache.put(cache_keys[k], v)
+        cache.prune()
+    entity_features.update(cached_features)
+    return _write_ts_features(df, dt_column, entity_features.values(), prefix_features)
+
+
+def check_cache(backend: TimeseriesBackend, cache: TimeseriesCache | None) -> None:
+    """Check the backend can use the cache.
 
-        # Write the columns to the dataframe ahead of time.
-        df[_COLUMN_PREFIX_COLUMN] = None
+    The memory backend computes every entity at once in a single grouped frame,
+    so it has no features of a single entity to cache.
+    """
+    if cache is not None and backend == TimeseriesBackend.MEMORY:
+        raise ValueError("The memory timeseries backend does not use a cache")
+
+
+def timeseries_block(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    windows: list[datetime.timedelta | None],
+    dt_column: str,
+    use_multiprocessing: bool,
+    state: FeatureState | None = None,
+    backend: TimeseriesBackend = TimeseriesBackend.TIMESERIESFEATURES,
+    batch_rows: int = BATCH_ROWS,
+    n_jobs: int = -1,
+    cache: TimeseriesCache | None = None,
+    halflives: list[datetime.timedelta] | None = None,
+) -> pd.DataFrame:
+    """Compute the block of timeseries feature columns.
 
-        _extract_identifier_timeseries(df, identifiers, dt_column, tmpdir)
-        _process_identifier_ts(windows, dt_column, use_multiprocessing, tmpdir)
-        df = _write_ts_features(df, dt_column, tmpdir)
-        return df.drop(columns=[_COLUMN_PREFIX_COLUMN])
+    The timeseriesfeatures backend computes the entities in batches of about
+    batch_rows rows, spread over n_jobs workers when use_multiprocessing is set,
+    while the memory backend computes the same features for every entity at once
+    in a single grouped frame. With a cache the timeseriesfeatures backend only
+    computes the entities whose series changed since they were cached, while the
+    memory backend takes no cache. Each
+    half-life adds an exponentially weighted mean and variance, carried across
+    incremental runs in the state. The state also carries the aggregations of the
+    all-time window, so an incremental run only keeps the history the lags and
+    the finite windows reach.
+    """
+    halflives = halflives or []
+    check_halflives(halflives)
+    check_cache(backend, cache)
+    relevant_identifiers = [
+        x for x in identifiers if x.entity_type in {EntityType.TEAM, EntityType.PLAYER}
+    ]
+    feature_specs, prefix_features = _timeseries_specs(
+        relevant_identifiers, windows, halflives
+    )
+    all_lags = _LAGS
+    all_windows = windows
+    all_halflives = halflives
+    if feature_specs is not None:
+        all_lags = list(
+            dict.fromkeys(y for x in feature_specs.values() for y in x.lags or [])
+        )
+        all_windows = list(
+            dict.fromkeys(y for x in feature_specs.values() for y in x.windows or [])
+        )
+        all_halflives = list(
+            dict.fromkeys(y for x in feature_specs.values() for y in x.halflives or [])
+        )
+    expanding_windows = windows
+    expanding_specs = feature_specs
+    expanding = state is not None and None in all_windows
+    if expanding:
+        windows = [x for x in windows if x is not None]
+        all_windows = [x for x in all_windows if x is not None]
+        if feature_specs is not None:
+            feature_specs = {
+                k: TimeseriesSpec(
+                    lags=v.lags,
+                    windows=[x for x in v.windows or [] if x is not None],
+                    aggregations=v.aggregations,
+                    halflives=v.halflives,
+                )
+                for k, v in feature_specs.items()
+            }
+    identifier_ts = _identifier_timeseries(
+        df, identifiers, dt_column, windows=all_windows, state=state, lags=all_lags
+    )
+    if backend == TimeseriesBackend.MEMORY:
+        block = _write_ts_features(
+            df,
+            dt_column,
+            _memory_ts_features(identifier_ts, windows, dt_column, feature_specs),
+            prefix_features,
+        )
+    else:
+        block = _timeseriesfeatures_block(
+            df,
+            identifier_ts,
+            windows,
+            dt_column,
+            use_multiprocessing,
+            batch_rows,
+            n_jobs,
+            cache,
+            feature_specs,
+            prefix_features,
+        )
+    if not all_halflives and not expanding:
+        return block
+    ewm_state = EwmState()
+    codes = list(range(len(identifier_ts)))
+    if state is not None:
+        ewm_state = state.ewm
+        entity_codes = {x: count for count, x in enumerate(state.entities.keys)}
+        codes = [entity_codes[x] for x in identifier_ts]
+    if all_halflives:
+        ewm_features = _ewm_ts_features(
+            identifier_ts, all_halflives, dt_column, feature_specs, ewm_state, codes
+        )
+        block = append_block(
+            block, _write_ts_features(df, dt_column, ewm_features, prefix_features)
+        )
+    if expanding and state is not None:
+        expanding_features = _expanding_ts_features(
+            identifier_ts, expanding_windows, expanding_specs, state.expanding, codes
+        )
+        block = append_block(
+            block,
+            _write_ts_features(df, dt_column, expanding_features, prefix_features),
+        )
+    return block
+
+
+def timeseries_process(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    windows: list[datetime.timedelta | None],
+    dt_column: str,
+    use_multiprocessing: bool,
+    state: FeatureState | None = None,
+    backend: TimeseriesBackend = TimeseriesBackend.TIMESERIESFEATURES,
+    batch_rows: int = BATCH_ROWS,
+    n_jobs: int = -1,
+    cache: TimeseriesCache | None = None,
+    halflives: list[datetime.timedelta] | None = None,
+) -> pd.DataFrame:
+    """Process a dataframe for its timeseries features."""
+    block = timeseries_block(
+        df,
+        identifiers,
+        windows,
+        dt_column,
+        use_multiprocessing,
+        state=state,
+        backend=backend,
+        batch_rows=batch_rows,
+        n_jobs=n_jobs,
+        cache=cache,
+        halflives=halflives,
+    )
+    return append_block(df, block)
@@ -0,0 +1,49 @@
+"""A description of the timeseries features computed for a column."""
+
+# pylint: disable=too-few-public-methods
+import datetime
+
+from timeseriesfeatures.columns import WINDOW_FUNCTIONS  # type: ignore
+
+
+def check_halflives(halflives: list[datetime.timedelta]) -> None:
+    """Check the half-lives name their features apart.
+
+    The exponentially weighted columns are named by the days of the half-life,
+    so each half-life has to be a distinct, positive whole number of days.
+    """
+    partial = [
+        str(x)
+        for x in halflives
+        if x <= datetime.timedelta() or x % datetime.timedelta(days=1)
+    ]
+    if partial:
+        raise ValueError(f"Half-lives must be positive whole days: {partial}")
+    if len(set(halflives)) != len(halflives):
+        raise ValueError(f"Duplicate half-lives: {[str(x) for x in halflives]}")
+
+
+class TimeseriesSpec:
+    """The lags, windows, window aggregations and half-lives of a column.
+
+    Anything left as None falls back to the defaults of the timeseries process,
+    while an empty list turns that kind of feature off.
+    """
+
+    def __init__(
+        self,
+        lags: list[int] | None = None,
+        windows: list[datetime.timedelta | None] | None = None,
+        aggregations: list[str] | None = None,
+        halflives: list[datetime.timedelta] | None = None,
+    ):
+        if aggregations is not None:
+            unknown = sorted(set(aggregations) - set(WINDOW_FUNCTIONS))
+            if unknown:
+                raise ValueError(f"Unrecognised aggregations: {unknown}")
+        if halflives is not None:
+            check_halflives(halflives)
+        self.lags = lags
+        self.windows = windows
+        self.aggregations = aggregations
+        self.halflives = halflives
@@ -2,45 +2,53 @@
 
 # pylint: disable=too-many-locals,too-many-branches
 
-from warnings import simplefilter
+import copy
 
+import numpy as np
 import pandas as pd
 import tqdm
 
+from .block import append_block
+from .column_buffer import ColumnBuffer
 from .columns import DELIMITER
+from .feature_state import FeatureState
 from .identifier import Identifier
+from .identifier_plan import compile_plans, iterate_rows
 
 WINS_COLUMN = "wins"
 
 
-def win_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame:
-    """Process wins between teams."""
-    simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
-    df_dict: dict[str, list[float | None]] = {}
-    df_cols = df.columns.values.tolist()
-    wins_dict: dict[str, float] = {}
-
-    written_columns = set()
-    for row in tqdm.tqdm(
-        df.itertuples(name=None), desc="Win Processing", total=len(df)
-    ):
-        row_dict = {x: row[count + 1] for count, x in enumerate(df_cols)}
+def win_block(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Compute the block of win columns, leaving the identifiers untouched."""
+    if state is None:
+        state = FeatureState()
+    columns = ColumnBuffer(df.index)
+    plans = compile_plans(identifiers)
+    identifier_codes = state.entities.identifier_codes(df, identifiers)
+    wins = state.entities.grow(state.wins, None)
+    row_columns = [x.points_column for x in identifiers]
 
+    for position, (index, row_dict) in enumerate(
+        tqdm.tqdm(iterate_rows(df, row_columns), desc="Win Processing", total=len(df))
+    ):
         # Write lagged data
-        for identifier in identifiers:
-            identifier_id = row_dict.get(identifier.column)
-            if identifier_id is None:
+        for plan, codes in zip(plans, identifier_codes):
+            if codes is None or codes[position] < 0:
                 continue
-            key = DELIMITER.join([identifier.entity_type, identifier_id])
-            lagged_value = wins_dict.get(key)
+            lagged_value = wins[codes[position]]
             if lagged_value is None:
                 continue
-            col = DELIMITER.join([identifier.column_prefix, WINS_COLUMN])
-            if col not in df_dict:
-                df_dict[col] = [None for _ in range(len(df))]
-            df_dict[col][row[0]] = lagged_value
-            written_columns.add(col)
-            del wins_dict[key]
+            columns.set(
+                plan.output_column(WINS_COLUMN),
+                index,
+                lagged_value,
+                dtype=np.float32,
+            )
+            wins[codes[position]] = None
 
         # Determine max points
         max_points = None
@@ -58,26 +66,44 @@ def win_process(df: pd.DataFrame, identifiers: list[Identifier]) -> pd.DataFrame
 
         # Write the next values
         if max_points is not None:
-            for identifier in identifiers:
-                identifier_id = row_dict.get(identifier.column)
-                if identifier_id is None:
+            for identifier, codes in zip(identifiers, identifier_codes):
+                if codes is None or codes[position] < 0:
                     continue
-                key = DELIMITER.join([identifier.entity_type, identifier_id])
                 points_col = identifier.points_column
                 if points_col is None:
                     continue
                 points = row_dict[points_col]
                 if points is None:
                     continue
-                wins_dict[key] = float(points == max_points)
+                wins[codes[position]] = float(points == max_points)
+
+    return columns.to_frame()
+
 
-    for column in written_columns:
-        df.loc[:, column] = df_dict[column]
+def win_identifiers(identifiers: list[Identifier]) -> list[Identifier]:
+    """Copies of the identifiers with their wins column as a feature column."""
+    copies = []
+    for identifier in identifiers:
+        col = DELIMITER.join([identifier.column_prefix, WINS_COLUMN])
+        win_identifier = copy.copy(identifier)
+        if col not in identifier.feature_columns:
+            win_identifier.feature_columns = identifier.feature_columns + [col]
+        copies.append(win_identifier)
+    return copies
+
+
+def win_process(
+    df: pd.DataFrame,
+    identifiers: list[Identifier],
+    state: FeatureState | None = None,
+) -> pd.DataFrame:
+    """Process wins between teams."""
+    block = win_block(df, identifiers, state=state)
 
     # Add new feature columns
     for identifier in identifiers:
         col = DELIMITER.join([identifier.column_prefix, WINS_COLUMN])
-        if col in written_columns:
+        if col in block.columns and col not in identifier.feature_columns:
             identifier.feature_columns.append(col)
 
-    return df[sorted(df.columns.values.tolist())]
+    return append_block(df, block)
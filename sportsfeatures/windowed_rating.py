@@ -1,245 +1,291 @@
-"""A class for handling windowed plackett luce ratings."""
+"""A class for handling windowed ratings."""
 
-# pylint: disable=too-many-locals,too-many-branches,too-many-statements,too-few-public-methods,too-many-nested-blocks,too-many-instance-attributes,too-many-arguments,too-many-positional-arguments
+# pylint: disable=too-many-instance-attributes,protected-access
 
 import datetime
 from typing import Any
 
-from openskill.models import PlackettLuce, PlackettLuceRating
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+from openskill.models import (BradleyTerryFull, BradleyTerryPart, PlackettLuce,
+                              ThurstoneMostellerFull, ThurstoneMostellerPart)
 
-from .identifier import Identifier
+from .elo_ratings import EloRatings
+from .entity_type import EntityType
+from .glicko2_ratings import Glicko2Ratings
 from .match import Match
-from .null_check import is_null
-from .team import Team
+from .rating_model import RatingModel
+from .rating_model_type import RatingModelType
+from .rating_store import RatingStore
+
+RatingResult = dict[int, tuple[float, float, int, float]]
+_OPENSKILL_MODELS = {
+    RatingModelType.PLACKETT_LUCE: PlackettLuce,
+    RatingModelType.BRADLEY_TERRY_FULL: BradleyTerryFull,
+    RatingModelType.BRADLEY_TERRY_PART: BradleyTerryPart,
+    RatingModelType.THURSTONE_MOSTELLER_FULL: ThurstoneMostellerFull,
+    RatingModelType.THURSTONE_MOSTELLER_PART: ThurstoneMostellerPart,
+}
+
+
+def rating_model(model_type: RatingModelType, **parameters: Any) -> RatingModel:
+    """A new rating model of a type, built with any parameters of the model."""
+    if model_type == RatingModelType.ELO:
+        return EloRatings(**parameters)
+    if model_type == RatingModelType.GLICKO2:
+        return Glicko2Ratings(**parameters)
+    return RatingStore(_OPENSKILL_MODELS[model_type](**parameters))
+
+
+def _restore_model(
+    model_type: RatingModelType, snapshot: dict[str, Any]
+) -> RatingModel:
+    model = rating_model(model_type, **snapshot["parameters"])
+    model.restore(snapshot)
+    return model
 
 
 class WindowedRating:
-    """Handles plackett luce ratings based on windows."""
+    """Handles the ratings of a single window.
 
-    _team_ratings: dict[str, PlackettLuceRating]
-    _player_ratings: dict[str, PlackettLuceRating]
-    _coach_ratings: dict[str, PlackettLuceRating]
-    _owner_ratings: dict[str, PlackettLuceRating]
-    _matches: list[Match]
+    The ratings are kept in array backed stores indexed by the codes of an
+    entity interner, which can be shared with the rest of the feature state.
+    Which matches fall inside the window is left to the caller, which rates a
+    match as it enters the window and either reverses it as it leaves or
+    rebuilds the ratings from the matches still inside. A decaying window
+    keeps every match instead, and inflates the sigma of each entity by the
+    time since it last played, the whole way back to the initial sigma after
+    a window of inactivity.
 
-    def __init__(self, window: datetime.timedelta | None, dt_column: str):
-        self.window = window
-        self._dt_column = dt_column
-        self._team_model = PlackettLuce()
-        self._player_model = PlackettLuce()
-        self._coach_model = PlackettLuce()
-        self._owner_model = PlackettLuce()
-        self._team_ratings = {}
-        self._player_ratings = {}
-        self._coach_ratings = {}
-        self._owner_ratings = {}
-        self._matches = []
-
-    def add(
+    Each entity type is rated with its own model, plackett luce unless told
+    otherwise.
+    """
+
+    def __init__(
         self,
-        row: dict[str, Any],
-        team_identifiers: list[Identifier],
-        player_identifiers: list[Identifier],
-        coach_identifiers: list[Identifier],
-    ) -> tuple[
-        dict[str, tuple[PlackettLuceRating, int, float]],
-        dict[str, tuple[PlackettLuceRating, int, float]],
-        dict[str, tuple[PlackettLuceRating, int, float]],
-    ]:
-        """Add a new row to the windowed rating."""
-        teams = []
-        for team_identifier in team_identifiers:
-            if team_identifier.column not in row:
-                continue
-            team_id = row[team_identifier.column]
-            if is_null(team_id):
-                continue
-            if team_id not in self._team_ratings:
-                self._team_ratings[team_id] = self._team_model.rating(name=team_id)
-
-            team_player_ids = []
-            for player_identifier in player_identifiers:
-                if player_identifier.team_identifier_column is None:
-                    continue
-                if player_identifier.team_identifier_column not in row:
-                    continue
-                player_team_id = row[player_identifier.team_identifier_column]
-                if is_null(player_team_id):
-                    continue
-                if player_team_id != team_id:
-                    continue
-                if player_identifier.column not in row:
-                    continue
-                player_id = row[player_identifier.column]
-                if is_null(player_id):
-                    continue
-                team_player_ids.append(player_id)
-                if player_id not in self._player_ratings:
-                    self._player_ratings[player_id] = self._player_model.rating(
-                        name=player_id
-                    )
-
-            coaches = []
-            for coach_identifier in coach_identifiers:
-                if coach_identifier.team_identifier_column is None:
-                    continue
-                if coach_identifier.team_identifier_column not in row:
-                    continue
-                coach_team_id = row[coach_identifier.team_identifier_column]
-                if is_null(coach_team_id):
-                    continue
-                if coach_team_id != team_id:
-                    continue
-                if coach_identifier.column not in row:
-                    continue
-                coach_id = row[coach_identifier.column]
-                if is_null(coach_id):
-                    continue
-                coaches.append(coach_id)
-                if coach_id not in self._coach_ratings:
-                    self._coach_ratings[coach_id] = self._coach_model.rating(
-                        name=coach_id
-                    )
-
-            points = None
-            if (
-                team_identifier.points_column is not None
-                and team_identifier.points_column in row
-            ):
-                points = row[team_identifier.points_column]
-            teams.append(Team(team_player_ids, points, team_id, coaches))
-
-        match = Match(teams, row[self._dt_column])
-
-        if self.window is not None:
-            # Remove older matches and reverse their results.
-            oldest_dt = match.dt - self.window
-            remove_matches = [x for x in self._matches if x.dt < oldest_dt]
-            for remove_match in remove_matches:
-                scores: list[float] | None = [
-                    x.points
-                    for x in reversed(remove_match.teams)
-                    if x.points is not None
-                ]
-                if not scores:
-                    scores = None
-                if len(remove_match.teams) >= 2:
-                    team_ratings: list[list[PlackettLuceRating]] = [
-                        [self._team_ratings[x.identifier]] for x in remove_match.teams
-                    ]
-                    team_ratings = self._team_model.rate(
-                        team_ratings,
-                        scores=scores,
-                    )
-                    for team_rating in team_ratings:
-                        self._team_ratings[str(team_rating[0].name)] = team_rating[0]
-                    if all(x.players for x in remove_match.teams):
-                        players = self._player_model.rate(
-                            [
-                                [self._player_ratings[y] for y in x.players]
-                                for x in remove_match.teams
-                            ],
-                            scores=scores,
-                        )
-                        for player_rating in players:
-                            for player_subrating in player_rating:
-                                self._player_ratings[str(player_subrating.name)] = (
-                                    player_subrating
-                                )
-                    if all(x.coaches for x in remove_match.teams):
-                        coaches = self._coach_model.rate(
-                            [
-                                [self._coach_ratings[y] for y in x.coaches]
-                                for x in remove_match.teams
-                            ],
-                            scores=scores,
-                        )
-                        for coach_rating in coaches:
-                            for coach_subrating in coach_rating:
-                                self._coach_ratings[str(coach_subrating.name)] = (
-                                    coach_subrating
-                                )
-            self._matches = self._matches[len(remove_matches) :]
-
-        # Find the results
+        window: datetime.timedelta | None,
+        decay: bool = False,
+        models: dict[EntityType, RatingModelType] | None = None,
+    ):
+        self.window = window
+        self.decay = decay
+        self.models = {
+            x: RatingModelType.PLACKETT_LUCE
+            if models is None
+            else models.get(x, RatingModelType.PLACKETT_LUCE)
+            for x in [EntityType.TEAM, EntityType.PLAYER, EntityType.COACH]
+        }
+        self._team_ratings = rating_model(self.models[EntityType.TEAM])
+        self._player_ratings = rating_model(self.models[EntityType.PLAYER])
+        self._coach_ratings = rating_model(self.models[EntityType.COACH])
+
+    def _rate(self, match: Match, scores: list[float] | None) -> None:
+        if len(match.teams) < 2:
+            return
+        self._team_ratings.rate([[x.identifier] for x in match.teams], scores)
+        if all(x.players for x in match.teams):
+            self._player_ratings.rate([x.players for x in match.teams], scores)
+        if all(x.coaches for x in match.teams):
+            self._coach_ratings.rate([x.coaches for x in match.teams], scores)
+
+    def _decay(self, match: Match) -> None:
+        if len(match.teams) < 2 or self.window is None:
+            return
+        dt = pd.Timestamp(match.dt).value / 1e9
+        horizon = self.window.total_seconds()
+        self._team_ratings.decay([x.identifier for x in match.teams], dt, horizon)
+        if all(x.players for x in match.teams):
+            self._player_ratings.decay(
+                [y for x in match.teams for y in x.players], dt, horizon
+            )
+        if all(x.coaches for x in match.teams):
+            self._coach_ratings.decay(
+                [y for x in match.teams for y in x.coaches], dt, horizon
+            )
+
+    def reserve(self, size: int) -> None:
+        """Make room for the ratings of the entity codes below size."""
+        for ratings in [self._team_ratings, self._player_ratings, self._coach_ratings]:
+            ratings.reserve(size)
+
+    def add(self, match: Match) -> tuple[RatingResult, RatingResult, RatingResult]:
+        """Add a new match to the windowed rating.
+
+        Returns the mu, sigma, predicted rank and probability of each team,
+        player and coach code in the match, from before the match was rated.
+        """
+        if self.decay:
+            self._decay(match)
         team_result = {}
         player_result = {}
         coach_result = {}
         if len(match.teams) >= 2:
-            team_rank = self._team_model.predict_rank(
-                [[self._team_ratings[x.identifier]] for x in match.teams]
+            team_rank = self._team_ratings.predict_rank(
+                [[x.identifier] for x in match.teams]
             )
             team_result = {
                 x.identifier: (
-                    self._team_ratings[x.identifier],
+                    *self._team_ratings.rating(x.identifier),
                     team_rank[count][0],
                     team_rank[count][1],
                 )
                 for count, x in enumerate(match.teams)
             }
             if all(x.players for x in match.teams):
-                player_rank = self._player_model.predict_rank(
-                    [[self._player_ratings[y] for y in x.players] for x in match.teams]
+                player_rank = self._player_ratings.predict_rank(
+                    [x.players for x in match.teams]
                 )
                 for count, team in enumerate(match.teams):
                     for player in team.players:
                         player_result[player] = (
-                            self._player_ratings[player],
+                            *self._player_ratings.rating(player),
                             player_rank[count][0],
                             player_rank[count][1],
                         )
             if all(x.coaches for x in match.teams):
-                coach_rank = self._coach_model.predict_rank(
-                    [[self._coach_ratings[y] for y in x.coaches] for x in match.teams]
+                coach_rank = self._coach_ratings.predict_rank(
+                    [x.coaches for x in match.teams]
                 )
                 for count, team in enumerate(match.teams):
                     for coach in team.coaches:
                         coach_result[coach] = (
-                            self._coach_ratings[coach],
+                            *self._coach_ratings.rating(coach),
                             coach_rank[count][0],
                             coach_rank[count][1],
                         )
 
-        # Record the new match results
-        scores = [x.points for x in match.teams if x.points is not None]
-        if not scores:
-            scores = None
-        if len(match.teams) >= 2:
-            team_ratings = self._team_model.rate(
-                [[self._team_ratings[x.identifier]] for x in match.teams], scores=scores
+        self.rate(match)
+        return team_result, player_result, coach_result
+
+    def _predict_teams(
+        self,
+        ratings: RatingModel,
+        teams: list[tuple[int, list[list[int]]]],
+        dts: list[float],
+    ) -> list[tuple[int, int, tuple[float, float, int, float]]]:
+        # Predict the teams of many matches in a single call, returning the
+        # position of the match, the code and the result of every member.
+        if not teams:
+            return []
+        positions = [x for x, _ in teams]
+        team_sizes = [len(y) for _, x in teams for y in x]
+        codes = np.fromiter(
+            (z for _, x in teams for y in x for z in y),
+            dtype=np.intp,
+            count=sum(team_sizes),
+        )
+        groups = np.repeat(np.arange(len(team_sizes)), team_sizes)
+        group_matches = np.repeat(np.arange(len(teams)), [len(x) for _, x in teams])
+        member_matches = group_matches[groups]
+        mus = ratings.mus[codes]
+        sigmas = ratings.sigmas[codes]
+        if self.decay and self.window is not None:
+            sigmas = ratings.decayed_sigmas(
+                codes,
+                np.asarray(dts)[positions][member_matches],
+                self.window.total_seconds(),
             )
-            for team_rating in team_ratings:
-                self._team_ratings[str(team_rating[0].name)] = team_rating[0]
-            if all(x.players for x in match.teams):
-                player_ratings: list[list[PlackettLuceRating]] = (
-                    self._player_model.rate(
-                        [
-                            [self._player_ratings[y] for y in x.players]
-                            for x in match.teams
-                        ],
-                        scores=scores,
-                    )
-                )
-                for player_rating in player_ratings:
-                    for player_subrating in player_rating:
-                        self._player_ratings[str(player_subrating.name)] = (
-                            player_subrating
-                        )
-            if all(x.coaches for x in match.teams):
-                coach_ratings: list[list[PlackettLuceRating]] = self._coach_model.rate(
-                    [[self._coach_ratings[y] for y in x.coaches] for x in match.teams],
-                    scores=scores,
-                )
-                for coach_rating in coach_ratings:
-                    for coach_subrating in coach_rating:
-                        self._coach_ratings[str(coach_subrating.name)] = coach_subrating
-        self._matches.append(match)
+        ranks, probabilities = ratings.predict_ranks(mus, sigmas, groups, group_matches)
+        return [
+            (positions[match], code, (mu, sigma, rank, probability))
+            for match, code, mu, sigma, rank, probability in zip(
+                member_matches.tolist(),
+                codes.tolist(),
+                mus.tolist(),
+                sigmas.tolist(),
+                ranks[groups].tolist(),
+                probabilities[groups].tolist(),
+            )
+        ]
 
-        return team_result, player_result, coach_result
+    def predict(
+        self, matches: list[Match]
+    ) -> list[tuple[RatingResult, RatingResult, RatingResult]]:
+        """Predict many matches at once from the ratings, without rating them.
+
+        Returns what add would for each match, were the ratings frozen, with a
+        decaying window decaying the sigmas to the time of each match.
+        """
+        results: list[tuple[RatingResult, RatingResult, RatingResult]] = [
+            ({}, {}, {}) for _ in matches
+        ]
+        dts = [pd.Timestamp(x.dt).value / 1e9 for x in matches]
+        played = [(x, y) for x, y in enumerate(matches) if len(y.teams) >= 2]
+        for slot, ratings, teams in [
+            (
+                0,
+                self._team_ratings,
+                [(x, [[z.identifier] for z in y.teams]) for x, y in played],
+            ),
+            (
+                1,
+                self._player_ratings,
+                [
+                    (x, [z.players for z in y.teams])
+                    for x, y in played
+                    if all(z.players for z in y.teams)
+                ],
+            ),
+            (
+                2,
+                self._coach_ratings,
+                [
+                    (x, [z.coaches for z in y.teams])
+                    for x, y in played
+                    if all(z.coaches for z in y.teams)
+                ],
+            ),
+        ]:
+            for position, code, result in self._predict_teams(ratings, teams, dts):
+                results[position][slot][code] = result
+        return results
+
+    def rate(self, match: Match) -> None:
+        """Record the result of a match without predicting it."""
+        scores = [x.points for x in match.teams if x.points is not None]
+        self._rate(match, scores or None)
+
+    def remove(self, match: Match) -> None:
+        """Reverse the result of a match that has left the window."""
+        scores = [x.points for x in reversed(match.teams) if x.points is not None]
+        self._rate(match, scores or None)
+
+    def update(self, other: "WindowedRating", codes: npt.NDArray[np.intp]) -> None:
+        """Copy the ratings of some entities over from another rating."""
+        self._team_ratings.update(other._team_ratings, codes)
+        self._player_ratings.update(other._player_ratings, codes)
+        self._coach_ratings.update(other._coach_ratings, codes)
+
+    def snapshot(self, size: int) -> dict[str, Any]:
+        """The window, its mode, its models and the ratings of the codes below size."""
+        return {
+            "window": self.window,
+            "decay": self.decay,
+            "models": dict(self.models),
+            "team": self._team_ratings.snapshot(size),
+            "player": self._player_ratings.snapshot(size),
+            "coach": self._coach_ratings.snapshot(size),
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> None:
+        """Take over the ratings of a snapshot of the same window and models."""
+        if dict(snapshot["models"]) != self.models:
+            raise ValueError(
+                f"Rating snapshot models {snapshot['models']} do not match {self.models}"
+            )
+        self._team_ratings = _restore_model(
+            self.models[EntityType.TEAM], snapshot["team"]
+        )
+        self._player_ratings = _restore_model(
+            self.models[EntityType.PLAYER], snapshot["player"]
+        )
+        self._coach_ratings = _restore_model(
+            self.models[EntityType.COACH], snapshot["coach"]
+        )
 
     def reset(self) -> None:
         """Resets the state."""
-        self._team_ratings = {}
-        self._player_ratings = {}
-        self._coach_ratings = {}
-        self._matches = []
+        self._team_ratings.reset()
+        self._player_ratings.reset()
+        self._coach_ratings.reset()
@@ -7,11 +7,47 @@ import pandas as pd
 from pandas.testing import assert_frame_equal
 
 from sportsfeatures.bets_process import bet_process
+from sportsfeatures.feature_state import FeatureState
 from sportsfeatures.identifier import Identifier
 from sportsfeatures.entity_type import EntityType
 from sportsfeatures.bet import Bet
 
 
+def _bet_identifiers():
+    return [
+        Identifier(
+            EntityType.TEAM,
+            "teams/0/identifier",
+            [],
+            "teams/0",
+            points_column="teams/0/points",
+            bets=[Bet(
+                odds_column=f"teams/0/odds/{x}/odds",
+                bookie_id_column=f"teams/0/odds/{x}/bookie/name",
+                dt_column=f"teams/0/odds/{x}/dt",
+                canonical_column=f"teams/0/odds/{x}/canonical",
+                bookie_name_column=f"teams/0/odds/{x}/bookie/realname",
+                bet_type_column=f"teams/0/odds/{x}/bet_type",
+            ) for x in range(28)],
+        ),
+        Identifier(
+            EntityType.TEAM,
+            "teams/1/identifier",
+            [],
+            "teams/1",
+            points_column="teams/1/points",
+            bets=[Bet(
+                odds_column=f"teams/1/odds/{x}/odds",
+                bookie_id_column=f"teams/1/odds/{x}/bookie/name",
+                dt_column=f"teams/1/odds/{x}/dt",
+                canonical_column=f"teams/1/odds/{x}/canonical",
+                bookie_name_column=f"teams/1/odds/{x}/bookie/realname",
+                bet_type_column=f"teams/0/odds/{x}/bet_type",
+            ) for x in range(28)],
+        ),
+    ]
+
+
 class TestBetProcess(unittest.TestCase):
 
     def setUp(self):
@@ -19,38 +55,7 @@ class TestBetProcess(unittest.TestCase):
 
     def test_bet_process(self):
         df = pd.read_csv(os.path.join(self.dir, "bets.csv"))
-        identifiers = [
-            Identifier(
-                EntityType.TEAM,
-                "teams/0/identifier",
-                [],
-                "teams/0",
-                points_column="teams/0/points",
-                bets=[Bet(
-                    odds_column=f"teams/0/odds/{x}/odds",
-                    bookie_id_column=f"teams/0/odds/{x}/bookie/name",
-                    dt_column=f"teams/0/odds/{x}/dt",
-                    canonical_column=f"teams/0/odds/{x}/canonical",
-                    bookie_name_column=f"teams/0/odds/{x}/bookie/realname",
-                    bet_type_column=f"teams/0/odds/{x}/bet_type",
-                ) for x in range(28)],
-            ),
-            Identifier(
-                EntityType.TEAM,
-                "teams/1/identifier",
-                [],
-                "teams/1",
-                points_column="teams/1/points",
-                bets=[Bet(
-                    odds_column=f"teams/1/odds/{x}/odds",
-                    bookie_id_column=f"teams/1/odds/{x}/bookie/name",
-                    dt_column=f"teams/1/odds/{x}/dt",
-                    canonical_column=f"teams/1/odds/{x}/canonical",
-                    bookie_name_column=f"teams/1/odds/{x}/bookie/realname",
-                    bet_type_column=f"teams/0/odds/{x}/bet_type",
-                ) for x in range(28)],
-            ),
-        ]
+        identifiers = _bet_identifiers()
         new_df = bet_process(df, identifiers, "dt", True)
         odds = new_df["teams/0_odds"].to_list()
         self.assertListEqual(odds, [
@@ -98,3 +103,16 @@ class TestBetProcess(unittest.TestCase):
             2.425,
             1.105,
         ])
+
+    def test_bet_process_incremental(self):
+        df = pd.read_csv(os.path.join(self.dir, "bets.csv"))
+        identifiers = _bet_identifiers()
+        expected_state = FeatureState()
+        expected_df = bet_process(df.copy(), identifiers, "dt", True, state=expected_state)
+        state = FeatureState()
+        head_df = bet_process(df.iloc[:10].copy(), identifiers, "dt", True, state=state)
+        tail_df = bet_process(df.iloc[10:].copy(), identifiers, "dt", True, state=state)
+        # The price efficiency of the appended rows carries on from the earlier rows.
+        assert_frame_equal(pd.concat([head_df, tail_df]), expected_df)
+        self.assertEqual(state.bookie_count, expected_state.bookie_count)
+        self.assertAlmostEqual(state.bookie_squared_error, expected_state.bookie_squared_error)
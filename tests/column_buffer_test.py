@@ -0,0 +1,26 @@
+"""Tests for the column buffer class."""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sportsfeatures.column_buffer import ColumnBuffer
+
+
+class TestColumnBuffer(unittest.TestCase):
+
+    def test_to_frame(self):
+        columns = ColumnBuffer(pd.RangeIndex(3))
+        columns.set("b", 1, 2.0, dtype=np.float32)
+        columns.set("a", 0, 1, dtype=np.int64)
+        columns.set("a", 1, 2, dtype=np.int64)
+        columns.set("a", 2, 3, dtype=np.int64)
+        columns.set("c", 2, 4, dtype=np.int64)
+        df = columns.to_frame()
+        self.assertEqual(df.columns.values.tolist(), ["a", "b", "c"])
+        self.assertEqual(df["a"].dtype, np.int64)
+        self.assertEqual(df["b"].dtype, np.float32)
+        self.assertEqual(df["c"].dtype, np.float64)
+        self.assertTrue(np.isnan(df["b"].iloc[0]))
+        self.assertTrue(np.isnan(df["c"].iloc[0]))
+        self.assertEqual(df["c"].iloc[2], 4.0)
@@ -0,0 +1,28 @@
+"""Tests for the elo ratings class."""
+import unittest
+
+from sportsfeatures.elo_ratings import EloRatings
+
+
+class TestEloRatings(unittest.TestCase):
+
+    def test_rate(self):
+        ratings = EloRatings()
+        ratings.reserve(4)
+        self.assertEqual(ratings.initial_rating(), (1500.0, 0.0))
+        ratings.rate([[0], [1]], [1.0, 0.0])
+        self.assertEqual(ratings.rating(0), (1516.0, 0.0))
+        self.assertEqual(ratings.rating(1), (1484.0, 0.0))
+        # Every member of a team moves by the change of the team.
+        ratings.rate([[0, 2], [1, 3]], [3.0, 3.0])
+        self.assertAlmostEqual(ratings.rating(0)[0] - 1516.0, ratings.rating(2)[0] - 1500.0)
+        self.assertLess(ratings.rating(0)[0], 1516.0)
+
+    def test_predict_win(self):
+        ratings = EloRatings()
+        ratings.reserve(3)
+        ratings.mus[:] = [1900.0, 1500.0, 1500.0]
+        first, second = ratings.predict_win([[0], [1]])
+        self.assertAlmostEqual(first, 1.0 / (1.0 + 10.0 ** -1.0))
+        self.assertAlmostEqual(first + second, 1.0)
+        self.assertEqual([x[0] for x in ratings.predict_rank([[1], [0], [2]])], [2, 1, 2])
@@ -0,0 +1,22 @@
+"""Tests for the entity interner class."""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sportsfeatures.entity_interner import EntityInterner
+from sportsfeatures.entity_type import EntityType
+
+
+class TestEntityInterner(unittest.TestCase):
+
+    def test_codes(self):
+        entities = EntityInterner()
+        team_codes = entities.codes(EntityType.TEAM, pd.Series(["a", None, "b", "a"]))
+        player_codes = entities.codes(EntityType.PLAYER, pd.Series(["a", "c"]))
+        self.assertEqual(team_codes.dtype, np.int32)
+        self.assertEqual(team_codes.tolist(), [0, -1, 1, 0])
+        self.assertEqual(player_codes.tolist(), [2, 3])
+        self.assertEqual(entities.codes(EntityType.TEAM, pd.Series(["b"])).tolist(), [1])
+        self.assertEqual(entities.keys, ["team_a", "team_b", "player_a", "player_c"])
+        self.assertEqual(entities.grow([None], None), [None, None, None, None])
@@ -0,0 +1,51 @@
+"""Tests for the exponentially weighted state class."""
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from sportsfeatures.ewm_rows import EwmRows
+from sportsfeatures.ewm_state import EwmState
+
+
+class TestEwmState(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.dts = pd.Series(pd.to_datetime("2022-01-01") + pd.to_timedelta(np.sort(rng.integers(0, 200, 20)), unit="D"))
+        self.values = rng.normal(size=(20, 2))
+        self.values[[3, 11], 0] = np.nan
+        self.codes = np.array([0, 1] * 10, dtype=np.int64)
+        self.seconds = self.dts.to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+        self.halflives = [datetime.timedelta(days=7), datetime.timedelta(days=60)]
+
+    def test_update(self):
+        means, variances = EwmState().update(EwmRows(self.codes, self.seconds, self.values, ["a", "b"]), self.halflives)
+        self.assertEqual(means.shape, (20, 2, 2))
+        for code in [0, 1]:
+            rows = self.codes == code
+            for count, halflife in enumerate(self.halflives):
+                expected_means = pd.Series(self.values[rows, 0]).ewm(halflife=halflife, times=self.dts[rows]).mean().shift(1)
+                np.testing.assert_allclose(means[rows, 0, count], expected_means.to_numpy())
+        # The variance weighs each value by its decay, with the unbiased correction.
+        rows = np.flatnonzero(self.codes == 0)
+        for position in range(2, len(rows)):
+            previous_rows = rows[:position]
+            values = self.values[previous_rows, 1]
+            weights = 0.5 ** ((self.seconds[previous_rows[-1]] - self.seconds[previous_rows]) / self.halflives[0].total_seconds())
+            mean = (weights * values).sum() / weights.sum()
+            variance = (weights * (values - mean) ** 2).sum() / weights.sum()
+            variance *= weights.sum() ** 2 / (weights.sum() ** 2 - (weights ** 2).sum())
+            self.assertAlmostEqual(variances[rows[position], 1, 0], variance)
+
+    def test_update_incremental(self):
+        means, variances = EwmState().update(EwmRows(self.codes, self.seconds, self.values, ["a", "b"]), self.halflives)
+        state = EwmState()
+        head_means, head_variances = state.update(EwmRows(self.codes[:7], self.seconds[:7], self.values[:7, :1], ["a"]), self.halflives)
+        tail_means, tail_variances = state.update(EwmRows(self.codes[7:], self.seconds[7:], self.values[7:, ::-1], ["b", "a"]), self.halflives)
+        np.testing.assert_allclose(head_means, means[:7, :1])
+        np.testing.assert_allclose(head_variances, variances[:7, :1])
+        np.testing.assert_allclose(tail_means[:, 1], means[7:, 0])
+        np.testing.assert_allclose(tail_variances[:, 1], variances[7:, 0])
+        self.assertEqual(state.sums.shape, (4, 2, 2, 2))
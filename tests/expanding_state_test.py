@@ -0,0 +1,44 @@
+"""Tests for the expanding state class."""
+import unittest
+
+import numpy as np
+import pandas as pd
+from timeseriesfeatures.columns import WINDOW_FUNCTIONS
+
+from sportsfeatures.expanding_state import ExpandingState
+
+
+class TestExpandingState(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.codes = rng.integers(0, 5, 300).astype(np.int64)
+        self.values = rng.normal(1000.0, 5.0, (300, 2)).round(1)
+        self.values[rng.random((300, 2)) < 0.2] = np.nan
+        self.values[self.codes == 3, 1] = 7.0
+        self.values[self.codes == 4, 0] = np.nan
+
+    def test_update(self):
+        state = ExpandingState()
+        parts = [
+            state.update(self.codes[x:y], self.values[x:y], ["a", "b"])
+            for x, y in [(0, 100), (100, 101), (101, 300)]
+        ]
+        for window_func in WINDOW_FUNCTIONS:
+            expected = np.full(self.values.shape, np.nan)
+            for count in range(2):
+                window = pd.Series(self.values[:, count]).groupby(self.codes).expanding()
+                values = getattr(window, window_func)().droplevel(0).sort_index()
+                expected[:, count] = values.groupby(self.codes).shift(1).to_numpy()
+            # The kurtosis of pandas loses a few digits to its running sums.
+            np.testing.assert_allclose(
+                np.concatenate([x[window_func] for x in parts]),
+                expected,
+                rtol=1e-5 if window_func == "kurt" else 1e-7,
+                atol=1e-9,
+                err_msg=window_func,
+            )
+        np.testing.assert_array_equal(state.counts(self.codes[:2], ["b", "a"]), [
+            [np.sum(~np.isnan(self.values[self.codes == x, 1])), np.sum(~np.isnan(self.values[self.codes == x, 0]))]
+            for x in self.codes[:2]
+        ])
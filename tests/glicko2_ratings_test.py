@@ -0,0 +1,29 @@
+"""Tests for the glicko-2 ratings class."""
+import unittest
+
+from sportsfeatures.glicko2_ratings import Glicko2Ratings
+
+
+class TestGlicko2Ratings(unittest.TestCase):
+
+    def test_rate(self):
+        # The worked example of the glicko-2 paper, as a match of four players.
+        ratings = Glicko2Ratings()
+        ratings.reserve(4)
+        ratings.mus[:] = [1500.0, 1400.0, 1550.0, 1700.0]
+        ratings.sigmas[:] = [200.0, 30.0, 100.0, 300.0]
+        ratings.rate([[0], [1], [2], [3]], [2.0, 1.0, 3.0, 4.0])
+        mu, sigma = ratings.rating(0)
+        self.assertAlmostEqual(mu, 1464.06, places=1)
+        self.assertAlmostEqual(sigma, 151.52, places=1)
+        self.assertAlmostEqual(ratings.volatilities[0], 0.05999, places=4)
+
+    def test_predict_rank(self):
+        ratings = Glicko2Ratings()
+        ratings.reserve(4)
+        self.assertEqual(ratings.predict_rank([[0, 1], [2, 3]]), [(1, 0.5), (1, 0.5)])
+        ratings.rate([[0, 1], [2, 3]], None)
+        (first_rank, first_probability), (second_rank, _) = ratings.predict_rank([[0, 1], [2, 3]])
+        self.assertEqual((first_rank, second_rank), (1, 2))
+        self.assertGreater(first_probability, 0.5)
+        self.assertLess(ratings.rating(0)[1], ratings.initial_rating()[1])
@@ -0,0 +1,31 @@
+"""Tests for the match components functions."""
+import datetime
+import unittest
+
+from sportsfeatures.match import Match
+from sportsfeatures.match_components import match_components, partition_matches
+from sportsfeatures.team import Team
+
+
+class TestMatchComponents(unittest.TestCase):
+
+    def setUp(self):
+        dt = datetime.datetime(2022, 1, 1)
+        self.matches = [
+            Match([Team([4], None, 0, []), Team([5], None, 1, [])], dt),
+            Match([Team([], None, 2, []), Team([], None, 3, [])], dt),
+            Match([Team([5], None, 3, []), Team([], None, 6, [])], dt),
+            Match([Team([], None, 7, []), Team([], None, 8, [])], dt),
+            Match([], dt),
+        ]
+
+    def test_match_components(self):
+        labels = match_components(self.matches, 9).tolist()
+        self.assertEqual(labels[0], labels[1])
+        self.assertEqual(labels[0], labels[2])
+        self.assertEqual(len(set(labels)), 3)
+
+    def test_partition_matches(self):
+        partitions = partition_matches(self.matches, 9, 2)
+        self.assertEqual([x.tolist() for x in partitions], [[0, 1, 2], [3, 4]])
+        self.assertEqual(len(partition_matches(self.matches, 9, 8)), 3)
@@ -0,0 +1,59 @@
+"""Tests for the match log class."""
+import datetime
+import unittest
+
+from sportsfeatures.match import Match
+from sportsfeatures.match_log import MatchLog
+from sportsfeatures.team import Team
+
+
+class TestMatchLog(unittest.TestCase):
+
+    def _match(self, day):
+        return Match(
+            [
+                Team([day, day + 1], 2.0, 100 + day, [7]),
+                Team([day + 2], None, 200 + day, []),
+            ],
+            datetime.datetime(2022, 1, 1) + datetime.timedelta(days=day),
+        )
+
+    def test_log(self):
+        log = MatchLog()
+        log.skip()
+        for day in range(40):
+            log.append(self._match(day), day % 2 == 0)
+        self.assertEqual(len(log), 40)
+        self.assertEqual(log.first, 1)
+        match = log.match(4)
+        self.assertEqual(match.dt, datetime.datetime(2022, 1, 4))
+        self.assertEqual([x.identifier for x in match.teams], [103, 203])
+        self.assertEqual(match.teams[0].players, [3, 4])
+        self.assertEqual(match.teams[0].points, 2.0)
+        self.assertEqual(match.teams[0].coaches, [7])
+        self.assertIsNone(match.teams[1].points)
+        self.assertEqual(match.teams[1].coaches, [])
+        self.assertTrue(log.rated(1))
+        self.assertFalse(log.rated(2))
+
+        copied = log.copy()
+        log.drop(30)
+        self.assertEqual(len(log), 11)
+        self.assertEqual(log.match(30).teams[1].players, [31])
+        for day in range(40, 80):
+            log.append(self._match(day), True)
+        self.assertEqual(log.match(79).teams[0].players, [78, 79])
+        self.assertEqual(log.dt(79), log.match(79).dt.value)
+        self.assertEqual(len(copied.matches()), 40)
+        log.drop(log.end)
+        self.assertEqual(log.matches(), [])
+
+    def test_merge_rated(self):
+        log = MatchLog()
+        for day in range(3):
+            log.append(self._match(day), False)
+        other = log.copy()
+        other.append(self._match(3), True)
+        log.append(self._match(3), False)
+        log.merge_rated([other])
+        self.assertEqual([log.rated(x) for x in range(4)], [False] * 3 + [True])
@@ -0,0 +1,93 @@
+"""Tests for the multi window rating class."""
+import datetime
+import unittest
+
+from openskill.models import PlackettLuce
+
+from sportsfeatures.entity_type import EntityType
+from sportsfeatures.identifier import Identifier
+from sportsfeatures.multi_window_rating import MultiWindowRating
+from sportsfeatures.rating_model_type import RatingModelType
+from sportsfeatures.rating_window_mode import RatingWindowMode
+from sportsfeatures.windowed_rating import WindowedRating
+
+
+class TestMultiWindowRating(unittest.TestCase):
+
+    def setUp(self):
+        self.teams = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1"),
+        ]
+
+    def _add(self, ratings, day):
+        row = {
+            "dt": datetime.datetime(2022, 1, 1) + datetime.timedelta(days=day),
+            "teams/0/id": "a",
+            "teams/1/id": "b",
+        }
+        return ratings.add(row, "dt", self.teams, [], [])
+
+    def test_windows(self):
+        model = PlackettLuce()
+        window = datetime.timedelta(days=2)
+        ratings = MultiWindowRating()
+        ratings.rating_window(None)
+        ratings.rating_window(window)
+        self._add(ratings, 0)
+        self._add(ratings, 1)
+        late_window = datetime.timedelta(days=1)
+        ratings.rating_window(late_window)
+        results = self._add(ratings, 5)
+        self.assertEqual(set(results), {None, window, late_window})
+        # The late window has not rated a match yet, nor reversed the earlier ones.
+        self.assertEqual(results[late_window][0][0][0], model.mu)
+        # The two day window has reversed both matches, the full history has not.
+        self.assertNotEqual(results[window][0][0], results[None][0][0])
+        self.assertEqual(ratings.rating_windows[late_window].window, late_window)
+
+    def test_checkpoint_window(self):
+        window = datetime.timedelta(days=2)
+        ratings = MultiWindowRating()
+        ratings.rating_window(
+            window, RatingWindowMode.CHECKPOINT, datetime.timedelta(days=1)
+        )
+        for day in range(4):
+            results = self._add(ratings, day)
+        # Rebuilt at every match, the window only holds the two matches before.
+        expected = MultiWindowRating()
+        expected.rating_window(None)
+        for day in range(1, 4):
+            expected_results = self._add(expected, day)
+        self.assertEqual(results[window], expected_results[None])
+
+    def test_decay_window(self):
+        model = PlackettLuce()
+        window = datetime.timedelta(days=100)
+        ratings = MultiWindowRating()
+        ratings.rating_window(None)
+        ratings.rating_window(window, RatingWindowMode.DECAY)
+        self._add(ratings, 0)
+        results = self._add(ratings, 1)
+        # A day idle takes the sigma part of the way back to the initial sigma.
+        self.assertGreater(results[window][0][0][1], results[None][0][0][1])
+        self.assertLess(results[window][0][0][1], model.sigma)
+        results = self._add(ratings, 200)
+        # After a whole window idle the sigma is back, but the mu is kept.
+        self.assertAlmostEqual(results[window][0][0][1], model.sigma)
+        self.assertNotEqual(results[window][0][0][0], model.mu)
+        # Only the full history would ever need the logged matches.
+        self.assertEqual(ratings.matches, [])
+
+    def test_checkpoint_needs_interval(self):
+        with self.assertRaises(ValueError):
+            MultiWindowRating().rating_window(
+                datetime.timedelta(days=2), RatingWindowMode.CHECKPOINT
+            )
+
+    def test_restore_other_models(self):
+        ratings = MultiWindowRating()
+        self._add(ratings, 0)
+        snapshot = ratings.rating_window(None).snapshot(2)
+        with self.assertRaises(ValueError):
+            WindowedRating(None, models={EntityType.TEAM: RatingModelType.ELO}).restore(snapshot)
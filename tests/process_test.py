@@ -3,18 +3,88 @@ import datetime
 import os
 import tempfile
 import unittest
+from unittest import mock
 
 import pandas as pd
+from joblib import Parallel, delayed
+from pandas.testing import assert_frame_equal
+
+import sportsfeatures.process as process_module
+import sportsfeatures.skill_process as skill_process_module
+import sportsfeatures.timeseries_process as timeseries_process_module
 
 from sportsfeatures.process import process
 from sportsfeatures.identifier import Identifier
 from sportsfeatures.entity_type import EntityType
 from sportsfeatures.bet import Bet
 from sportsfeatures.news import News
+from sportsfeatures.stage import run_stages
+from sportsfeatures.timeseries_backend import TimeseriesBackend
+from sportsfeatures.timeseries_cache import TimeseriesCache
+
+
+def _with_pid(function, args, kwargs):
+    return os.getpid(), function(*args, **kwargs)
+
+
+class _PidParallel:
+    # A pool of two workers, whatever the number of CPUs, recording the process
+    # each task ran in.
+    pids: list[int] = []
+    jobs: list[int] = []
+
+    def __init__(self, **kwargs):
+        _PidParallel.jobs.append(kwargs["n_jobs"])
+        self.parallel = Parallel(**{**kwargs, "n_jobs": 2})
+
+    def __call__(self, tasks):
+        outputs = self.parallel(delayed(_with_pid)(*x) for x in tasks)
+        _PidParallel.pids.extend(x[0] for x in outputs)
+        return [x[1] for x in outputs]
+
+
+def _run_two_stages(df, stages, n_jobs=1, report=None):
+    # The stages run two at a time, as they would with more than one CPU.
+    return run_stages(df, stages, n_jobs=1 if n_jobs == 1 else 2, report=report)
+
+
+def _skill_df(leagues):
+    # Every league has its own teams, which never meet those of another league.
+    dt_column = "dt"
+    rows = 12
+    df = pd.DataFrame(data={
+        dt_column: [datetime.datetime(2022, 1, 1) + datetime.timedelta(days=x) for x in range(rows)],
+        "teams/0/id": [f"{x % leagues}_{x % 3}" for x in range(rows)],
+        "teams/0/points": [float(x % 5) for x in range(rows)],
+        "teams/1/id": [f"{x % leagues}_{(x + 1) % 3}" for x in range(rows)],
+        "teams/1/points": [float(x % 7) for x in range(rows)],
+    })
+    identifiers = [
+        Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+        Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+    ]
+    return df, identifiers
 
 
 class TestProcess(unittest.TestCase):
 
+    def _skill_pids(self, df, identifiers, windows):
+        # The skill features from process along with the processes that rated them.
+        current_dir = os.getcwd()
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                os.chdir(tmpdir)
+                expected_df = process(df.copy(), "dt", identifiers, windows, set(), use_news_features=False, reduce_input=False, use_multiprocessing=False)
+                _PidParallel.pids = []
+                _PidParallel.jobs = []
+                with mock.patch.object(skill_process_module, "Parallel", _PidParallel), mock.patch.object(skill_process_module, "cpu_count", lambda: 2), mock.patch.object(process_module, "run_stages", _run_two_stages):
+                    parallel_df = process(df.copy(), "dt", identifiers, windows, set(), use_news_features=False, reduce_input=False, use_multiprocessing=True)
+        finally:
+            os.chdir(current_dir)
+        skill_columns = [x for x in expected_df.columns if "_skill_" in x]
+        assert_frame_equal(parallel_df[skill_columns], expected_df[skill_columns])
+        return _PidParallel.pids
+
     def test_process(self):
         current_dir = os.getcwd()
         try:
@@ -158,3 +228,47 @@ class TestProcess(unittest.TestCase):
                 print(df.columns.values)
         finally:
             os.chdir(current_dir)
+
+    def test_process_skill_windows_in_workers(self):
+        df, identifiers = _skill_df(1)
+        windows = [datetime.timedelta(days=x) for x in [2, 3, 5, 7]] + [None]
+        pids = self._skill_pids(df, identifiers, windows)
+        # Each window is rated in a worker process rather than in the process
+        # running the stages.
+        self.assertEqual(len(pids), len(windows))
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_process_skill_leagues_in_workers(self):
+        df, identifiers = _skill_df(2)
+        windows = [datetime.timedelta(days=2), None]
+        pids = self._skill_pids(df, identifiers, windows)
+        # The leagues never meet, so each is rated for each window in a worker
+        # process of its own.
+        self.assertEqual(len(pids), len(windows) * 2)
+        self.assertNotIn(os.getpid(), pids)
+
+    def test_process_timeseries_batches_in_workers(self):
+        df, identifiers = _skill_df(2)
+        current_dir = os.getcwd()
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                os.chdir(tmpdir)
+                _PidParallel.pids = []
+                _PidParallel.jobs = []
+                with mock.patch.object(timeseries_process_module, "Parallel", _PidParallel), mock.patch.object(process_module, "run_stages", _run_two_stages):
+                    process(df, "dt", identifiers, [datetime.timedelta(days=2), None], set(), use_news_features=False, reduce_input=False, use_multiprocessing=True, timeseries_batch_rows=4, timeseries_n_jobs=3)
+        finally:
+            os.chdir(current_dir)
+        # The batches of the timeseries stage are computed in worker processes,
+        # with the pool size and batch size given to process.
+        self.assertEqual(_PidParallel.jobs, [3])
+        self.assertGreater(len(_PidParallel.pids), 1)
+        self.assertNotIn(os.getpid(), _PidParallel.pids)
+
+    def test_process_memory_cache(self):
+        df, identifiers = _skill_df(1)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # The memory backend has no use for a cache, which is rejected before any stage runs.
+            with mock.patch.object(process_module, "run_stages") as run_stages_mock, self.assertRaises(ValueError):
+                process(df, "dt", identifiers, [None], set(), timeseries_backend=TimeseriesBackend.MEMORY, timeseries_cache=TimeseriesCache(folder=tmpdir))
+            run_stages_mock.assert_not_called()
@@ -0,0 +1,31 @@
+"""Tests for the rating model interface."""
+import unittest
+
+import numpy as np
+
+from sportsfeatures.rating_model_type import RatingModelType
+from sportsfeatures.windowed_rating import rating_model
+
+
+class TestRatingModel(unittest.TestCase):
+
+    def test_predict_ranks(self):
+        matches = [
+            [[0], [1]],
+            [[2, 3], [4], [5, 0]],
+            [[1], [1]],
+            [[6, 7], [2], [3], [4, 5]],
+        ]
+        for model_type in RatingModelType:
+            model = rating_model(model_type)
+            model.reserve(8)
+            model.rate([[0, 2], [4]], [3.0, 1.0])
+            model.rate([[5], [6], [1]], [1.0, 2.0, 3.0])
+            model.rate([[7], [3]], None)
+            codes = np.asarray([z for x in matches for y in x for z in y])
+            groups = np.repeat(np.arange(sum(len(x) for x in matches)), [len(y) for x in matches for y in x])
+            group_matches = np.repeat(np.arange(len(matches)), [len(x) for x in matches])
+            ranks, probabilities = model.predict_ranks(model.mus[codes], model.sigmas[codes], groups, group_matches)
+            expected = [y for x in matches for y in model.predict_rank(x)]
+            self.assertEqual(ranks.tolist(), [x[0] for x in expected], model_type)
+            np.testing.assert_allclose(probabilities, [x[1] for x in expected], rtol=1e-12)
@@ -0,0 +1,79 @@
+"""Tests for the rating store class."""
+import unittest
+
+from openskill.models import PlackettLuce
+
+from sportsfeatures.rating_store import RatingStore
+
+
+class TestRatingStore(unittest.TestCase):
+
+    def test_rate(self):
+        model = PlackettLuce()
+        store = RatingStore(PlackettLuce())
+        store.reserve(3)
+        self.assertEqual(store.rating(2), (model.mu, model.sigma))
+        store.rate([[0], [2]], [1.0, 0.0])
+        expected = model.rate([[model.rating()], [model.rating()]], scores=[1.0, 0.0])
+        self.assertAlmostEqual(store.rating(0)[0], expected[0][0].mu)
+        self.assertAlmostEqual(store.rating(2)[1], expected[1][0].sigma)
+        self.assertEqual(store.rating(1), (model.mu, model.sigma))
+        store.reserve(5)
+        self.assertAlmostEqual(store.rating(0)[0], expected[0][0].mu)
+        self.assertEqual(store.rating(4), (model.mu, model.sigma))
+        rank = store.predict_rank([[0], [2]])
+        self.assertEqual(rank[0][0], 1)
+        store.reset()
+        self.assertEqual(store.rating(0), (model.mu, model.sigma))
+
+    def test_closed_form_matches_openskill(self):
+        model = PlackettLuce()
+        store = RatingStore(PlackettLuce())
+        store.reserve(6)
+        store.rate([[0, 1, 2], [3, 4, 5]], [2.0, 1.0])
+        for teams, scores in [
+            ([[0, 1], [3, 4, 5]], None),
+            ([[2], [5, 3]], [1.0, 3.0]),
+            ([[0, 4], [1, 3]], [2.0, 2.0]),
+        ]:
+            ratings = store.materialize(teams)
+            expected_rank = model.predict_rank(ratings)
+            for (rank, probability), (expected, expected_probability) in zip(
+                store.predict_rank(teams), expected_rank
+            ):
+                self.assertEqual(rank, expected)
+                self.assertAlmostEqual(probability, expected_probability)
+            expected_ratings = model.rate(ratings, scores=scores)
+            store.rate(teams, scores)
+            for team, team_ratings in zip(teams, expected_ratings):
+                for code, rating in zip(team, team_ratings):
+                    self.assertAlmostEqual(store.rating(code)[0], rating.mu)
+                    self.assertAlmostEqual(store.rating(code)[1], rating.sigma)
+
+    def test_predict_win_matches_openskill(self):
+        model = PlackettLuce()
+        store = RatingStore(PlackettLuce())
+        store.reserve(6)
+        store.rate([[0, 1, 2], [3, 4, 5]], [2.0, 1.0])
+        store.rate([[0, 4], [1, 3]], [1.0, 3.0])
+        for teams in [[[0, 1], [3, 4, 5]], [[2], [5, 3]], [[0, 0], [1]], [[0], [1], [2]]]:
+            for probability, expected in zip(
+                store.predict_win(teams), model.predict_win(store.materialize(teams))
+            ):
+                self.assertAlmostEqual(probability, expected)
+
+    def test_decay(self):
+        model = PlackettLuce()
+        store = RatingStore(PlackettLuce())
+        store.reserve(2)
+        store.rate([[0], [1]], [1.0, 0.0])
+        store.decay([0, 1], 0.0, 100.0)
+        rated = store.rating(0)
+        self.assertLess(rated[1], model.sigma)
+        store.decay([0], 1.0, 100.0)
+        self.assertAlmostEqual(
+            store.rating(0)[1], (rated[1] ** 2 + model.sigma**2 / 100.0) ** 0.5
+        )
+        self.assertEqual(store.rating(0)[0], rated[0])
+        store.decay([0], 101.0, 100.0)
+        self.assertAlmostEqual(store.rating(0)[1], model.sigma)
@@ -1,11 +1,17 @@
 """Tests for the skill process function."""
 import datetime
 import os
+import tempfile
 import unittest
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
+from sportsfeatures.feature_state import FeatureState
+from sportsfeatures.multi_window_rating import MultiWindowRating
+from sportsfeatures.rating_model_type import RatingModelType
+from sportsfeatures.rating_snapshot import load_ratings, save_ratings
+from sportsfeatures.rating_window_mode import RatingWindowMode
 from sportsfeatures.skill_process import skill_process
 from sportsfeatures.identifier import Identifier
 from sportsfeatures.entity_type import EntityType
@@ -55,3 +61,142 @@ class TestSkillProcess(unittest.TestCase):
         #print(new_df)
         #expected_df = pd.DataFrame()
         assert_frame_equal(new_df, expected_df)
+
+    def test_skill_process_incremental(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 7)],
+            "teams/0/id": ["0", "1", "0", "2", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0, 10.0, 5.0, 30.0],
+            "teams/1/id": ["1", "0", "2", "1", "2", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0, 15.0, 1.0, 10.0],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+        ]
+        windows = [datetime.timedelta(days=2), None]
+        expected_df = skill_process(df.copy(), dt_column, identifiers, windows)
+        state = FeatureState()
+        head_df = skill_process(df.iloc[:4].copy(), dt_column, identifiers, windows, state=state)
+        tail_df = skill_process(df.iloc[4:].reset_index(drop=True), dt_column, identifiers, windows, state=state)
+        assert_frame_equal(pd.concat([head_df, tail_df], ignore_index=True), expected_df)
+
+    def test_skill_process_players(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 4)],
+            "teams/0/id": ["0", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0],
+            "teams/0/players/0/id": ["a", "c", "a"],
+            "teams/1/id": ["1", "0", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0],
+            "teams/1/players/0/id": ["c", "a", "c"],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+            Identifier(EntityType.PLAYER, "teams/0/players/0/id", [], "teams/0/players/0", team_identifier_column="teams/0/id"),
+            Identifier(EntityType.PLAYER, "teams/1/players/0/id", [], "teams/1/players/0", team_identifier_column="teams/1/id"),
+        ]
+        new_df = skill_process(df, dt_column, identifiers, [None])
+        self.assertEqual(new_df["teams/0/players/0_skill_all_mu"].iloc[0], new_df["teams/1/players/0_skill_all_mu"].iloc[0])
+        self.assertGreater(new_df["teams/0/players/0_skill_all_mu"].iloc[1], new_df["teams/1/players/0_skill_all_mu"].iloc[1])
+        self.assertEqual(new_df["teams/0/players/0_skill_all_ranking"].tolist(), new_df["teams/0_skill_all_ranking"].tolist())
+
+    def test_skill_process_multiprocessing(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 7)],
+            "teams/0/id": ["0", "1", "0", "2", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0, 10.0, 5.0, 30.0],
+            "teams/1/id": ["1", "0", "2", "1", "2", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0, 15.0, 1.0, 10.0],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+        ]
+        windows = [datetime.timedelta(days=2), None]
+        expected_df = skill_process(df.copy(), dt_column, identifiers, windows)
+        state = FeatureState()
+        head_df = skill_process(df.iloc[:4].copy(), dt_column, identifiers, windows, state=state, use_multiprocessing=True)
+        tail_df = skill_process(df.iloc[4:].reset_index(drop=True), dt_column, identifiers, windows, state=state, use_multiprocessing=True)
+        assert_frame_equal(pd.concat([head_df, tail_df], ignore_index=True), expected_df)
+
+    def test_skill_process_snapshot(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 7)],
+            "teams/0/id": ["0", "1", "0", "2", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0, 10.0, 5.0, 30.0],
+            "teams/1/id": ["1", "0", "2", "1", "2", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0, 15.0, 1.0, 10.0],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+        ]
+        windows = [datetime.timedelta(days=2), datetime.timedelta(days=3), None]
+        window_modes = {datetime.timedelta(days=3): RatingWindowMode.DECAY}
+        expected_df = skill_process(df.copy(), dt_column, identifiers, windows, window_modes=window_modes)
+        ratings = MultiWindowRating()
+        skill_process(df.iloc[:4].copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=ratings)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "ratings.npz")
+            save_ratings(ratings, path)
+            loaded = load_ratings(path)
+        warm_df = skill_process(df.copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=loaded, start_dt=datetime.datetime(2022, 1, 5))
+        self.assertTrue(warm_df["teams/0_skill_all_mu"].iloc[:4].isna().all())
+        assert_frame_equal(warm_df.iloc[4:], expected_df.iloc[4:], check_dtype=False)
+
+    def test_skill_process_rating_models(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 4)],
+            "teams/0/id": ["0", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0],
+            "teams/0/players/0/id": ["a", "c", "a"],
+            "teams/1/id": ["1", "0", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0],
+            "teams/1/players/0/id": ["c", "a", "c"],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+            Identifier(EntityType.PLAYER, "teams/0/players/0/id", [], "teams/0/players/0", team_identifier_column="teams/0/id"),
+            Identifier(EntityType.PLAYER, "teams/1/players/0/id", [], "teams/1/players/0", team_identifier_column="teams/1/id"),
+        ]
+        rating_models = {EntityType.TEAM: RatingModelType.GLICKO2, EntityType.PLAYER: RatingModelType.ELO}
+        new_df = skill_process(df, dt_column, identifiers, [None], rating_models=rating_models)
+        self.assertEqual(new_df["teams/0/players/0_skill_all_mu"].tolist()[:2], [1500.0, 1516.0])
+        self.assertAlmostEqual(new_df["teams/0/players/0_skill_all_mu"].iloc[2], 1484.0 + 32.0 / (1.0 + 10.0 ** (-32.0 / 400.0)))
+        self.assertEqual(new_df["teams/0_skill_all_sigma"].iloc[0], 350.0)
+        self.assertLess(new_df["teams/0_skill_all_sigma"].iloc[2], 350.0)
+        self.assertEqual(new_df["teams/0/players/0_skill_all_ranking"].tolist(), new_df["teams/0_skill_all_ranking"].tolist())
+
+    def test_skill_process_score_only(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 7)],
+            "teams/0/id": ["0", "1", "0", "2", "1", "0"],
+            "teams/0/points": [10.0, 20.0, 30.0, 10.0, 5.0, 30.0],
+            "teams/1/id": ["1", "0", "2", "1", "2", "1"],
+            "teams/1/points": [20.0, 40.0, 60.0, 15.0, 1.0, 10.0],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+        ]
+        windows = [datetime.timedelta(days=3), None]
+        window_modes = {datetime.timedelta(days=3): RatingWindowMode.DECAY}
+        ratings = MultiWindowRating()
+        skill_process(df.iloc[:4].copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=ratings)
+        fixtures_df = df.iloc[4:].reset_index(drop=True)
+        scored_df = skill_process(fixtures_df.copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=ratings, score_only=True)
+        # The ratings are frozen, so scoring the fixtures again changes nothing.
+        assert_frame_equal(skill_process(fixtures_df.copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=ratings, score_only=True), scored_df)
+        # Until a match is rated, the predictions are those made while rating.
+        rated_df = skill_process(fixtures_df.copy(), dt_column, identifiers, windows, window_modes=window_modes, ratings=ratings)
+        assert_frame_equal(scored_df.iloc[:1], rated_df.iloc[:1])
+        self.assertNotEqual(scored_df["teams/1_skill_all_mu"].iloc[1], rated_df["teams/1_skill_all_mu"].iloc[1])
@@ -0,0 +1,111 @@
+"""Tests for the stage scheduler."""
+import json
+import os
+import unittest
+
+import pandas as pd
+from joblib import Parallel, delayed
+from pandas.testing import assert_frame_equal
+
+from sportsfeatures.performance_report import PerformanceReport
+from sportsfeatures.stage import Stage, _stage_levels, run_stages
+
+
+def _add_column(df, source, target):
+    df[target] = df[source] * 2
+    return df
+
+
+def _count_up(value):
+    total = 0.0
+    for count in range(2_000_000):
+        total += count % 3
+    return value + total
+
+
+def _add_worker_column(df):
+    df["c"] = Parallel(n_jobs=2)(delayed(_count_up)(x) for x in df["a"])
+    return df
+
+
+def _worker_pid(value):
+    return float(os.getpid())
+
+
+def _add_worker_pids(df, source, target):
+    df[target] = Parallel(n_jobs=2)(delayed(_worker_pid)(x) for x in df[source])
+    return df
+
+
+class TestStage(unittest.TestCase):
+
+    def test_run_stages(self):
+        df = pd.DataFrame(data={"b": [1.0, 2.0], "a": [3.0, 4.0]})
+        stages = [
+            Stage("first", lambda x: _add_column(x, "a", "c"), reads={"a"}, writes={"c"}),
+            Stage("second", lambda x: _add_column(x, "b", "d"), reads={"b"}),
+            Stage("third", lambda x: _add_column(x, "c", "e"), reads={"c"}),
+            Stage("fourth", lambda x: x.drop(columns=["b"])),
+        ]
+        levels = _stage_levels(stages)
+        self.assertEqual([[x.name for x in level] for level in levels], [["first", "second"], ["third"], ["fourth"]])
+        expected_df = pd.DataFrame(data={
+            "a": [3.0, 4.0],
+            "c": [6.0, 8.0],
+            "d": [2.0, 4.0],
+            "e": [12.0, 16.0],
+        })
+        assert_frame_equal(run_stages(df, stages, n_jobs=2), expected_df)
+
+    def test_run_stages_report(self):
+        df = pd.DataFrame(data={"a": [3.0, 4.0]})
+        report = PerformanceReport()
+        run_stages(df, [Stage("first", lambda x: _add_column(x, "a", "c"), reads={"a"})], report=report)
+        self.assertEqual([x.name for x in report.stages], ["first"])
+        stage_report = json.loads(report.to_json())["stages"][0]
+        self.assertEqual(stage_report["input_rows"], 2)
+        self.assertEqual(stage_report["input_columns"], 1)
+        self.assertEqual(stage_report["output_columns"], 1)
+        self.assertEqual(stage_report["columns_added"], 1)
+
+    def test_run_stages_worker_processes(self):
+        df = pd.DataFrame(data={"b": [1.0, 2.0], "a": [3.0, 4.0]})
+        stages = [
+            Stage("first", lambda x: _add_worker_pids(x, "a", "c"), reads={"a"}, writes={"c"}),
+            Stage("second", lambda x: _add_worker_pids(x, "b", "d"), reads={"b"}),
+            Stage("third", lambda x: _add_worker_pids(x, "c", "e"), reads={"c"}),
+        ]
+        output_df = run_stages(df, stages, n_jobs=2)
+        # The pools inside the stages still start worker processes, whether the
+        # stage shares its level or runs alone.
+        for column in ["c", "d", "e"]:
+            self.assertNotIn(float(os.getpid()), output_df[column].tolist())
+
+    @unittest.skipUnless(os.path.exists("/proc/self/task"), "needs /proc to see the live workers")
+    def test_run_stages_report_workers(self):
+        df = pd.DataFrame(data={"a": [3.0, 4.0]})
+        report = PerformanceReport()
+        stages = [
+            Stage("workers", _add_worker_column, reads={"a"}),
+            Stage("first", lambda x: _add_column(x, "a", "d"), reads={"a"}),
+        ]
+        run_stages(df, stages, report=report)
+        # The CPU time spent in the worker processes is counted apart from the stage
+        # thread, while the workers are left running for the later stages.
+        self.assertGreater(report.stages[0].worker_cpu_time, 0.1)
+        self.assertLess(report.stages[1].worker_cpu_time, 0.1)
+        self.assertGreaterEqual(report.stages[1].worker_cpu_time, 0.0)
+        self.assertGreater(report.worker_peak_memory, 0)
+        self.assertEqual(json.loads(report.to_json())["worker_peak_memory"], report.worker_peak_memory)
+
+    def test_run_stages_block(self):
+        df = pd.DataFrame(data={"b": [1.0, 2.0], "a": [3.0, 4.0]})
+        stages = [
+            Stage("first", lambda x: pd.DataFrame({"c": x["a"] * 2}), reads={"a"}, block=True),
+            Stage("second", lambda x: x.drop(columns=["b"]), reads=lambda columns: {"b"}),
+        ]
+        expected_df = pd.DataFrame(data={
+            "a": [3.0, 4.0],
+            "c": [6.0, 8.0],
+        })
+        assert_frame_equal(run_stages(df, stages), expected_df)
@@ -0,0 +1,44 @@
+"""Tests for the timeseries cache class."""
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from sportsfeatures.timeseries_cache import TimeseriesCache
+
+
+class TestTimeseriesCache(unittest.TestCase):
+
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = TimeseriesCache(folder=tmpdir)
+            df = pd.DataFrame(data={"/kicks": [1.0, 2.0]}, index=[4, 7])
+            key = cache.fingerprint(df, "config")
+            self.assertIsNone(cache.get(key))
+            cache.put(key, df)
+            assert_frame_equal(cache.get(key), df)
+
+    def test_fingerprint(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = TimeseriesCache(folder=tmpdir)
+            df = pd.DataFrame(data={"/kicks": [1.0, 2.0]})
+            key = cache.fingerprint(df, "config")
+            self.assertEqual(cache.fingerprint(df.copy(), "config"), key)
+            self.assertNotEqual(cache.fingerprint(df, "other"), key)
+            self.assertNotEqual(cache.fingerprint(df.set_axis([1, 2]), "config"), key)
+            self.assertNotEqual(cache.fingerprint(df.rename(columns={"/kicks": "/goals"}), "config"), key)
+            self.assertNotEqual(cache.fingerprint(pd.DataFrame(data={"/kicks": [1.0, 3.0]}), "config"), key)
+
+    def test_prune(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = TimeseriesCache(folder=tmpdir)
+            for count in range(3):
+                cache.put(str(count), pd.DataFrame(data={"/kicks": [float(count)]}))
+                os.utime(os.path.join(tmpdir, f"{count}.parquet"), (count, count))
+            cache.max_size = os.path.getsize(os.path.join(tmpdir, "0.parquet")) * 2
+            cache.prune()
+            self.assertIsNone(cache.get("0"))
+            self.assertIsNotNone(cache.get("1"))
+            self.assertIsNotNone(cache.get("2"))
@@ -1,15 +1,20 @@
 """Tests for the timeseries process function."""
 import datetime
-import os
 import tempfile
 import unittest
+from unittest import mock
 
 import pandas as pd
 from pandas.testing import assert_frame_equal
 
-from sportsfeatures.timeseries_process import _extract_identifier_timeseries, _process_identifier_ts, _COLUMN_PREFIX_COLUMN
+from sportsfeatures.feature_state import FeatureState
+from sportsfeatures.timeseries_process import _identifier_timeseries, _process_identifier_ts, _write_ts_features, _COLUMN_PREFIX_COLUMN, timeseries_process
 from sportsfeatures.identifier import Identifier
 from sportsfeatures.entity_type import EntityType
+from sportsfeatures.timeseries_backend import TimeseriesBackend
+from sportsfeatures.timeseries_cache import TimeseriesCache
+from sportsfeatures.timeseries_spec import TimeseriesSpec
+from sportsfeatures import timeseries_process as timeseries_process_module
 
 
 class TestTimeseriesProcess(unittest.TestCase):
@@ -45,29 +50,22 @@ class TestTimeseriesProcess(unittest.TestCase):
                 team_1_column_prefix,
             ),
         ]
-        with tempfile.TemporaryDirectory() as tmpdir:
-            _extract_identifier_timeseries(df, identifiers, dt_column, tmpdir)
-            ts_dfs = {}
-            for path in os.listdir(tmpdir):
-                if not path.endswith(".parquet"):
-                    continue
-                root, _ = os.path.splitext(path)
-                ts_dfs[root] = pd.read_parquet(os.path.join(tmpdir, path))
-            expected_ts_dfs = {
-                "_".join([EntityType.TEAM, team_0_id]): pd.DataFrame(data={
-                    _COLUMN_PREFIX_COLUMN: [team_0_column_prefix, team_1_column_prefix, team_0_column_prefix],
-                    dt_column: df[dt_column],
-                    "/kicks": [10.0, 40.0, 30.0],
-                }),
-                "_".join([EntityType.TEAM, team_1_id]): pd.DataFrame(data={
-                    _COLUMN_PREFIX_COLUMN: [team_1_column_prefix, team_0_column_prefix, team_1_column_prefix],
-                    dt_column: df[dt_column],
-                    "/kicks": [20.0, 20.0, 60.0],
-                })
-            }
-            for key, value in expected_ts_dfs.items():
-                compare_value = ts_dfs[key]
-                assert_frame_equal(value, compare_value)
+        ts_dfs = _identifier_timeseries(df, identifiers, dt_column)
+        expected_ts_dfs = {
+            "_".join([EntityType.TEAM, team_0_id]): pd.DataFrame(data={
+                _COLUMN_PREFIX_COLUMN: [team_0_column_prefix, team_1_column_prefix, team_0_column_prefix],
+                dt_column: df[dt_column],
+                "/kicks": [10.0, 40.0, 30.0],
+            }),
+            "_".join([EntityType.TEAM, team_1_id]): pd.DataFrame(data={
+                _COLUMN_PREFIX_COLUMN: [team_1_column_prefix, team_0_column_prefix, team_1_column_prefix],
+                dt_column: df[dt_column],
+                "/kicks": [20.0, 20.0, 60.0],
+            })
+        }
+        for key, value in expected_ts_dfs.items():
+            compare_value = ts_dfs[key]
+            assert_frame_equal(value, compare_value)
 
     def test_process_identifier_ts(self):
         dt_column = "dt"
@@ -79,11 +77,7 @@ class TestTimeseriesProcess(unittest.TestCase):
             })
         }
         with tempfile.TemporaryDirectory() as tmpdir:
-            for k, v in identifier_ts.items():
-                v.to_parquet(os.path.join(tmpdir, f"{k}.parquet"))
-            _process_identifier_ts([datetime.timedelta(days=20), None], dt_column, True, tmpdir)
-            for k in list(identifier_ts.keys()):
-                identifier_ts[k] = pd.read_parquet(os.path.join(tmpdir, f"{k}.parquet"))
+            identifier_ts = _process_identifier_ts(identifier_ts, [datetime.timedelta(days=20), None], dt_column, True, tmpdir)
             test_df = pd.DataFrame(data={
                 "/kicks_transform_none_count_20days": [None, 1.0, 2.0],
                 "/kicks_transform_none_count_all": [None, 1.0, 2.0],
@@ -141,11 +135,7 @@ class TestTimeseriesProcess(unittest.TestCase):
             })
         }
         with tempfile.TemporaryDirectory() as tmpdir:
-            for k, v in identifier_ts.items():
-                v.to_parquet(os.path.join(tmpdir, f"{k}.parquet"))
-            _process_identifier_ts([datetime.timedelta(days=20), None], dt_column, True, tmpdir)
-            for k in list(identifier_ts.keys()):
-                identifier_ts[k] = pd.read_parquet(os.path.join(tmpdir, f"{k}.parquet"))
+            identifier_ts = _process_identifier_ts(identifier_ts, [datetime.timedelta(days=20), None], dt_column, True, tmpdir)
             print(identifier_ts)
 
     def test_all_nan_in_timeseries_process(self):
@@ -165,9 +155,268 @@ class TestTimeseriesProcess(unittest.TestCase):
             })
         }
         with tempfile.TemporaryDirectory() as tmpdir:
-            for k, v in identifier_ts.items():
-                v.to_parquet(os.path.join(tmpdir, f"{k}.parquet"))
-            _process_identifier_ts([datetime.timedelta(days=20), None], dt_column, True, tmpdir)
-            for k in list(identifier_ts.keys()):
-                identifier_ts[k] = pd.read_parquet(os.path.join(tmpdir, f"{k}.parquet"))
+            identifier_ts = _process_identifier_ts(identifier_ts, [datetime.timedelta(days=20), None], dt_column, True, tmpdir)
             print(identifier_ts)
+
+    def test_timeseries_process_incremental(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1"] * 6,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/1/id": ["1", "0"] * 6,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3)]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False)
+        state = FeatureState()
+        head_df = timeseries_process(df.iloc[:9].copy(), identifiers, windows, dt_column, False, state=state)
+        tail_df = timeseries_process(df.iloc[9:].reset_index(drop=True), identifiers, windows, dt_column, False, state=state)
+        for history_df in state.identifier_ts:
+            self.assertLessEqual(len(history_df), 8)
+        incremental_df = pd.concat([head_df, tail_df], ignore_index=True)
+        assert_frame_equal(incremental_df[expected_df.columns], expected_df)
+
+    def test_timeseries_process_incremental_all_window(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 25)],
+            "teams/0/id": ["0", "1", "2"] * 8,
+            "teams/0/kicks": [float(x % 7) for x in range(24)],
+            "teams/0/goals": [None, 1.0, 2.0] * 8,
+            "teams/1/id": ["1", "2", "0"] * 8,
+            "teams/1/kicks": [float(x * x) for x in range(24)],
+            "teams/1/goals": [3.0, None, float("nan")] * 8,
+        })
+        identifiers = [
+            Identifier(
+                EntityType.TEAM,
+                "teams/0/id",
+                ["teams/0/kicks", "teams/0/goals"],
+                "teams/0",
+                timeseries_specs={"teams/0/goals": TimeseriesSpec(windows=[None], aggregations=["mean", "median", "rank"])},
+            ),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks", "teams/1/goals"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3), None]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False)
+        self.assertIn("teams/0/kicks_transform_none_kurt_all", expected_df.columns)
+        for backend in TimeseriesBackend:
+            state = FeatureState()
+            incremental_dfs = [
+                timeseries_process(df.iloc[x:y].reset_index(drop=True), identifiers, windows, dt_column, False, state=state, backend=backend)
+                for x, y in [(0, 10), (10, 11), (11, 24)]
+            ]
+            # The all-time window is carried in the state rather than the history.
+            for history_df in state.identifier_ts:
+                self.assertLessEqual(len(history_df), 8)
+            incremental_df = pd.concat(incremental_dfs, ignore_index=True)
+            self.assertEqual(sorted(incremental_df.columns), sorted(expected_df.columns))
+            assert_frame_equal(incremental_df[expected_df.columns], expected_df)
+
+    def test_timeseries_process_memory_backend(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1", "2"] * 4,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/0/goals": [None, 1.0, None] * 4,
+            "teams/1/id": ["1", "2", None] * 4,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks", "teams/0/goals"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3), None]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False)
+        memory_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False, backend=TimeseriesBackend.MEMORY)
+        self.assertEqual(sorted(memory_df.columns), sorted(expected_df.columns))
+        assert_frame_equal(memory_df[expected_df.columns], expected_df)
+
+    def test_write_ts_features(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 4)]})
+        identifier_dfs = [
+            pd.DataFrame(data={
+                _COLUMN_PREFIX_COLUMN: ["teams/0", "teams/0", "teams/1"],
+                "/kicks_lag_1": [5.0, None, 1.0],
+            }, index=[-1, 0, 2]),
+            pd.DataFrame(data={
+                _COLUMN_PREFIX_COLUMN: ["teams/1", "teams/0"],
+                "/goals_lag_1": [None, 3.0],
+            }, index=[0, 2]),
+        ]
+        block = _write_ts_features(df, dt_column, identifier_dfs)
+        expected_block = pd.DataFrame(data={
+            "teams/0/goals_lag_1": [None, None, 3.0],
+            "teams/0/kicks_lag_1": [None, None, None],
+            "teams/1/goals_lag_1": [None, None, None],
+            "teams/1/kicks_lag_1": [None, None, 1.0],
+        }, dtype=float)
+        assert_frame_equal(block, expected_block)
+
+    def test_timeseries_process_batches(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1", "2"] * 4,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/0/goals": [None, 1.0, None] * 4,
+            "teams/1/id": ["1", "2", None] * 4,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks", "teams/0/goals"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3), None]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False)
+        batched_df = timeseries_process(df.copy(), identifiers, windows, dt_column, True, batch_rows=5, n_jobs=2)
+        self.assertEqual(sorted(batched_df.columns), sorted(expected_df.columns))
+        assert_frame_equal(batched_df[expected_df.columns], expected_df)
+
+    def test_timeseries_process_cache(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1", "2"] * 4,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/1/id": ["1", "2", "3"] * 4,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3), None]
+        appended_df = pd.concat([df, pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, 13)],
+            "teams/0/id": ["0"],
+            "teams/0/kicks": [12.0],
+            "teams/1/id": ["3"],
+            "teams/1/kicks": [144.0],
+        })], ignore_index=True)
+        expected_df = timeseries_process(appended_df.copy(), identifiers, windows, dt_column, False)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = TimeseriesCache(folder=tmpdir)
+            timeseries_process(df.copy(), identifiers, windows, dt_column, False, cache=cache)
+            process_identifier_ts = timeseries_process_module._process_identifier_ts
+            with mock.patch.object(timeseries_process_module, "_process_identifier_ts", wraps=process_identifier_ts) as process_mock:
+                cached_df = timeseries_process(appended_df.copy(), identifiers, windows, dt_column, False, cache=cache)
+            self.assertEqual(sorted(process_mock.call_args.args[0]), ["team_0", "team_3"])
+        self.assertEqual(sorted(cached_df.columns), sorted(expected_df.columns))
+        assert_frame_equal(cached_df[expected_df.columns], expected_df)
+
+    def test_timeseries_process_memory_cache(self):
+        df = pd.DataFrame(data={
+            "dt": [datetime.datetime(2022, 1, 1)],
+            "teams/0/id": ["0"],
+            "teams/0/kicks": [1.0],
+        })
+        identifiers = [Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks"], "teams/0")]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(ValueError):
+                timeseries_process(df, identifiers, [None], "dt", False, backend=TimeseriesBackend.MEMORY, cache=TimeseriesCache(folder=tmpdir))
+
+    def test_timeseries_process_spec(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1", "2"] * 4,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/0/goals": [float(x % 3) for x in range(12)],
+            "teams/1/id": ["1", "2", "0"] * 4,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+            "teams/1/goals": [float(x % 5) for x in range(12)],
+        })
+        windows = [datetime.timedelta(days=3), None]
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks", "teams/0/goals"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks", "teams/1/goals"], "teams/1"),
+        ]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False)
+        spec_identifiers = [
+            Identifier(
+                EntityType.TEAM,
+                "teams/0/id",
+                ["teams/0/kicks", "teams/0/goals"],
+                "teams/0",
+                timeseries_spec=TimeseriesSpec(lags=[1], windows=[], aggregations=[]),
+                timeseries_specs={"teams/0/kicks": TimeseriesSpec(lags=[], windows=[None], aggregations=["mean", "max"])},
+            ),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks", "teams/1/goals"], "teams/1"),
+        ]
+        team_0_columns = [
+            "teams/0/goals_transform_none_lag_1",
+            "teams/0/kicks_transform_none_max_all",
+            "teams/0/kicks_transform_none_mean_all",
+        ]
+        team_1_columns = [x for x in expected_df.columns if x.startswith("teams/1/") and x not in df.columns]
+        for backend in TimeseriesBackend:
+            spec_df = timeseries_process(df.copy(), spec_identifiers, windows, dt_column, False, backend=backend)
+            feature_columns = [x for x in spec_df.columns if x not in df.columns]
+            self.assertEqual(sorted(feature_columns), sorted(team_0_columns + team_1_columns))
+            assert_frame_equal(spec_df[feature_columns], expected_df[feature_columns])
+
+    def test_timeseries_spec_aggregations(self):
+        with self.assertRaises(ValueError):
+            TimeseriesSpec(aggregations=["mode"])
+
+    def test_timeseries_halflives_named_apart(self):
+        # The half-life columns are named by whole days, so anything else would collide.
+        with self.assertRaises(ValueError):
+            TimeseriesSpec(halflives=[datetime.timedelta(hours=12)])
+        with self.assertRaises(ValueError):
+            TimeseriesSpec(halflives=[datetime.timedelta(days=5), datetime.timedelta(days=5)])
+        df = pd.DataFrame(data={
+            "dt": [datetime.datetime(2022, 1, 1)],
+            "teams/0/id": ["0"],
+            "teams/0/kicks": [1.0],
+        })
+        identifiers = [Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks"], "teams/0")]
+        with self.assertRaises(ValueError):
+            timeseries_process(df, identifiers, [], "dt", False, halflives=[datetime.timedelta(days=5, hours=6)])
+
+    def test_timeseries_process_halflives(self):
+        dt_column = "dt"
+        df = pd.DataFrame(data={
+            dt_column: [datetime.datetime(2022, 1, x) for x in range(1, 13)],
+            "teams/0/id": ["0", "1"] * 6,
+            "teams/0/kicks": [float(x) for x in range(12)],
+            "teams/1/id": ["1", "0"] * 6,
+            "teams/1/kicks": [float(x * x) for x in range(12)],
+        })
+        identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", ["teams/0/kicks"], "teams/0"),
+            Identifier(EntityType.TEAM, "teams/1/id", ["teams/1/kicks"], "teams/1"),
+        ]
+        windows = [datetime.timedelta(days=3)]
+        halflives = [datetime.timedelta(days=5)]
+        expected_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False, halflives=halflives)
+        ewm_columns = [x for x in expected_df.columns if "_ewm" in x]
+        self.assertEqual(sorted(ewm_columns), [
+            "teams/0/kicks_transform_none_ewmmean_5days",
+            "teams/0/kicks_transform_none_ewmvar_5days",
+            "teams/1/kicks_transform_none_ewmmean_5days",
+            "teams/1/kicks_transform_none_ewmvar_5days",
+        ])
+        kicks = df["teams/0/kicks"].copy()
+        kicks[1::2] = df["teams/1/kicks"][1::2]
+        expected_means = kicks.ewm(halflife=halflives[0], times=df[dt_column]).mean().shift(1)
+        assert_frame_equal(
+            expected_df.loc[0::2, ["teams/0/kicks_transform_none_ewmmean_5days"]].reset_index(drop=True),
+            pd.DataFrame({"teams/0/kicks_transform_none_ewmmean_5days": expected_means[0::2].to_numpy()}),
+            check_names=False,
+        )
+        memory_df = timeseries_process(df.copy(), identifiers, windows, dt_column, False, backend=TimeseriesBackend.MEMORY, halflives=halflives)
+        assert_frame_equal(memory_df[expected_df.columns], expected_df)
+        state = FeatureState()
+        head_df = timeseries_process(df.iloc[:9].copy(), identifiers, windows, dt_column, False, state=state, halflives=halflives)
+        tail_df = timeseries_process(df.iloc[9:].reset_index(drop=True), identifiers, windows, dt_column, False, state=state, halflives=halflives)
+        incremental_df = pd.concat([head_df, tail_df], ignore_index=True)
+        assert_frame_equal(incremental_df[expected_df.columns], expected_df)
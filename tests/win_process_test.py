@@ -0,0 +1,45 @@
+"""Tests for the win process function."""
+import datetime
+import unittest
+
+import pandas as pd
+
+from sportsfeatures.entity_type import EntityType
+from sportsfeatures.feature_state import FeatureState
+from sportsfeatures.identifier import Identifier
+from sportsfeatures.win_process import win_block, win_identifiers, win_process
+
+
+class TestWinProcess(unittest.TestCase):
+
+    def setUp(self):
+        self.df = pd.DataFrame(data={
+            "dt": [datetime.datetime(2022, 1, x) for x in range(1, 7)],
+            "teams/0/id": ["0", "1"] * 3,
+            "teams/0/points": [10.0, 20.0, 30.0, 10.0, 5.0, 30.0],
+            "teams/1/id": ["1", "0"] * 3,
+            "teams/1/points": [20.0, 40.0, 10.0, 15.0, 1.0, 10.0],
+        })
+        self.identifiers = [
+            Identifier(EntityType.TEAM, "teams/0/id", [], "teams/0", points_column="teams/0/points"),
+            Identifier(EntityType.TEAM, "teams/1/id", [], "teams/1", points_column="teams/1/points"),
+        ]
+
+    def test_win_process_incremental(self):
+        expected_df = win_process(self.df.copy(), self.identifiers)
+        state = FeatureState()
+        head_df = win_process(self.df.iloc[:3].copy(), self.identifiers, state=state)
+        tail_df = win_process(self.df.iloc[3:].reset_index(drop=True), self.identifiers, state=state)
+        incremental_df = pd.concat([head_df, tail_df], ignore_index=True)
+        pd.testing.assert_frame_equal(incremental_df[expected_df.columns], expected_df)
+        # The wins columns become feature columns once, however many calls add them.
+        self.assertEqual(self.identifiers[0].feature_columns, ["teams/0_wins"])
+        self.assertEqual(self.identifiers[1].feature_columns, ["teams/1_wins"])
+
+    def test_win_block_keeps_identifiers(self):
+        win_block(self.df, self.identifiers)
+        self.assertEqual(self.identifiers[0].feature_columns, [])
+        feature_identifiers = win_identifiers(self.identifiers)
+        self.assertEqual(feature_identifiers[0].feature_columns, ["teams/0_wins"])
+        self.assertEqual(self.identifiers[0].feature_columns, [])
+        self.assertEqual(win_identifiers(feature_identifiers)[1].feature_columns, ["teams/1_wins"])